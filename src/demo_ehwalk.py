@@ -14,6 +14,7 @@ from netorch.models.walkbased import Triplet, DeepWalk
 from netorch.lookup import HeteroGraphLookup, GraphLookup
 from netorch.models.walkbased.sampling import TripletSampling
 from netorch.models.common import TripletNodeEmbedding
+from netorch.search import top_k
 from hetero.heterowalk import hetero_walk, hetero_walker
 
 DATASET_DOWNLOAD_LINK = 'https://pan.baidu.com/s/1EFVu1aanox4rUc83iSnAjA'
@@ -112,27 +113,38 @@ def make_embedding_edges(tag, embedding, lookup, graph, min_degree):
     emb = np.ndarray((len(embedding), EMBEDDING_DIM))
     for i in range(emb.shape[0]):
         emb[i,:] = embedding[lookup.t_index_to_g_index(tag, i)]
-    dot_prod = np.matmul(emb, np.transpose(emb))
-    dot_prod = sigmoid(dot_prod)
-    for node in subnetwork.nodes:
-        if subnetwork.degree(node) > min_degree:
-            for neibor in subnetwork.neighbors(node):
-                val = dot_prod[lookup.label_to_t_index(node)][lookup.label_to_t_index(node)]
-                if val > 0.5:
-                    graph[node][neibor]['weight'] = val
-                else:
-                    graph.remove_edge(node, neibor)
-        else:
-            t_index = lookup.label_to_t_index(node)
-            k_th_max = np.partition(dot_prod[t_index], min_degree)[min_degree]
-            for i, val in enumerate(dot_prod[t_index]):
-                if val > k_th_max:
-                    neibor = lookup.t_index_to_label(tag, i)
-                    if graph.has_edge(node, neibor):
-                        graph[node][neibor]['weight'] = val
-                    else:
-                        graph.add_edge(node, neibor, weight=val)
 
+    # subnetwork views graph, so split the nodes before editing edges
+    high_nodes = [node for node in subnetwork.nodes if subnetwork.degree(node) > min_degree]
+    low_nodes = [node for node in subnetwork.nodes if subnetwork.degree(node) <= min_degree]
+
+    # existing edges of high degree nodes are kept and reweighted when their
+    # endpoints are similar enough
+    edges = [(node, neibor) for node in high_nodes for neibor in subnetwork.neighbors(node)]
+    u = np.array([lookup.label_to_t_index(node) for node, neibor in edges], dtype=np.int64)
+    v = np.array([lookup.label_to_t_index(neibor) for node, neibor in edges], dtype=np.int64)
+    vals = sigmoid(np.einsum('ij,ij->i', emb[u], emb[v])) if edges else []
+    for (node, neibor), val in zip(edges, vals):
+        if val > 0.5:
+            graph[node][neibor]['weight'] = val
+        elif graph.has_edge(node, neibor):
+            graph.remove_edge(node, neibor)
+
+    # low degree nodes are linked to their min_degree most similar nodes
+    if not low_nodes:
+        return
+    t_indices = np.array([lookup.label_to_t_index(node) for node in low_nodes], dtype=np.int64)
+    # one extra candidate since a node usually finds itself first
+    neighbors, scores = top_k(emb[t_indices], emb, min_degree+1, metric='dot')
+    for node, t_index, row, row_scores in zip(low_nodes, t_indices, neighbors, sigmoid(scores)):
+        row_scores = row_scores[(row>=0)&(row!=t_index)][:min_degree]
+        row = row[(row>=0)&(row!=t_index)][:min_degree]
+        for i, val in zip(row, row_scores):
+            neibor = lookup.t_index_to_label(tag, i)
+            if graph.has_edge(node, neibor):
+                graph[node][neibor]['weight'] = val
+            else:
+                graph.add_edge(node, neibor, weight=val)
 
 
 
@@ -2,141 +2,209 @@
 
 #include <vector>
 #include <unordered_map>
+#include <algorithm>
+#include <functional>
+#include <thread>
+
+#include "parallel.hpp"
 
 namespace network_embedding {
 
 using std::size_t;
 using std::vector;
 using std::unordered_map;
+using std::function;
+
+// Lays `value` on both directions of edge (u, v), once for a self-loop. Steps
+// that are not edges, such as a walk staying on a node without neighbors,
+// get nothing.
+static inline void AddPheromone(const CSRGraph & graph, const Node & u, const Node & v, double value, double * pheromone) {
+    size_t index = graph.edge_index(u, v);
+    if (index == CSRGraph::npos)
+        return;
+    pheromone[index] += value;
+    if (u != v)
+        pheromone[graph.edge_index(v, u)] += value;
+}
 
-static void CalculateLoopPheromone(
-        const vector<NodeList> & sequences,
-        size_t max_step,
-        size_t num_threads,
-        Graph & pheromone) {
-    for (const auto & sequence : sequences) {
-        for (size_t i = 0; i < sequence.size(); i++) {
-            for (size_t len = 1; len < max_step && i+len < sequence.size(); len++) {
-                if (sequence[i] == sequence[i+len]) {
-                    for (size_t k = i; k < i+len; k++) {
-                        const Node & u = sequence[k];
-                        const Node & v = sequence[k+1];
-                        pheromone.SetEdgeWeight(u, v, pheromone.weight(u, v) + 1.0/len);
-                    }
-                    break;
+// Pheromone left by one walk: every loop closing within max_step steps
+// lays 1/length on each of its edges.
+static void LoopPheromone(const CSRGraph & graph, const Node * walk, size_t length, size_t max_step, double * pheromone) {
+    for (size_t i = 0; i < length; i++) {
+        for (size_t len = 1; len < max_step && i+len < length; len++) {
+            if (walk[i] == walk[i+len]) {
+                for (size_t k = i; k < i+len; k++) {
+                    AddPheromone(graph, walk[k], walk[k+1], 1.0/len, pheromone);
                 }
+                break;
             }
         }
     }
 }
 
-static void CalculatePheromoneWithLabel(
-        const vector<NodeList> & sequences,
-        const unordered_map<Node, vector<int>> labels,
-        size_t max_step,
-        size_t num_threads,
-        Graph & pheromone) {
-    for (const auto & sequence : sequences) {
-        for (size_t i = 0; i < sequence.size(); i++) {
-            for (size_t len = 1; len < max_step && i+len < sequence.size(); len++) {
-                if (labels.find(sequence[i+len]) != labels.end()) {
-                    for (size_t k = i; k < i+len; k++) {
-                        const Node & u = sequence[k];
-                        const Node & v = sequence[k+1];
-                        pheromone.SetEdgeWeight(u, v, pheromone.weight(u, v) + 1.0/len);
-                    }
-                    break;
+// Same, with the path towards the first labeled node within max_step steps.
+static void LabelPheromone(const CSRGraph & graph, const unordered_map<Node, vector<int>> & labels, const Node * walk, size_t length, size_t max_step, double * pheromone) {
+    for (size_t i = 0; i < length; i++) {
+        for (size_t len = 1; len < max_step && i+len < length; len++) {
+            if (labels.find(walk[i+len]) != labels.end()) {
+                for (size_t k = i; k < i+len; k++) {
+                    AddPheromone(graph, walk[k], walk[k+1], 1.0/len, pheromone);
                 }
+                break;
             }
         }
     }
 }
 
-Graph ACOWalk(
-        const Graph & graph,
+// Upper bound on the doubles held by the per-thread pheromone arrays.
+static const size_t kMaxPartialPheromone = size_t(1) << 25;
+
+// Runs deposit(walk, pheromone) over the rows of a (num_walks, width) walk
+// array, each thread over its own range of walks into its own edge-indexed
+// array, then sums the per-thread arrays into `pheromone` in parallel over
+// edge ranges. The thread count is capped so those arrays stay within
+// kMaxPartialPheromone doubles.
+static void AccumulatePheromone(
+        const vector<Node> & walks,
+        size_t width,
+        size_t num_threads,
+        vector<double> & pheromone,
+        const function<void(const Node *, double *)> & deposit) {
+    size_t num_walks = width == 0 ? 0 : walks.size()/width;
+    size_t num_edges = pheromone.size();
+    num_threads = std::min(num_threads, num_walks);
+    num_threads = std::min(num_threads, kMaxPartialPheromone/std::max<size_t>(num_edges, 1));
+    num_threads = std::max<size_t>(1, num_threads);
+    vector<vector<double>> partial(num_threads);
+
+    vector<std::thread> threads;
+    for (size_t t = 0; t < num_threads; t++) {
+        threads.push_back(std::thread([&, t]() {
+            partial[t].assign(num_edges, 0.0);
+            size_t first = num_walks*t/num_threads, last = num_walks*(t+1)/num_threads;
+            for (size_t w = first; w < last; w++)
+                deposit(walks.data() + w*width, partial[t].data());
+        }));
+    }
+    for (auto & thread : threads)
+        thread.join();
+
+    ParallelFor(num_edges, num_threads, [&](size_t start_idx, size_t end_idx) {
+        for (size_t e = start_idx; e < end_idx; e++) {
+            double sum = 0.0;
+            for (const auto & part : partial)
+                sum += part[e];
+            pheromone[e] = sum;
+        }
+    });
+}
+
+// Walks with the transition tables of `walker` reweighted to `weights`.
+static void WalkInto(AliasWalker & walker, const vector<double> & weights, size_t num_walks, size_t walk_length, size_t num_threads, vector<Node> & walks) {
+    walker.SetEdgeWeights(weights.data(), weights.size(), num_threads);
+    walks.resize(walker.get_node_list().size()*num_walks*(walk_length+1));
+    walker.Walk(num_walks, walk_length, num_threads, walks.data());
+}
+
+CSRGraph ACOWalk(
+        const CSRGraph & graph,
         size_t num_walks,
         size_t max_step,
+        size_t walk_length,
         size_t num_iterations,
         double alpha,
         double evaporate,
         size_t num_threads) {
-    Graph g(graph);
-    Graph pheromone(graph);
-    Graph total_pheromone(graph);
-    Graph mixed(graph);
+    const vector<double> & weights = graph.edge_weights();
+    size_t num_edges = graph.number_of_directed_edges();
 
-    for (const auto & edge : g.edges()) {
-        total_pheromone.SetEdgeWeight(edge, 0.0);
-    }
+    vector<double> pheromone(num_edges, 0.0);
+    vector<double> total_pheromone(num_edges, 0.0);
+    vector<double> mixed(weights);
+    vector<Node> walks;
+    AliasWalker walker;
+    walker.InitDistributionsFromGraph(graph, true);
 
     for (size_t i = 0; i < num_iterations; i++) {
-        Walker walker;
-        walker.InitDistributionsFromGraph(mixed, true);
-        auto sequences = walker.Walk(num_walks, 80, num_threads);
-
-        for (const auto & edge : g.edges()) {
-            pheromone.SetEdgeWeight(edge, 0.0);
-        }
+        WalkInto(walker, mixed, num_walks, walk_length, num_threads, walks);
 
-        CalculateLoopPheromone(sequences, max_step, num_threads, pheromone);
+        AccumulatePheromone(walks, walk_length+1, num_threads, pheromone, [&](const Node * walk, double * out) {
+            LoopPheromone(graph, walk, walk_length+1, max_step, out);
+        });
 
-        for (const auto & edge : g.edges()) {
-            total_pheromone.SetEdgeWeight(edge, total_pheromone.weight(edge) * (1.0-evaporate) + pheromone.weight(edge));
-        }
-
-        for (const auto & edge : g.edges()) {
-            mixed.SetEdgeWeight(edge, g.weight(edge) * pow(total_pheromone.weight(edge), alpha));
+        for (size_t e = 0; e < num_edges; e++) {
+            total_pheromone[e] = total_pheromone[e] * (1.0-evaporate) + pheromone[e];
+            mixed[e] = weights[e] * pow(total_pheromone[e], alpha);
         }
     }
 
-    for (const auto & edge : g.edges()) {
-        total_pheromone.SetEdgeWeight(edge, pow(total_pheromone.weight(edge), alpha));
+    for (size_t e = 0; e < num_edges; e++) {
+        total_pheromone[e] = pow(total_pheromone[e], alpha);
     }
 
-    return total_pheromone;
+    return CSRGraph(graph, total_pheromone);
 }
 
-Graph ACOWalkWithLabel(
-        const Graph & graph,
+CSRGraph ACOWalkWithLabel(
+        const CSRGraph & graph,
         const unordered_map<Node, vector<int>> labels,
         size_t num_walks,
         size_t max_step,
+        size_t walk_length,
         size_t num_iterations,
         double alpha,
         double evaporate,
         size_t num_threads) {
+    const vector<double> & weights = graph.edge_weights();
+    size_t num_edges = graph.number_of_directed_edges();
 
-    Graph g(graph);
-    Graph pheromone(graph);
-    Graph total_pheromone(graph);
-    Graph mixed(graph);
-
-    for (const auto & edge : g.edges()) {
-        total_pheromone.SetEdgeWeight(edge, 0.0);
-    }
+    vector<double> pheromone(num_edges, 0.0);
+    vector<double> total_pheromone(num_edges, 0.0);
+    vector<double> mixed(weights);
+    vector<Node> walks;
+    AliasWalker walker;
+    walker.InitDistributionsFromGraph(graph, true);
 
     for (size_t i = 0; i < num_iterations; i++) {
-        Walker walker;
-        walker.InitDistributionsFromGraph(mixed, true);
-        auto sequences = walker.Walk(num_walks, 80, num_threads);
+        WalkInto(walker, mixed, num_walks, walk_length, num_threads, walks);
 
-        for (const auto & edge : g.edges()) {
-            pheromone.SetEdgeWeight(edge, 0.0);
-        }
-
-        CalculateLoopPheromone(sequences, max_step, num_threads, pheromone);
-        CalculatePheromoneWithLabel(sequences, labels, max_step, num_threads, pheromone);
-
-        for (const auto & edge : g.edges()) {
-            total_pheromone.SetEdgeWeight(edge, total_pheromone.weight(edge) * (1.0-evaporate) + pheromone.weight(edge));
-        }
+        AccumulatePheromone(walks, walk_length+1, num_threads, pheromone, [&](const Node * walk, double * out) {
+            LoopPheromone(graph, walk, walk_length+1, max_step, out);
+            LabelPheromone(graph, labels, walk, walk_length+1, max_step, out);
+        });
 
-        for (const auto & edge : g.edges()) {
-            mixed.SetEdgeWeight(edge, g.weight(edge) * pow(total_pheromone.weight(edge), alpha));
+        for (size_t e = 0; e < num_edges; e++) {
+            total_pheromone[e] = total_pheromone[e] * (1.0-evaporate) + pheromone[e];
+            mixed[e] = weights[e] * pow(total_pheromone[e], alpha);
         }
     }
 
-    return total_pheromone;
+    return CSRGraph(graph, total_pheromone);
+}
+
+Graph ACOWalk(
+        const Graph & graph,
+        size_t num_walks,
+        size_t max_step,
+        size_t walk_length,
+        size_t num_iterations,
+        double alpha,
+        double evaporate,
+        size_t num_threads) {
+    return ACOWalk(CSRGraph(graph), num_walks, max_step, walk_length, num_iterations, alpha, evaporate, num_threads).ToGraph();
+}
+
+Graph ACOWalkWithLabel(
+        const Graph & graph,
+        const unordered_map<Node, vector<int>> labels,
+        size_t num_walks,
+        size_t max_step,
+        size_t walk_length,
+        size_t num_iterations,
+        double alpha,
+        double evaporate,
+        size_t num_threads) {
+    return ACOWalkWithLabel(CSRGraph(graph), labels, num_walks, max_step, walk_length, num_iterations, alpha, evaporate, num_threads).ToGraph();
 }
 
 };
@@ -12,10 +12,32 @@
 
 namespace network_embedding {
 
+CSRGraph ACOWalk(
+        const CSRGraph & graph,
+        std::size_t num_walks,
+        std::size_t max_step,
+        std::size_t walk_length,
+        std::size_t num_iterations,
+        double alpha,
+        double evaporate,
+        std::size_t num_threads);
+
+CSRGraph ACOWalkWithLabel(
+        const CSRGraph & graph,
+        const std::unordered_map<Node, std::vector<int>> labels,
+        std::size_t num_walks,
+        std::size_t max_step,
+        std::size_t walk_length,
+        std::size_t num_iterations,
+        double alpha,
+        double evaporate,
+        std::size_t num_threads);
+
 Graph ACOWalk(
         const Graph & graph,
         std::size_t num_walks,
         std::size_t max_step,
+        std::size_t walk_length,
         std::size_t num_iterations,
         double alpha,
         double evaporate,
@@ -26,6 +48,7 @@ Graph ACOWalkWithLabel(
         const std::unordered_map<Node, std::vector<int>> labels,
         std::size_t num_walks,
         std::size_t max_step,
+        std::size_t walk_length,
         std::size_t num_iterations,
         double alpha,
         double evaporate,
@@ -0,0 +1,43 @@
+#include "alias.hpp"
+
+#include <vector>
+
+namespace network_embedding {
+
+using std::size_t;
+using std::vector;
+
+void BuildAliasTable(const double * weights, size_t n, double * probs, int * aliases) {
+    double sum = 0.0;
+    for (size_t i = 0; i < n; i++)
+        sum += weights[i];
+
+    vector<int> small, large;
+    for (size_t i = 0; i < n; i++) {
+        probs[i] = sum > 0 ? weights[i]*n/sum : 1.0;
+        aliases[i] = i;
+        if (probs[i] < 1.0)
+            small.push_back(i);
+        else
+            large.push_back(i);
+    }
+
+    while (!small.empty() && !large.empty()) {
+        int s = small.back(), l = large.back();
+        small.pop_back();
+        aliases[s] = l;
+        probs[l] -= 1.0-probs[s];
+        if (probs[l] < 1.0) {
+            large.pop_back();
+            small.push_back(l);
+        }
+    }
+
+    // leftovers are only off by rounding error
+    for (const auto & i : small)
+        probs[i] = 1.0;
+    for (const auto & i : large)
+        probs[i] = 1.0;
+}
+
+};  // namespace network_embedding
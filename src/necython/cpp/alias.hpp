@@ -0,0 +1,26 @@
+#include <vector>
+#include <random>
+
+#ifndef NETWORK_EMBEDDING_ALIAS_H
+#define NETWORK_EMBEDDING_ALIAS_H
+
+namespace network_embedding {
+
+// Builds Walker's alias table for weights[0..n) in place: probs[i] is the
+// probability of keeping slot i, aliases[i] the slot taken otherwise.
+void BuildAliasTable(const double * weights, std::size_t n, double * probs, int * aliases);
+
+// Draws a slot from an alias table with a single uniform variate: its
+// integer part picks the slot and its fractional part the coin flip.
+template <typename Generator>
+inline std::size_t SampleAlias(const double * probs, const int * aliases, std::size_t n, Generator & generator) {
+    double r = std::uniform_real_distribution<double>(0.0, static_cast<double>(n))(generator);
+    std::size_t k = static_cast<std::size_t>(r);
+    if (k >= n)
+        k = n-1;
+    return r-k < probs[k] ? k : aliases[k];
+}
+
+}; // namespace network_embedding
+
+#endif // NETWORK_EMBEDDING_ALIAS_H
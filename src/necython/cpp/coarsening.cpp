@@ -0,0 +1,115 @@
+#include "coarsening.hpp"
+
+#include <algorithm>
+#include <numeric>
+#include <random>
+#include <stdexcept>
+
+namespace network_embedding {
+
+using std::size_t;
+using std::vector;
+using std::mt19937_64;
+using std::shuffle;
+
+size_t CollapseEdgesAndStars(const CSRGraph & graph, size_t num_nodes, std::uint64_t seed, Node * assignment) {
+    const vector<size_t> & offsets = graph.offsets();
+    const NodeList & targets = graph.targets();
+    if (offsets.size() > num_nodes+1)
+        throw std::invalid_argument("graph has more nodes than the assignment");
+
+    mt19937_64 rng(seed);
+    const Node unassigned = -1;
+    std::fill(assignment, assignment + num_nodes, unassigned);
+    Node num_super_nodes = 0;
+
+    // edge collapsing, every undirected edge once as (u, v) with u < v
+    vector<size_t> edges;
+    edges.reserve(targets.size()/2);
+    for (size_t u = 0; u+1 < offsets.size(); u++) {
+        for (size_t i = offsets[u]; i < offsets[u+1]; i++) {
+            if (static_cast<Node>(u) < targets[i])
+                edges.push_back(i);
+        }
+    }
+    // source node of every directed edge, recovered through offsets
+    vector<Node> sources(targets.size());
+    for (size_t u = 0; u+1 < offsets.size(); u++)
+        std::fill(sources.begin() + offsets[u], sources.begin() + offsets[u+1], static_cast<Node>(u));
+    shuffle(edges.begin(), edges.end(), rng);
+    for (const auto & i : edges) {
+        Node u = sources[i], v = targets[i];
+        if (assignment[u] != unassigned || assignment[v] != unassigned)
+            continue;
+        assignment[u] = assignment[v] = num_super_nodes++;
+    }
+    vector<Node>().swap(sources);
+    vector<size_t>().swap(edges);
+
+    // star collapsing, pairing the first half of the free neighbors with the second
+    NodeList nodes(offsets.size()-1);
+    std::iota(nodes.begin(), nodes.end(), 0);
+    shuffle(nodes.begin(), nodes.end(), rng);
+    NodeList star;
+    for (const auto & node : nodes) {
+        star.clear();
+        for (size_t i = offsets[node]; i < offsets[node+1]; i++) {
+            if (assignment[targets[i]] == unassigned && targets[i] != node)
+                star.push_back(targets[i]);
+        }
+        shuffle(star.begin(), star.end(), rng);
+        size_t half = star.size()/2;
+        for (size_t i = 0; i < half; i++)
+            assignment[star[i]] = assignment[star[half+i]] = num_super_nodes++;
+    }
+
+    for (size_t u = 0; u < num_nodes; u++) {
+        if (assignment[u] == unassigned)
+            assignment[u] = num_super_nodes++;
+    }
+    return num_super_nodes;
+}
+
+Node FindRoot(Node * parent, Node u) {
+    Node root = u;
+    while (parent[root] != root)
+        root = parent[root];
+    while (parent[u] != root) {
+        Node next = parent[u];
+        parent[u] = root;
+        u = next;
+    }
+    return root;
+}
+
+size_t UnionEdges(Node * parent, std::uint8_t * rank, const Node * u, const Node * v, size_t num_edges) {
+    size_t num_unions = 0;
+    for (size_t i = 0; i < num_edges; i++) {
+        Node u_root = FindRoot(parent, u[i]);
+        Node v_root = FindRoot(parent, v[i]);
+        if (u_root == v_root)
+            continue;
+        if (rank[u_root] < rank[v_root])
+            std::swap(u_root, v_root);
+        parent[v_root] = u_root;
+        if (rank[u_root] == rank[v_root])
+            rank[u_root]++;
+        num_unions++;
+    }
+    return num_unions;
+}
+
+size_t ComponentLabels(Node * parent, size_t num_nodes, Node * labels) {
+    const Node unassigned = -1;
+    vector<Node> root_label(num_nodes, unassigned);
+    Node num_components = 0;
+    for (size_t u = 0; u < num_nodes; u++) {
+        Node root = FindRoot(parent, u);
+        if (root_label[root] == unassigned)
+            root_label[root] = num_components++;
+        labels[u] = root_label[root];
+    }
+    return num_components;
+}
+
+};
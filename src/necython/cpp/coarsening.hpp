@@ -0,0 +1,31 @@
+#include <vector>
+#include <cstdint>
+
+#include "graph.hpp"
+
+#ifndef NETWORK_EMBEDDING_COARSENING_H
+#define NETWORK_EMBEDDING_COARSENING_H
+
+namespace network_embedding {
+
+// HARP matching pass: edge collapsing over a random order of the edges,
+// then star collapsing pairs up the unmatched neighbors of every node in a
+// random order. Writes the super node id of nodes [0, num_nodes) into
+// `assignment`, numbering pairs first and left over nodes after them, and
+// returns the number of super nodes. The same seed gives the same result.
+std::size_t CollapseEdgesAndStars(const CSRGraph & graph, std::size_t num_nodes, std::uint64_t seed, Node * assignment);
+
+// Union-find over caller owned arrays, parent[u] starting as u and rank[u]
+// as 0. FindRoot compresses paths iteratively, so long chains are safe.
+Node FindRoot(Node * parent, Node u);
+
+// Union by rank of every (u[i], v[i]); returns the number of merges done.
+std::size_t UnionEdges(Node * parent, std::uint8_t * rank, const Node * u, const Node * v, std::size_t num_edges);
+
+// Component id of nodes [0, num_nodes), numbered by their smallest node;
+// returns the number of components.
+std::size_t ComponentLabels(Node * parent, std::size_t num_nodes, Node * labels);
+
+};
+
+#endif // NETWORK_EMBEDDING_COARSENING_H
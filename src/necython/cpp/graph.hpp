@@ -3,6 +3,7 @@
 #include <unordered_set>
 #include <utility>
 #include <algorithm>
+#include <stdexcept>
 
 #ifndef NETWORK_EMBEDDING_GRAPH_H
 #define NETWORK_EMBEDDING_GRAPH_H
@@ -309,12 +310,196 @@ class Graph {
         return adjacency_list_.at(u).size();
     }
 
+    inline bool has_edge(const Node & u, const Node & v) const {
+        return edge_weight_.find({u,v}) != edge_weight_.end();
+    }
+
     private:
     
     AdjacencyList adjacency_list_;
     EdgeWeight edge_weight_;
 }; // class Graph
 
+// Frozen compressed sparse row view of a Graph. Node ids index the offsets
+// array directly, so they are expected to be small non-negative integers.
+// Every undirected edge is stored in both directions; the position of a
+// directed edge in targets()/edge_weights() is its edge index.
+class CSRGraph {
+    public:
+
+    template <typename T>
+    class Range {
+        public:
+
+        Range() : begin_(nullptr), end_(nullptr) {}
+
+        Range(const T * begin, const T * end) : begin_(begin), end_(end) {}
+
+        inline const T * begin() const {
+            return begin_;
+        }
+
+        inline const T * end() const {
+            return end_;
+        }
+
+        inline std::size_t size() const {
+            return end_ - begin_;
+        }
+
+        inline const T & operator[](std::size_t i) const {
+            return begin_[i];
+        }
+
+        private:
+
+        const T * begin_;
+        const T * end_;
+    }; // class CSRGraph::Range
+
+    static const std::size_t npos = static_cast<std::size_t>(-1);
+
+    CSRGraph() : offsets_(1, 0) {}
+
+    explicit CSRGraph(const Graph & graph) {
+        for (const auto & node : graph.nodes())
+            node_list_.push_back(node);
+        std::sort(node_list_.begin(), node_list_.end());
+
+        Node max_node = node_list_.empty() ? -1 : node_list_.back();
+        offsets_.assign(max_node+2, 0);
+        for (const auto & node : node_list_)
+            offsets_[node+1] = graph.degree(node);
+        for (std::size_t i = 1; i < offsets_.size(); i++)
+            offsets_[i] += offsets_[i-1];
+
+        targets_.resize(offsets_.back());
+        weights_.resize(offsets_.back());
+        for (const auto & u : node_list_) {
+            const NodeSet & n_u = graph.neighbors(u);
+            Node * first = targets_.data() + offsets_[u];
+            std::copy(n_u.begin(), n_u.end(), first);
+            std::sort(first, first + n_u.size());
+            for (std::size_t i = offsets_[u]; i < offsets_[u+1]; i++)
+                weights_[i] = graph.weight(u, targets_[i]);
+        }
+    }
+
+    // From symmetric CSR arrays over nodes [0, num_nodes) with sorted targets
+    // per node; nodes without edges are left out of nodes() like above.
+    CSRGraph(std::size_t num_nodes, const std::size_t * offsets, const Node * targets, const double * weights) :
+            offsets_(offsets, offsets + num_nodes + 1),
+            targets_(targets, targets + offsets[num_nodes]),
+            weights_(weights, weights + offsets[num_nodes]) {
+        for (std::size_t u = 0; u < num_nodes; u++) {
+            if (offsets_[u+1] > offsets_[u])
+                node_list_.push_back(u);
+        }
+    }
+
+    // Same topology as `graph`, with `weights` aligned to its edge order.
+    CSRGraph(const CSRGraph & graph, const std::vector<double> & weights) :
+            node_list_(graph.node_list_),
+            offsets_(graph.offsets_),
+            targets_(graph.targets_),
+            weights_(weights) {
+        if (weights_.size() != targets_.size())
+            throw std::invalid_argument("weights do not match the number of directed edges");
+    }
+
+    inline const NodeList & nodes() const {
+        return node_list_;
+    }
+
+    inline Range<Node> neighbors(const Node & u) const {
+        check_node(u);
+        return Range<Node>(targets_.data() + offsets_[u], targets_.data() + offsets_[u+1]);
+    }
+
+    inline Range<double> weights(const Node & u) const {
+        check_node(u);
+        return Range<double>(weights_.data() + offsets_[u], weights_.data() + offsets_[u+1]);
+    }
+
+    inline std::size_t edge_index(const Node & u, const Node & v) const {
+        if (u < 0 || static_cast<std::size_t>(u)+1 >= offsets_.size())
+            return npos;
+        const Node * first = targets_.data() + offsets_[u];
+        const Node * last = targets_.data() + offsets_[u+1];
+        const Node * it = std::lower_bound(first, last, v);
+        if (it == last || *it != v)
+            return npos;
+        return it - targets_.data();
+    }
+
+    inline bool has_edge(const Node & u, const Node & v) const {
+        return edge_index(u, v) != npos;
+    }
+
+    inline double weight(const Node & u, const Node & v) const {
+        std::size_t index = edge_index(u, v);
+        if (index == npos)
+            throw std::out_of_range("edge not found");
+        return weights_[index];
+    }
+
+    inline double weight(const Edge & edge) const {
+        return weight(edge.first, edge.second);
+    }
+
+    inline const std::vector<std::size_t> & offsets() const {
+        return offsets_;
+    }
+
+    inline const NodeList & targets() const {
+        return targets_;
+    }
+
+    inline const std::vector<double> & edge_weights() const {
+        return weights_;
+    }
+
+    inline std::size_t number_of_nodes() const {
+        return node_list_.size();
+    }
+
+    inline std::size_t number_of_edges() const {
+        return targets_.size()/2;
+    }
+
+    inline std::size_t number_of_directed_edges() const {
+        return targets_.size();
+    }
+
+    inline std::size_t degree(const Node & u) const {
+        check_node(u);
+        return offsets_[u+1] - offsets_[u];
+    }
+
+    Graph ToGraph() const {
+        Graph graph;
+        for (const auto & u : node_list_) {
+            for (std::size_t i = offsets_[u]; i < offsets_[u+1]; i++) {
+                if (u < targets_[i])
+                    graph.AddEdge(u, targets_[i], weights_[i]);
+            }
+        }
+        return graph;
+    }
+
+    private:
+
+    inline void check_node(const Node & u) const {
+        if (u < 0 || static_cast<std::size_t>(u)+1 >= offsets_.size())
+            throw std::out_of_range("node not found");
+    }
+
+    NodeList node_list_;
+    std::vector<std::size_t> offsets_;
+    NodeList targets_;
+    std::vector<double> weights_;
+}; // class CSRGraph
+
 }; // namespace network_embedding
 
 #endif // NETWORK_EMBEDDING_GRAPH_H
\ No newline at end of file
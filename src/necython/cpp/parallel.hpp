@@ -0,0 +1,32 @@
+#include <vector>
+#include <thread>
+#include <functional>
+#include <cmath>
+
+#ifndef NETWORK_EMBEDDING_PARALLEL_H
+#define NETWORK_EMBEDDING_PARALLEL_H
+
+namespace network_embedding {
+
+// Splits [0, n) into num_threads contiguous ranges and runs body(start, end)
+// on each in its own thread, falling back to one thread for tiny n; a
+// num_threads of 0 also runs on one thread, so body always covers [0, n).
+inline void ParallelFor(std::size_t n, std::size_t num_threads, const std::function<void(std::size_t, std::size_t)> & body) {
+    if (n <= num_threads || num_threads == 0)
+        num_threads = 1;
+
+    std::vector<std::thread> threads;
+    for (std::size_t i = 0; i < num_threads; i++) {
+        std::size_t start_idx = static_cast<std::size_t>(std::round(static_cast<double>(n)/num_threads*i));
+        std::size_t end_idx = static_cast<std::size_t>(std::round(static_cast<double>(n)/num_threads*(i+1)));
+        threads.push_back(std::thread(body, start_idx, end_idx));
+    }
+
+    for (auto &t : threads) {
+        t.join();
+    }
+}
+
+}; // namespace network_embedding
+
+#endif // NETWORK_EMBEDDING_PARALLEL_H
@@ -1,4 +1,5 @@
 #include "sampling.hpp"
+#include "alias.hpp"
 
 #include <iostream>
 #include <vector>
@@ -6,6 +7,7 @@
 #include <random>
 #include <algorithm>
 #include <functional>
+#include <cmath>
 
 namespace network_embedding {
 
@@ -13,145 +15,212 @@ using std::vector;
 using std::unordered_map;
 using std::default_random_engine;
 using std::uniform_real_distribution;
+using std::uniform_int_distribution;
 using std::min;
 using std::max;
+using std::swap;
+using std::int64_t;
 using std::function;
 using std::cout;
 using std::endl;
 
 extern thread_local default_random_engine random_number_generator;
 
-vector<NodeList> DownSampling(const vector<NodeList> & sequences, double threshold) {
-    vector<NodeList> result;
-    unordered_map<Node, double> probs;
-    size_t sequences_size = 0;
-    for (const auto & sequence : sequences) {
-        for (const auto & node : sequence) {
-            if (probs.find(node) == probs.end())
-                probs[node] = 0.0;
-            probs[node] += 1.0;
-            sequences_size += 1;
-        }
-    }
+static vector<double> KeepProbabilities(const SequenceView & sequences, double threshold) {
+    const int64_t sequences_size = sequences.offsets[sequences.num_sequences] - sequences.offsets[0];
+
+    Node max_node = -1;
+    for (int64_t i = sequences.offsets[0]; i < sequences.offsets[sequences.num_sequences]; i++)
+        max_node = max(max_node, sequences.nodes[i]);
 
-    for (auto & node_prob : probs) {
-        double & prob = node_prob.second;
+    vector<double> probs(max_node+1, 0.0);
+    for (int64_t i = sequences.offsets[0]; i < sequences.offsets[sequences.num_sequences]; i++)
+        probs[sequences.nodes[i]] += 1.0;
+
+    for (auto & prob : probs) {
+        if (prob == 0.0)
+            continue;
         prob = prob / sequences_size;
         prob = sqrt(threshold/prob) + threshold/prob;
     }
+    return probs;
+}
 
+// appends the nodes of seq kept by down-sampling to filtered, returns how many
+static size_t AppendDownSampled(const Node * seq, int64_t size, const vector<double> & keep_probs, NodeList & filtered) {
     uniform_real_distribution<> dist(0,1);
-    for (const auto & sequence : sequences) {
-        NodeList filtered;
-        for (const auto & node : sequence) {
-            const double & prob = probs[node];
-            if (dist(random_number_generator) - prob < 0) {
-                filtered.push_back(node);
-            }
+    size_t start = filtered.size();
+    for (int64_t i = 0; i < size; i++) {
+        const Node & node = seq[i];
+        double keep_prob = static_cast<size_t>(node) < keep_probs.size() ? keep_probs[node] : 1.0;
+        if (dist(random_number_generator) - keep_prob < 0) {
+            filtered.push_back(node);
         }
-        if(filtered.size() > 2)
-            result.push_back(filtered);
+    }
+    return filtered.size() - start;
+}
+
+static void AppendWindowPairs(const Node * seq, int64_t size, size_t window_size, NodeList & samples) {
+    int64_t distance = (window_size+1)/2;
+    for (int64_t i = 0; i < size; i++) {
+        int64_t lb = max<int64_t>(0, i-distance), ub = min(size, i+distance+1);
+        for (int64_t j = lb; j < i; j++) {
+            samples.push_back(seq[i]);
+            samples.push_back(seq[j]);
+        }
+        for (int64_t j = i+1; j < ub; j++) {
+            samples.push_back(seq[i]);
+            samples.push_back(seq[j]);
+        }
+    }
+}
+
+Sequences DownSampling(const SequenceView & sequences, double threshold) {
+    Sequences result;
+    vector<double> probs = KeepProbabilities(sequences, threshold);
+
+    for (size_t s = 0; s < sequences.num_sequences; s++) {
+        const Node * seq = sequences.nodes + sequences.offsets[s];
+        int64_t size = sequences.offsets[s+1] - sequences.offsets[s];
+        size_t kept = AppendDownSampled(seq, size, probs, result.nodes);
+        if (kept > 2)
+            result.offsets.push_back(result.nodes.size());
+        else
+            result.nodes.resize(result.nodes.size() - kept);
     }
 
     return result;
 }
 
-vector<NodeList> SlidingWindow(const vector<NodeList> & sequences, size_t window_size) {
-    vector<NodeList> samples;
-    int distance = (window_size+1)/2;
-    for (const auto & seq : sequences) {
-        for (int i = 0; i < seq.size(); i++) {
-            int lb = max(0, i-distance), ub = min(int(seq.size()), i+distance+1);
-            for(int j = lb; j < i; j++) {
-                samples.push_back({seq[i], seq[j]});
-            }
-            for(int j = i+1; j < ub; j++) {
-                samples.push_back({seq[i], seq[j]});
-            }
-        }
+NodeList SlidingWindow(const SequenceView & sequences, size_t window_size) {
+    NodeList samples;
+    for (size_t s = 0; s < sequences.num_sequences; s++) {
+        const Node * seq = sequences.nodes + sequences.offsets[s];
+        int64_t size = sequences.offsets[s+1] - sequences.offsets[s];
+        AppendWindowPairs(seq, size, window_size, samples);
     }
     return samples;
 }
 
-vector<NodeList> Skipping(const vector<NodeList> & sequences, size_t distance) {
-    vector<NodeList> samples;
-    for (const auto & seq : sequences) {
-        size_t ub = seq.size()-distance;
-        for (size_t i = 0; i < ub; i++) {
-            samples.push_back({seq[i], seq[i+distance]});
+NodeList Skipping(const SequenceView & sequences, size_t distance) {
+    NodeList samples;
+    for (size_t s = 0; s < sequences.num_sequences; s++) {
+        const Node * seq = sequences.nodes + sequences.offsets[s];
+        int64_t ub = sequences.offsets[s+1] - sequences.offsets[s] - static_cast<int64_t>(distance);
+        for (int64_t i = 0; i < ub; i++) {
+            samples.push_back(seq[i]);
+            samples.push_back(seq[i+distance]);
         }
     }
     return samples;
 }
 
-vector<NodeList> SequencesProcessingPipeline(const vector<NodeList> & sequences, const vector<function<void(vector<NodeList>&)>> & pipeline) {
-    vector<NodeList> sequences_buffer = sequences;
-    for (auto & func : pipeline) {
-        func(sequences_buffer);
+void ShufflePairs(NodeList & pairs) {
+    size_t num_pairs = pairs.size()/2;
+    for (size_t i = num_pairs; i > 1; i--) {
+        size_t j = uniform_int_distribution<size_t>(0, i-1)(random_number_generator);
+        swap(pairs[2*(i-1)], pairs[2*j]);
+        swap(pairs[2*(i-1)+1], pairs[2*j+1]);
     }
-    return sequences_buffer;
 }
 
-vector<NodeList> WindowSampling(const vector<NodeList> & sequences, size_t window_size, double down_sampling, bool shuffle) {
-    vector<function<void(vector<NodeList>&)>> pipeline;
-
+NodeList WindowSampling(const SequenceView & sequences, size_t window_size, double down_sampling, bool shuffle) {
+    NodeList samples;
     if (down_sampling > 0) {
-        pipeline.push_back(
-            [&](vector<NodeList> & seq) -> void {
-                auto buffer = DownSampling(seq, down_sampling);
-                seq = move(buffer);
-            }
-        );
+        Sequences buffer = DownSampling(sequences, down_sampling);
+        samples = SlidingWindow(buffer.view(), window_size);
+    }
+    else {
+        samples = SlidingWindow(sequences, window_size);
     }
 
-    pipeline.push_back(
-        [&](vector<NodeList> & seq) -> void {
-            auto buffer = SlidingWindow(seq, window_size);
-            seq = move(buffer);
-        }
-    );
+    if (shuffle)
+        ShufflePairs(samples);
 
-    if (shuffle) {
-        pipeline.push_back(
-            [&](vector<NodeList> & seq) ->void {
-                random_shuffle(seq.begin(), seq.end());
-            }
-        );
+    return samples;
+}
+
+NodeList SkipSampling(const SequenceView & sequences, size_t distance, double down_sampling, bool shuffle) {
+    NodeList samples;
+    if (down_sampling > 0) {
+        Sequences buffer = DownSampling(sequences, down_sampling);
+        samples = Skipping(buffer.view(), distance);
+    }
+    else {
+        samples = Skipping(sequences, distance);
     }
 
-    return SequencesProcessingPipeline(sequences, pipeline);
-}
+    if (shuffle)
+        ShufflePairs(samples);
 
-// vector<NodeList> WindowSampling(const vector<NodeList> & sequences, size_t window_size, double down_sampling, bool shuffle) {
-//     return SlidingWindow(sequences, window_size);
-// }
+    return samples;
+}
 
-vector<NodeList> SkipSampling(const vector<NodeList> & sequences, size_t distance, double down_sampling, bool shuffle) {
-    vector<function<void(vector<NodeList>&)>> pipeline;
+WindowIterator::WindowIterator(const SequenceView & sequences, size_t window_size, const double * keep_probs, size_t num_nodes, bool shuffle, size_t block_size) :
+        sequences_(sequences),
+        window_size_(window_size),
+        shuffle_(shuffle),
+        block_size_(max<size_t>(block_size, 1)),
+        next_sequence_(0),
+        block_pos_(0) {
+    if (keep_probs != nullptr)
+        keep_probs_.assign(keep_probs, keep_probs+num_nodes);
 
-    if (down_sampling > 0) {
-        pipeline.push_back(
-            [&](vector<NodeList> & seq) -> void {
-                seq = move(DownSampling(seq, down_sampling));
-            }
-        );
+    if (shuffle) {
+        order_.resize(sequences.num_sequences);
+        for (size_t i = 0; i < order_.size(); i++)
+            order_[i] = i;
+        for (size_t i = order_.size(); i > 1; i--)
+            swap(order_[i-1], order_[uniform_int_distribution<size_t>(0, i-1)(random_number_generator)]);
     }
+}
 
-    pipeline.push_back(
-        [&](vector<NodeList> & seq) -> void {
-            seq = move(Skipping(seq, distance));
+void WindowIterator::FillBlock() {
+    block_.clear();
+    block_pos_ = 0;
+    while (block_.size()/2 < block_size_ && next_sequence_ < sequences_.num_sequences) {
+        size_t s = shuffle_ ? order_[next_sequence_] : next_sequence_;
+        next_sequence_++;
+
+        const Node * seq = sequences_.nodes + sequences_.offsets[s];
+        int64_t size = sequences_.offsets[s+1] - sequences_.offsets[s];
+        if (!keep_probs_.empty()) {
+            filtered_.clear();
+            if (AppendDownSampled(seq, size, keep_probs_, filtered_) <= 2)
+                continue;
+            seq = filtered_.data();
+            size = filtered_.size();
         }
-    );
+        AppendWindowPairs(seq, size, window_size_, block_);
+    }
 
-    if (shuffle) {
-        pipeline.push_back(
-            [&](vector<NodeList> & seq) ->void {
-                random_shuffle(seq.begin(), seq.end());
-            }
-        );
+    if (shuffle_)
+        ShufflePairs(block_);
+}
+
+size_t WindowIterator::Next(Node * pairs, size_t max_pairs) {
+    size_t num_pairs = 0;
+    while (num_pairs < max_pairs) {
+        if (block_pos_*2 == block_.size()) {
+            FillBlock();
+            if (block_.empty())
+                break;
+        }
+        size_t n = min(max_pairs - num_pairs, block_.size()/2 - block_pos_);
+        std::copy(block_.begin() + block_pos_*2, block_.begin() + (block_pos_+n)*2, pairs + num_pairs*2);
+        block_pos_ += n;
+        num_pairs += n;
     }
+    return num_pairs;
+}
+
+NegativeSampler::NegativeSampler(const double * weights, size_t num_nodes) : probs_(num_nodes), aliases_(num_nodes) {
+    BuildAliasTable(weights, num_nodes, probs_.data(), aliases_.data());
+}
 
-    return SequencesProcessingPipeline(sequences, pipeline);
+void NegativeSampler::Sample(Node * nodes, size_t size) const {
+    for (size_t i = 0; i < size; i++)
+        nodes[i] = SampleAlias(probs_.data(), aliases_.data(), probs_.size(), random_number_generator);
 }
 
-};
\ No newline at end of file
+};
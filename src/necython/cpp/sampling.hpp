@@ -2,6 +2,7 @@
 #include <unordered_map>
 #include <utility>
 #include <functional>
+#include <cstdint>
 
 #include "graph.hpp"
 
@@ -10,13 +11,86 @@
 
 namespace network_embedding {
 
-std::vector<NodeList> DownSampling(const std::vector<NodeList> & sequences, double threshold);
-std::vector<NodeList> SlidingWindow(const std::vector<NodeList> & sequences, std::size_t window_size);
-std::vector<NodeList> Skipping(const std::vector<NodeList> & sequences, std::size_t distance);
-std::vector<NodeList> SequencesProcessingPipeline(const std::vector<NodeList> & sequences, const std::vector<std::function<void(std::vector<NodeList>&)>> & pipeline);
-std::vector<NodeList> WindowSampling(const std::vector<NodeList> & sequences, std::size_t window_size, double down_sampling, bool shuffle);
-std::vector<NodeList> SkipSampling(const std::vector<NodeList> & sequences, std::size_t distance, double down_sampling, bool shuffle);
+// Read-only view of sequences stored back to back in one flat array:
+// sequence i is nodes[offsets[i]..offsets[i+1]).
+struct SequenceView {
+    const Node * nodes;
+    const std::int64_t * offsets;
+    std::size_t num_sequences;
+};
+
+// Owning counterpart of SequenceView.
+struct Sequences {
+    NodeList nodes;
+    std::vector<std::int64_t> offsets;
+
+    Sequences() : offsets(1, 0) {}
+
+    inline SequenceView view() const {
+        return {nodes.data(), offsets.data(), offsets.size()-1};
+    }
+};
+
+// Samples are returned flattened, two nodes per (center, context) pair.
+Sequences DownSampling(const SequenceView & sequences, double threshold);
+NodeList SlidingWindow(const SequenceView & sequences, std::size_t window_size);
+NodeList Skipping(const SequenceView & sequences, std::size_t distance);
+void ShufflePairs(NodeList & pairs);
+NodeList WindowSampling(const SequenceView & sequences, std::size_t window_size, double down_sampling, bool shuffle);
+NodeList SkipSampling(const SequenceView & sequences, std::size_t distance, double down_sampling, bool shuffle);
+
+// Generates the (center, context) pairs of WindowSampling lazily, one block
+// of about block_size pairs at a time, so memory follows the block size
+// instead of the corpus size. Node u is kept with probability keep_probs[u]
+// unless keep_probs is null. With shuffle, sequences are visited in random
+// order and the pairs of each block are shuffled.
+class WindowIterator {
+    public:
+
+    WindowIterator(const SequenceView & sequences, std::size_t window_size, const double * keep_probs, std::size_t num_nodes, bool shuffle, std::size_t block_size);
+
+    // copies at most max_pairs pairs into pairs and returns how many, 0 once exhausted
+    std::size_t Next(Node * pairs, std::size_t max_pairs);
+
+    inline std::size_t sequences_done() const {
+        return next_sequence_;
+    }
+
+    inline std::size_t num_sequences() const {
+        return sequences_.num_sequences;
+    }
+
+    private:
+
+    void FillBlock();
+
+    SequenceView sequences_;
+    std::size_t window_size_;
+    bool shuffle_;
+    std::size_t block_size_;
+    std::vector<double> keep_probs_;
+    std::vector<std::size_t> order_;
+    std::size_t next_sequence_;
+    NodeList block_;
+    std::size_t block_pos_;
+    NodeList filtered_;
+};
+
+// Draws negative nodes with probability proportional to weights through an
+// alias table, in O(1) per sample.
+class NegativeSampler {
+    public:
+
+    NegativeSampler(const double * weights, std::size_t num_nodes);
+
+    void Sample(Node * nodes, std::size_t size) const;
+
+    private:
+
+    std::vector<double> probs_;
+    std::vector<int> aliases_;
+};
 
 }; // namespace network_embedding
 
-#endif // NETWORK_EMBEDDING_SAMPLING_h
\ No newline at end of file
+#endif // NETWORK_EMBEDDING_SAMPLING_h
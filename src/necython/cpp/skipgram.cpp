@@ -0,0 +1,115 @@
+#include "skipgram.hpp"
+#include "parallel.hpp"
+
+#include <vector>
+#include <random>
+#include <atomic>
+#include <algorithm>
+#include <cmath>
+
+namespace network_embedding {
+
+using std::size_t;
+using std::int64_t;
+using std::vector;
+using std::atomic;
+using std::default_random_engine;
+using std::uniform_real_distribution;
+using std::min;
+using std::max;
+
+extern thread_local default_random_engine random_number_generator;
+
+// beyond this margin the sigmoid is taken as saturated, as in word2vec
+static const float kMaxExp = 6.0f;
+// sequences a thread trains between two updates of the shared progress
+static const size_t kProgressInterval = 64;
+
+static inline float Dot(const float * x, const float * y, size_t dimension) {
+    float result = 0.0f;
+    for (size_t k = 0; k < dimension; k++)
+        result += x[k] * y[k];
+    return result;
+}
+
+// one gradient step of -log(sigmoid(label ? x.y : -x.y)) on y, accumulated for x into grad
+static inline void Update(const float * x, float * y, float * grad, size_t dimension, bool label, float learning_rate) {
+    float f = Dot(x, y, dimension);
+    float g;
+    if (f > kMaxExp)
+        g = label ? 0.0f : -1.0f;
+    else if (f < -kMaxExp)
+        g = label ? 1.0f : 0.0f;
+    else
+        g = (label ? 1.0f : 0.0f) - 1.0f / (1.0f + std::exp(-f));
+    g *= learning_rate;
+    for (size_t k = 0; k < dimension; k++)
+        grad[k] += g * y[k];
+    for (size_t k = 0; k < dimension; k++)
+        y[k] += g * x[k];
+}
+
+void TrainSkipGram(
+        const SequenceView & sequences,
+        float * embeddings,
+        float * contexts,
+        size_t dimension,
+        const NegativeSampler & negatives,
+        size_t negative,
+        size_t window_size,
+        const double * keep_probs,
+        size_t num_nodes,
+        double start_learning_rate,
+        double end_learning_rate,
+        size_t num_threads) {
+    const int64_t distance = (window_size+1)/2;
+    atomic<size_t> progress(0);
+
+    ParallelFor(sequences.num_sequences, num_threads, [&](size_t start_idx, size_t end_idx) {
+        uniform_real_distribution<> dist(0, 1);
+        vector<float> grad(dimension);
+        NodeList filtered;
+        NodeList samples(negative);
+        float learning_rate = start_learning_rate;
+
+        for (size_t s = start_idx; s < end_idx; s++) {
+            if ((s - start_idx) % kProgressInterval == 0) {
+                size_t done = progress.fetch_add(min(kProgressInterval, end_idx - s));
+                learning_rate = start_learning_rate + (end_learning_rate - start_learning_rate) * done / sequences.num_sequences;
+            }
+
+            const Node * seq = sequences.nodes + sequences.offsets[s];
+            int64_t size = sequences.offsets[s+1] - sequences.offsets[s];
+            if (keep_probs != nullptr) {
+                filtered.clear();
+                for (int64_t i = 0; i < size; i++) {
+                    double keep_prob = static_cast<size_t>(seq[i]) < num_nodes ? keep_probs[seq[i]] : 1.0;
+                    if (dist(random_number_generator) < keep_prob)
+                        filtered.push_back(seq[i]);
+                }
+                if (filtered.size() <= 2)
+                    continue;
+                seq = filtered.data();
+                size = filtered.size();
+            }
+
+            for (int64_t i = 0; i < size; i++) {
+                float * emb_u = embeddings + static_cast<size_t>(seq[i]) * dimension;
+                int64_t lb = max<int64_t>(0, i-distance), ub = min(size, i+distance+1);
+                for (int64_t j = lb; j < ub; j++) {
+                    if (j == i)
+                        continue;
+                    std::fill(grad.begin(), grad.end(), 0.0f);
+                    Update(emb_u, contexts + static_cast<size_t>(seq[j]) * dimension, grad.data(), dimension, true, learning_rate);
+                    negatives.Sample(samples.data(), negative);
+                    for (const Node & w : samples)
+                        Update(emb_u, contexts + static_cast<size_t>(w) * dimension, grad.data(), dimension, false, learning_rate);
+                    for (size_t k = 0; k < dimension; k++)
+                        emb_u[k] += grad[k];
+                }
+            }
+        }
+    });
+}
+
+};
@@ -0,0 +1,34 @@
+#include <cstdint>
+
+#include "graph.hpp"
+#include "sampling.hpp"
+
+#ifndef NETWORK_EMBEDDING_SKIPGRAM_H
+#define NETWORK_EMBEDDING_SKIPGRAM_H
+
+namespace network_embedding {
+
+// Trains skip-gram with negative sampling on sequences in place, word2vec
+// style: every (center, context) pair of WindowSampling updates
+// embeddings[center] against contexts[context] and negative nodes drawn from
+// negatives. embeddings and contexts are row-major (number of nodes, dimension)
+// tables updated lock-free by num_threads threads. The learning rate decays
+// linearly from start_learning_rate to end_learning_rate over the sequences.
+// Node u is kept with probability keep_probs[u] unless keep_probs is null.
+void TrainSkipGram(
+        const SequenceView & sequences,
+        float * embeddings,
+        float * contexts,
+        std::size_t dimension,
+        const NegativeSampler & negatives,
+        std::size_t negative,
+        std::size_t window_size,
+        const double * keep_probs,
+        std::size_t num_nodes,
+        double start_learning_rate,
+        double end_learning_rate,
+        std::size_t num_threads);
+
+}; // namespace network_embedding
+
+#endif // NETWORK_EMBEDDING_SKIPGRAM_H
@@ -7,8 +7,11 @@
 #include <thread>
 #include <functional>
 #include <random>
+#include <stdexcept>
 
 #include "graph.hpp"
+#include "alias.hpp"
+#include "parallel.hpp"
 
 namespace network_embedding {
 
@@ -32,37 +35,66 @@ using std::min;
 using std::max;
 using std::random_shuffle;
 using std::function;
+using std::fill;
+using std::binary_search;
 
 extern thread_local default_random_engine random_number_generator;
 
+NodeList ParallelWalker::SimulateWalk(const Node & start_node, size_t walk_length) {
+    NodeList seq(walk_length+1);
+    SimulateWalk(start_node, walk_length, seq.data());
+    return seq;
+}
+
 vector<NodeList> ParallelWalker::Walk(size_t num_walks, size_t walk_length, size_t num_threads) {
     const NodeList & node_list = get_node_list();
-    size_t num_nodes = node_list.size();
+    vector<NodeList> sequences(node_list.size()*num_walks);
+
+    ParallelFor(node_list.size(), num_threads, [this, num_walks, walk_length, &node_list, &sequences](size_t start_idx, size_t end_idx) {
+        for (size_t u = start_idx; u < end_idx; u++) {
+            for (size_t w = 0; w < num_walks; w++) {
+                NodeList & seq = sequences[u*num_walks+w];
+                seq.resize(walk_length+1);
+                SimulateWalk(node_list[u], walk_length, seq.data());
+            }
+        }
+    });
 
-    vector<NodeList> sequences(num_nodes*num_walks);
+    return sequences;
+}
 
-    if (num_nodes <= num_threads)
-        num_threads = 1;
+void ParallelWalker::Walk(size_t num_walks, size_t walk_length, size_t num_threads, Node * walks) {
+    Walk(num_walks, walk_length, num_threads, walks, 0, get_node_list().size());
+}
 
-    vector<thread> threads;
-    for (size_t i = 0; i < num_threads; i++) {
-        size_t start_idx = static_cast<size_t>(round(static_cast<double>(num_nodes)/num_threads*i));
-        size_t end_idx = static_cast<size_t>(round(static_cast<double>(num_nodes)/num_threads*(i+1)));
+void ParallelWalker::Walk(size_t num_walks, size_t walk_length, size_t num_threads, Node * walks, size_t first_node, size_t last_node) {
+    const NodeList & node_list = get_node_list();
+    size_t width = walk_length+1;
 
-        threads.push_back(thread([this, start_idx, end_idx, num_walks, walk_length, &node_list, &sequences]{
-            for (size_t u = start_idx; u < end_idx; u++) {
-                for (size_t w = 0; w < num_walks; w++) {
-                    sequences[u*num_walks+w] = move(SimulateWalk(node_list[u], walk_length));
-                }
+    ParallelFor(last_node-first_node, num_threads, [this, num_walks, walk_length, width, first_node, &node_list, walks](size_t start_idx, size_t end_idx) {
+        for (size_t u = start_idx; u < end_idx; u++) {
+            for (size_t w = 0; w < num_walks; w++) {
+                SimulateWalk(node_list[first_node+u], walk_length, walks+(u*num_walks+w)*width);
             }
-        }));
-    }
+        }
+    });
+}
 
-    for (auto &t : threads) {
-        t.join();
+void ParallelWalker::CheckStartNodes(const Node * start_nodes, size_t num_starts) const {
+    for (size_t i = 0; i < num_starts; i++) {
+        if (degree(start_nodes[i]) == 0)
+            throw std::invalid_argument("start node has no neighbors");
     }
+}
 
-    return sequences;
+void ParallelWalker::WalkFrom(const Node * start_nodes, size_t num_starts, size_t walk_length, size_t num_threads, Node * walks) {
+    size_t width = walk_length+1;
+
+    ParallelFor(num_starts, num_threads, [this, start_nodes, walk_length, width, walks](size_t start_idx, size_t end_idx) {
+        for (size_t i = start_idx; i < end_idx; i++) {
+            SimulateWalk(start_nodes[i], walk_length, walks+i*width);
+        }
+    });
 }
 
 void Walker::set_node_list(const NodeList & nodes) {
@@ -75,9 +107,10 @@ void Walker::SetTransitionWeights(const Node & node, const NodeList & neighbors,
     distributions_[node] = {neighbors, discrete_distribution<int>(weights.begin(), weights.end())};
 }
 
-void Walker::InitDistributionsFromGraph(const Graph &graph, bool weighted) {
+template <typename GraphType>
+void Walker::InitDistributionsFromGraph(const GraphType &graph, bool weighted) {
     auto make_node_distribution = [weighted, &graph] (const Node & u) -> pair<NodeList, discrete_distribution<int>> {
-        const NodeSet & n_u = graph.neighbors(u);
+        const auto & n_u = graph.neighbors(u);
         NodeList neighbors(n_u.begin(), n_u.end());
         vector<double> weights;
 
@@ -87,9 +120,7 @@ void Walker::InitDistributionsFromGraph(const Graph &graph, bool weighted) {
             }
         }
         else {
-            for (const auto & v : neighbors) {
-                weights.push_back(1.);
-            }
+            weights.assign(neighbors.size(), 1.);
         }
         return {neighbors, discrete_distribution<int>(weights.begin(), weights.end())};
     };
@@ -102,25 +133,27 @@ void Walker::InitDistributionsFromGraph(const Graph &graph, bool weighted) {
     }
 }
 
-NodeList Walker::SimulateWalk(const Node & start_node, size_t walk_length) {
-    NodeList seq;
+template void Walker::InitDistributionsFromGraph<Graph>(const Graph &graph, bool weighted);
+template void Walker::InitDistributionsFromGraph<CSRGraph>(const CSRGraph &graph, bool weighted);
+
+void Walker::SimulateWalk(const Node & start_node, size_t walk_length, Node * walk) {
     int curr_node = start_node;
-    seq.push_back(curr_node);
+    walk[0] = curr_node;
     for (size_t i = 0; i < walk_length; i++) {
         auto &val = distributions_.at(curr_node);
         auto &neibors = val.first;
         auto &dist = val.second;
 
         int next_node = neibors[dist(random_number_generator)];
-        seq.push_back(next_node);
+        walk[i+1] = next_node;
         curr_node = next_node;
     }
-    return seq;
 }
 
-void BiasedWalker::InitDistributionsFromGraph(const Graph &graph, double p, double q) {
+template <typename GraphType>
+void BiasedWalker::InitDistributionsFromGraph(const GraphType &graph, double p, double q) {
     auto make_node_distribution = [&graph] (const Node & u) -> pair<NodeList, uniform_int_distribution<int>> {
-        const NodeSet & n_u = graph.neighbors(u);
+        const auto & n_u = graph.neighbors(u);
         NodeList neighbors(n_u.begin(), n_u.end());
         return {neighbors, uniform_int_distribution<int>(0, neighbors.size()-1)};
     };
@@ -129,8 +162,7 @@ void BiasedWalker::InitDistributionsFromGraph(const Graph &graph, double p, doub
         const Node & u = edge.first;
         const Node & v = edge.second;
 
-        const NodeSet & n_u = graph.neighbors(u);
-        const NodeSet & n_v = graph.neighbors(v);
+        const auto & n_v = graph.neighbors(v);
 
         NodeList nodes;
         vector<double> weights;
@@ -140,7 +172,7 @@ void BiasedWalker::InitDistributionsFromGraph(const Graph &graph, double p, doub
 
         for (const auto &node : n_v) {
             double weight;
-            if (n_u.find(node) != n_u.end())
+            if (graph.has_edge(u, node))
                 weight = 1.0;
             else
                 weight = 1.0/q;
@@ -155,41 +187,188 @@ void BiasedWalker::InitDistributionsFromGraph(const Graph &graph, double p, doub
     node_distributions_.clear();
     edge_distributions_.clear();
 
-    auto nodes = graph.nodes();
-    auto edges = graph.directed_edges();
-
-    for (const auto & node : nodes) {
+    for (const auto & node : graph.nodes()) {
         node_list_.push_back(node);
         node_distributions_[node] = move(make_node_distribution(node));
     }
 
-    for (const auto & edge : edges) {
-        edge_distributions_[edge] = move(make_edge_distribution(edge));
+    for (const auto & u : node_list_) {
+        for (const auto & v : graph.neighbors(u)) {
+            edge_distributions_[{u, v}] = move(make_edge_distribution({u, v}));
+        }
     }
 }
 
-NodeList BiasedWalker::SimulateWalk(const Node & start_node, size_t walk_length) {
-    NodeList seq;
+template void BiasedWalker::InitDistributionsFromGraph<Graph>(const Graph &graph, double p, double q);
+template void BiasedWalker::InitDistributionsFromGraph<CSRGraph>(const CSRGraph &graph, double p, double q);
+
+void BiasedWalker::SimulateWalk(const Node & start_node, size_t walk_length, Node * walk) {
+    walk[0] = start_node;
+    if (walk_length == 0)
+        return;
 
     auto &v = node_distributions_.at(start_node);
     auto &neibors = v.first;
     auto &dist = v.second;
 
     int prev_node = start_node, curr_node = neibors[dist(random_number_generator)];
-    seq.push_back(prev_node);
-    seq.push_back(curr_node);
+    walk[1] = curr_node;
     for (size_t i = 1; i < walk_length; i++) {
         auto &v = edge_distributions_.at({prev_node, curr_node});
         auto &neibors = v.first;
         auto &dist = v.second;
 
         int next_node = neibors[dist(random_number_generator)];
-        seq.push_back(next_node);
+        walk[i+1] = next_node;
         prev_node = curr_node;
         curr_node = next_node;
     }
+}
 
-    return seq;
+void AliasWalker::InitDistributionsFromGraph(const CSRGraph &graph, bool weighted) {
+    node_list_ = graph.nodes();
+    offsets_ = graph.offsets();
+    targets_ = graph.targets();
+
+    size_t num_edges = targets_.size();
+    probs_.resize(num_edges);
+    aliases_.resize(num_edges);
+
+    if (weighted) {
+        SetEdgeWeights(graph.edge_weights().data(), num_edges, 1);
+    } else {
+        vector<double> weights(num_edges, 1.0);
+        SetEdgeWeights(weights.data(), num_edges, 1);
+    }
+}
+
+void AliasWalker::SetEdgeWeights(const double * weights, size_t num_edges, size_t num_threads) {
+    if (num_edges != targets_.size())
+        throw std::invalid_argument("weights do not match the number of directed edges");
+
+    ParallelFor(node_list_.size(), num_threads, [this, weights](size_t start_idx, size_t end_idx) {
+        for (size_t i = start_idx; i < end_idx; i++) {
+            size_t offset = offsets_[node_list_[i]];
+            size_t degree = offsets_[node_list_[i]+1]-offset;
+            BuildAliasTable(weights+offset, degree, probs_.data()+offset, aliases_.data()+offset);
+        }
+    });
+}
+
+void AliasWalker::SimulateWalk(const Node & start_node, size_t walk_length, Node * walk) {
+    Node curr_node = start_node;
+    walk[0] = curr_node;
+    for (size_t i = 0; i < walk_length; i++) {
+        size_t offset = offsets_[curr_node];
+        size_t degree = offsets_[curr_node+1]-offset;
+        if (degree > 0) {
+            size_t k = SampleAlias(probs_.data()+offset, aliases_.data()+offset, degree, random_number_generator);
+            curr_node = targets_[offset+k];
+        }
+        walk[i+1] = curr_node;
+    }
+}
+
+void BiasedAliasWalker::InitDistributionsFromGraph(const CSRGraph &graph, double p, double q, size_t max_precompute_degree) {
+    p_ = p;
+    q_ = q;
+    max_bias_ = max(1.0, max(1.0/p, 1.0/q));
+    node_list_ = graph.nodes();
+    offsets_ = graph.offsets();
+    targets_ = graph.targets();
+
+    size_t num_edges = targets_.size();
+    edge_offsets_.assign(num_edges+1, 0);
+    for (const auto & u : node_list_) {
+        for (size_t e = offsets_[u]; e < offsets_[u+1]; e++) {
+            const Node & v = targets_[e];
+            size_t d_v = offsets_[v+1]-offsets_[v];
+            edge_offsets_[e+1] = d_v <= max_precompute_degree ? d_v : 0;
+        }
+    }
+    for (size_t e = 0; e < num_edges; e++)
+        edge_offsets_[e+1] += edge_offsets_[e];
+
+    edge_probs_.resize(edge_offsets_.back());
+    edge_aliases_.resize(edge_offsets_.back());
+
+    vector<double> weights;
+    for (const auto & u : node_list_) {
+        const Node * n_u = targets_.data()+offsets_[u];
+        size_t d_u = offsets_[u+1]-offsets_[u];
+        for (size_t e = offsets_[u]; e < offsets_[u+1]; e++) {
+            const Node & v = targets_[e];
+            const Node * n_v = targets_.data()+offsets_[v];
+            size_t d_v = edge_offsets_[e+1]-edge_offsets_[e];
+
+            // both neighbor lists are sorted, so common neighbors are found by merging
+            weights.resize(d_v);
+            size_t j = 0;
+            for (size_t i = 0; i < d_v; i++) {
+                const Node & x = n_v[i];
+                while (j < d_u && n_u[j] < x)
+                    j++;
+                if (x == u)
+                    weights[i] = 1.0/p;
+                else if (j < d_u && n_u[j] == x)
+                    weights[i] = 1.0;
+                else
+                    weights[i] = 1.0/q;
+            }
+            BuildAliasTable(weights.data(), d_v, edge_probs_.data()+edge_offsets_[e], edge_aliases_.data()+edge_offsets_[e]);
+        }
+    }
+}
+
+void BiasedAliasWalker::SimulateWalk(const Node & start_node, size_t walk_length, Node * walk) {
+    walk[0] = start_node;
+    if (walk_length == 0)
+        return;
+
+    size_t degree = offsets_[start_node+1]-offsets_[start_node];
+    if (degree == 0) {
+        fill(walk, walk+walk_length+1, start_node);
+        return;
+    }
+
+    size_t edge = offsets_[start_node] + uniform_int_distribution<size_t>(0, degree-1)(random_number_generator);
+    Node curr_node = targets_[edge];
+    walk[1] = curr_node;
+    for (size_t i = 1; i < walk_length; i++) {
+        size_t offset = edge_offsets_[edge];
+        size_t table_size = edge_offsets_[edge+1]-offset;
+        size_t k;
+        if (table_size > 0)
+            k = SampleAlias(edge_probs_.data()+offset, edge_aliases_.data()+offset, table_size, random_number_generator);
+        else
+            k = RejectionSample(walk[i-1], curr_node);
+        edge = offsets_[curr_node]+k;
+        curr_node = targets_[edge];
+        walk[i+1] = curr_node;
+    }
+}
+
+size_t BiasedAliasWalker::RejectionSample(const Node & prev_node, const Node & curr_node) {
+    const Node * n_prev = targets_.data()+offsets_[prev_node];
+    const Node * n_prev_end = targets_.data()+offsets_[prev_node+1];
+    const Node * n_curr = targets_.data()+offsets_[curr_node];
+    size_t degree = offsets_[curr_node+1]-offsets_[curr_node];
+
+    uniform_int_distribution<size_t> candidate(0, degree-1);
+    uniform_real_distribution<double> acceptance(0.0, max_bias_);
+    while (true) {
+        size_t k = candidate(random_number_generator);
+        const Node & x = n_curr[k];
+        double bias;
+        if (x == prev_node)
+            bias = 1.0/p_;
+        else if (binary_search(n_prev, n_prev_end, x))
+            bias = 1.0;
+        else
+            bias = 1.0/q_;
+        if (acceptance(random_number_generator) < bias)
+            return k;
+    }
 }
 
 };  // namespace network_embedding
@@ -2,8 +2,10 @@
 #include <unordered_map>
 #include <random>
 #include <functional>
+#include <stdexcept>
 
 #include "graph.hpp"
+#include "alias.hpp"
 
 #ifndef NETWORK_EMBEDDING_WALKER_H
 #define NETWORK_EMBEDDING_WALKER_H
@@ -15,8 +17,23 @@ class ParallelWalker {
 
     virtual ~ParallelWalker() {}
     virtual const NodeList & get_node_list() const = 0;
-    virtual NodeList SimulateWalk(const Node & start_node, std::size_t walk_length) = 0;
-    virtual std::vector<NodeList> Walk(std::size_t num_walks, std::size_t walk_length, std::size_t num_threads);
+    // number of neighbors of node, throws std::out_of_range for a node the
+    // walker does not know
+    virtual std::size_t degree(const Node & node) const = 0;
+    // throws std::out_of_range for an unknown start node and
+    // std::invalid_argument for one without neighbors, as WalkFrom expects
+    void CheckStartNodes(const Node * start_nodes, std::size_t num_starts) const;
+    // writes walk_length+1 nodes, starting with start_node, into walk
+    virtual void SimulateWalk(const Node & start_node, std::size_t walk_length, Node * walk) = 0;
+    NodeList SimulateWalk(const Node & start_node, std::size_t walk_length);
+    std::vector<NodeList> Walk(std::size_t num_walks, std::size_t walk_length, std::size_t num_threads);
+    // fills walks as a row-major (number of nodes * num_walks, walk_length+1) matrix
+    void Walk(std::size_t num_walks, std::size_t walk_length, std::size_t num_threads, Node * walks);
+    // same for the nodes get_node_list()[first_node..last_node) only
+    void Walk(std::size_t num_walks, std::size_t walk_length, std::size_t num_threads, Node * walks, std::size_t first_node, std::size_t last_node);
+    // one walk from each of start_nodes[0..num_starts), which must pass CheckStartNodes,
+    // as a row-major (num_starts, walk_length+1) matrix
+    void WalkFrom(const Node * start_nodes, std::size_t num_starts, std::size_t walk_length, std::size_t num_threads, Node * walks);
 };
 
 class Walker : public ParallelWalker {
@@ -28,11 +45,20 @@ class Walker : public ParallelWalker {
         return node_list_;
     }
 
+    virtual inline std::size_t degree(const Node & node) const {
+        auto it = distributions_.find(node);
+        if (it == distributions_.end())
+            throw std::out_of_range("node not found");
+        return it->second.first.size();
+    }
+
     void set_node_list(const NodeList & nodes);
 
-    void InitDistributionsFromGraph(const Graph &graph, bool weighted);
+    template <typename GraphType>
+    void InitDistributionsFromGraph(const GraphType &graph, bool weighted);
     void SetTransitionWeights(const Node & node, const NodeList & neighbors, const std::vector<double> & weights);
-    virtual NodeList SimulateWalk(const Node & start_node, std::size_t walk_length);
+    using ParallelWalker::SimulateWalk;
+    virtual void SimulateWalk(const Node & start_node, std::size_t walk_length, Node * walk);
 
     private:
 
@@ -50,9 +76,18 @@ class BiasedWalker : public ParallelWalker {
         return node_list_;
     }
 
-    void InitDistributionsFromGraph(const Graph &graph, double p, double q);
+    virtual inline std::size_t degree(const Node & node) const {
+        auto it = node_distributions_.find(node);
+        if (it == node_distributions_.end())
+            throw std::out_of_range("node not found");
+        return it->second.first.size();
+    }
+
+    template <typename GraphType>
+    void InitDistributionsFromGraph(const GraphType &graph, double p, double q);
 
-    virtual NodeList SimulateWalk(const Node & start_node, std::size_t walk_length);
+    using ParallelWalker::SimulateWalk;
+    virtual void SimulateWalk(const Node & start_node, std::size_t walk_length, Node * walk);
 
     private:
 
@@ -61,6 +96,89 @@ class BiasedWalker : public ParallelWalker {
     std::unordered_map<Edge, std::pair<NodeList, std::discrete_distribution<int>>, edge_hash> edge_distributions_;
 };
 
+// First-order walker sampling from flat alias tables laid out in the edge
+// order of a CSRGraph.
+class AliasWalker : public ParallelWalker {
+    public:
+
+    AliasWalker() {}
+
+    virtual inline const NodeList & get_node_list() const {
+        return node_list_;
+    }
+
+    virtual inline std::size_t degree(const Node & node) const {
+        if (node < 0 || static_cast<std::size_t>(node)+1 >= offsets_.size())
+            throw std::out_of_range("node not found");
+        return offsets_[node+1] - offsets_[node];
+    }
+
+    void InitDistributionsFromGraph(const CSRGraph &graph, bool weighted);
+
+    inline void InitDistributionsFromGraph(const Graph &graph, bool weighted) {
+        InitDistributionsFromGraph(CSRGraph(graph), weighted);
+    }
+
+    // Reweights the transitions in place: weights[e] is the new weight of
+    // directed edge e in the edge order of the graph given at init. Only
+    // the alias tables are rebuilt, split over num_threads threads.
+    void SetEdgeWeights(const double * weights, std::size_t num_edges, std::size_t num_threads);
+
+    using ParallelWalker::SimulateWalk;
+    virtual void SimulateWalk(const Node & start_node, std::size_t walk_length, Node * walk);
+
+    private:
+
+    NodeList node_list_;
+    std::vector<std::size_t> offsets_;
+    NodeList targets_;
+    std::vector<double> probs_;
+    std::vector<int> aliases_;
+};
+
+// node2vec walker keeping one alias table per directed edge (u, v), aligned
+// with the CSR neighbors of v so that a sampled slot is also the index of
+// the next edge. Tables are only built for edges whose target has at most
+// max_precompute_degree neighbors; the others are walked by rejection
+// sampling against the first-order distribution, which keeps memory at
+// O(E) when max_precompute_degree is 0.
+class BiasedAliasWalker : public ParallelWalker {
+    public:
+
+    BiasedAliasWalker() : p_(1.0), q_(1.0), max_bias_(1.0) {}
+
+    virtual inline const NodeList & get_node_list() const {
+        return node_list_;
+    }
+
+    virtual inline std::size_t degree(const Node & node) const {
+        if (node < 0 || static_cast<std::size_t>(node)+1 >= offsets_.size())
+            throw std::out_of_range("node not found");
+        return offsets_[node+1] - offsets_[node];
+    }
+
+    void InitDistributionsFromGraph(const CSRGraph &graph, double p, double q, std::size_t max_precompute_degree = CSRGraph::npos);
+
+    inline void InitDistributionsFromGraph(const Graph &graph, double p, double q, std::size_t max_precompute_degree = CSRGraph::npos) {
+        InitDistributionsFromGraph(CSRGraph(graph), p, q, max_precompute_degree);
+    }
+
+    using ParallelWalker::SimulateWalk;
+    virtual void SimulateWalk(const Node & start_node, std::size_t walk_length, Node * walk);
+
+    private:
+
+    std::size_t RejectionSample(const Node & prev_node, const Node & curr_node);
+
+    double p_, q_, max_bias_;
+    NodeList node_list_;
+    std::vector<std::size_t> offsets_;
+    NodeList targets_;
+    std::vector<std::size_t> edge_offsets_;
+    std::vector<double> edge_probs_;
+    std::vector<int> edge_aliases_;
+};
+
 };
 
 #endif
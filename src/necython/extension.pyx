@@ -4,14 +4,63 @@
 #distutils: language=c++
 
 from libcpp cimport bool
+from libcpp.vector cimport vector
+from libc.stdint cimport int64_t, uint64_t, uint8_t
+from libc.string cimport memcpy
 
-from necpp cimport Graph as CGraph
-from necpp cimport Walker as CWalker, BiasedWalker as CBiasedWalker
-from necpp cimport WindowSampling, SkipSampling
+from necpp cimport Graph as CGraph, CSRGraph as CCSRGraph
+from necpp cimport ParallelWalker as CParallelWalker, Walker as CWalker, BiasedWalker as CBiasedWalker
+from necpp cimport AliasWalker as CAliasWalker, BiasedAliasWalker as CBiasedAliasWalker
+from necpp cimport SequenceView, WindowSampling, SkipSampling, WindowIterator as CWindowIterator
+from necpp cimport NegativeSampler as CNegativeSampler
+from necpp cimport TrainSkipGram
 from necpp cimport ACOWalk
+from necpp cimport CollapseEdgesAndStars, FindRoot, UnionEdges, ComponentLabels
+from necpp cimport Node, NodeList
 
+import itertools
+
+import numpy as np
 import networkx as nx
 
+def new_walks(size_t num_walks, size_t walk_length):
+    '''
+    Uninitialized (num_walks, walk_length+1) int32 array the walkers fill in place
+    '''
+    return np.empty((num_walks, walk_length+1), dtype=np.int32)
+
+def flatten_sequences(sequences):
+    '''
+    RETURN (nodes, offsets) with sequence i stored in nodes[offsets[i]:offsets[i+1]]
+    sequences is either a 2d walk array, a list of node lists or already flat,
+    i.e. has nodes and offsets arrays like a memory-mapped WalkCorpus, which
+    is then used in place
+    '''
+    if hasattr(sequences, 'nodes') and hasattr(sequences, 'offsets'):
+        return np.ascontiguousarray(sequences.nodes, dtype=np.int32), np.ascontiguousarray(sequences.offsets, dtype=np.int64)
+    if isinstance(sequences, np.ndarray):
+        nodes = np.ascontiguousarray(sequences, dtype=np.int32)
+        offsets = np.arange(nodes.shape[0]+1, dtype=np.int64)*nodes.shape[1]
+        return nodes.reshape(-1), offsets
+    offsets = np.zeros(len(sequences)+1, dtype=np.int64)
+    np.cumsum([len(seq) for seq in sequences], out=offsets[1:])
+    nodes = np.fromiter(itertools.chain.from_iterable(sequences), dtype=np.int32, count=offsets[len(sequences)])
+    return nodes, offsets
+
+cdef SequenceView make_sequence_view(const Node[::1] nodes, const int64_t[::1] offsets):
+    cdef SequenceView view
+    view.nodes = &nodes[0] if nodes.shape[0] > 0 else NULL
+    view.offsets = &offsets[0]
+    view.num_sequences = offsets.shape[0]-1
+    return view
+
+cdef pairs_to_array(const NodeList & pairs):
+    samples = np.empty((pairs.size()//2, 2), dtype=np.int32)
+    cdef Node[:, ::1] buffer = samples
+    if pairs.size() > 0:
+        memcpy(&buffer[0, 0], pairs.data(), pairs.size()*sizeof(Node))
+    return samples
+
 cdef class Graph:
     cdef CGraph c_graph
 
@@ -31,11 +80,160 @@ cdef class Graph:
     def remove_edge(self, u, v, weight):
         self.c_graph.RemoveEdge(u, v)
 
-cdef class Walker:
+    def freeze(self):
+        return CSRGraph.from_graph(self)
+
+cdef class CSRGraph:
+    cdef CCSRGraph c_graph
+
+    @staticmethod
+    def from_graph(Graph graph):
+        g = CSRGraph()
+        g.c_graph = CCSRGraph(graph.c_graph)
+        return g
+
+    @staticmethod
+    def from_nx_graph(graph):
+        return CSRGraph.from_graph(Graph.from_nx_graph(graph))
+
+    @staticmethod
+    def from_scipy(matrix):
+        '''
+        CSRGraph of a symmetric scipy sparse adjacency matrix without
+        building an intermediate Graph; nodes without edges are left out
+        '''
+        matrix = matrix.tocsr(copy=True)
+        matrix.sum_duplicates()
+        cdef const size_t[::1] offsets = np.ascontiguousarray(matrix.indptr, dtype=np.uintp)
+        cdef const Node[::1] targets = np.ascontiguousarray(matrix.indices, dtype=np.int32)
+        cdef const double[::1] weights = np.ascontiguousarray(matrix.data, dtype=np.float64)
+        g = CSRGraph()
+        g.c_graph = CCSRGraph(
+            matrix.shape[0], &offsets[0],
+            &targets[0] if targets.shape[0] > 0 else NULL,
+            &weights[0] if weights.shape[0] > 0 else NULL,
+        )
+        return g
+
+    def __cinit__(self):
+        self.c_graph = CCSRGraph()
+
+    def thaw(self):
+        g = Graph()
+        g.c_graph = self.c_graph.ToGraph()
+        return g
+
+    def has_edge(self, u, v):
+        return self.c_graph.has_edge(u, v)
+
+    def weight(self, u, v):
+        return self.c_graph.weight(u, v)
+
+    def degree(self, u):
+        return self.c_graph.degree(u)
+
+    def number_of_nodes(self):
+        return self.c_graph.number_of_nodes()
+
+    def number_of_edges(self):
+        return self.c_graph.number_of_edges()
+
+    def edges(self):
+        cdef Node u
+        cdef size_t i, j
+        cdef const NodeList * nodes = &self.c_graph.nodes()
+        cdef const vector[size_t] * offsets = &self.c_graph.offsets()
+        cdef const NodeList * targets = &self.c_graph.targets()
+        cdef const vector[double] * weights = &self.c_graph.edge_weights()
+        edges = []
+        for j in range(nodes.size()):
+            u = nodes[0][j]
+            for i in range(offsets[0][u], offsets[0][u+1]):
+                if u < targets[0][i]:
+                    edges.append((u, targets[0][i], weights[0][i]))
+        return edges
+
+    def csr_arrays(self):
+        '''
+        RETURN copies of the (offsets, targets, weights) arrays, both
+        directions of every edge included
+        '''
+        cdef const vector[size_t] * offsets = &self.c_graph.offsets()
+        cdef const NodeList * targets = &self.c_graph.targets()
+        cdef const vector[double] * weights = &self.c_graph.edge_weights()
+        indptr = np.empty(offsets.size(), dtype=np.uintp)
+        dst = np.empty(targets.size(), dtype=np.int32)
+        weight = np.empty(weights.size(), dtype=np.float64)
+        cdef size_t[::1] indptr_view = indptr
+        cdef Node[::1] dst_view = dst
+        cdef double[::1] weight_view = weight
+        memcpy(&indptr_view[0], offsets.data(), offsets.size()*sizeof(size_t))
+        if targets.size() > 0:
+            memcpy(&dst_view[0], targets.data(), targets.size()*sizeof(Node))
+            memcpy(&weight_view[0], weights.data(), weights.size()*sizeof(double))
+        return indptr, dst, weight
+
+    def edge_arrays(self):
+        '''
+        RETURN (src, dst, weight) arrays holding every edge once, src < dst
+        '''
+        indptr, dst, weight = self.csr_arrays()
+        src = np.repeat(np.arange(len(indptr)-1, dtype=np.int32), np.diff(indptr).astype(np.int64))
+        keep = src < dst
+        return src[keep], dst[keep], weight[keep]
+
+cdef class ParallelWalker:
+    '''
+    Walk methods shared by the walkers below, each pointing walker at the
+    C++ walker it owns
+    '''
+    cdef CParallelWalker * walker
+
+    def simulate_walk(self, size_t start_node, size_t walk_length):
+        return self.walker.SimulateWalk(start_node, walk_length)
+
+    def walk(self, size_t num_walks, size_t walk_length, size_t num_threads):
+        return self.walk_nodes(num_walks, walk_length, num_threads, 0, self.walker.get_node_list().size())
+
+    def number_of_start_nodes(self):
+        return self.walker.get_node_list().size()
+
+    def walk_nodes(self, size_t num_walks, size_t walk_length, size_t num_threads, size_t first_node, size_t last_node):
+        '''
+        walk() restricted to the start nodes [first_node, last_node) of the node list
+        '''
+        last_node = min(last_node, self.walker.get_node_list().size())
+        first_node = min(first_node, last_node)
+        walks = new_walks((last_node-first_node)*num_walks, walk_length)
+        cdef Node[:, ::1] buffer = walks
+        if buffer.shape[0] > 0:
+            with nogil:
+                self.walker.Walk(num_walks, walk_length, num_threads, &buffer[0, 0], first_node, last_node)
+        return walks
+
+    def walk_from(self, start_nodes, size_t walk_length, size_t num_threads):
+        '''
+        One walk from each of start_nodes, raising IndexError for a node
+        outside the graph and ValueError for one without neighbors
+        '''
+        start_nodes = np.asarray(start_nodes)
+        if start_nodes.size > 0 and start_nodes.max() > np.iinfo(np.int32).max:
+            raise IndexError('node not found')
+        cdef const Node[::1] starts = np.ascontiguousarray(start_nodes, dtype=np.int32)
+        walks = new_walks(starts.shape[0], walk_length)
+        cdef Node[:, ::1] buffer = walks
+        if buffer.shape[0] > 0:
+            self.walker.CheckStartNodes(&starts[0], starts.shape[0])
+            with nogil:
+                self.walker.WalkFrom(&starts[0], starts.shape[0], walk_length, num_threads, &buffer[0, 0])
+        return walks
+
+cdef class Walker(ParallelWalker):
     cdef CWalker c_walker
 
     def __cinit__(self):
         self.c_walker = CWalker()
+        self.walker = &self.c_walker
 
     def set_node_list(self, list nodes):
         self.c_walker.set_node_list(nodes)
@@ -43,38 +241,268 @@ cdef class Walker:
     def set_transition_weights(self, int node, list neighbors, list weights):
         self.c_walker.SetTransitionWeights(node, neighbors, weights)
 
-    def init_distributions_from_graph(self, Graph graph, bint weighted):
-        self.c_walker.InitDistributionsFromGraph(graph.c_graph, weighted)
-    
-    def simulate_walk(self, size_t start_node, size_t walk_length):
-        return self.c_walker.SimulateWalk(start_node, walk_length)
+    def init_distributions_from_graph(self, graph, bint weighted):
+        if isinstance(graph, CSRGraph):
+            self.c_walker.InitDistributionsFromGraph((<CSRGraph>graph).c_graph, weighted)
+        else:
+            self.c_walker.InitDistributionsFromGraph((<Graph>graph).c_graph, weighted)
 
-    def walk(self, size_t num_walks, size_t walk_length, size_t num_threads):
-        return self.c_walker.Walk(num_walks, walk_length, num_threads)
-
-cdef class BiasedWalker:
+cdef class BiasedWalker(ParallelWalker):
     cdef CBiasedWalker c_walker
 
     def __cinit__(self):
         self.c_walker = CBiasedWalker()
+        self.walker = &self.c_walker
 
-    def init_distributions_from_graph(self, Graph graph, double p, double q):
-        self.c_walker.InitDistributionsFromGraph(graph.c_graph, p, q)
-    
-    def simulate_walk(self, size_t start_node, size_t walk_length):
-        return self.c_walker.SimulateWalk(start_node, walk_length)
+    def init_distributions_from_graph(self, graph, double p, double q):
+        if isinstance(graph, CSRGraph):
+            self.c_walker.InitDistributionsFromGraph((<CSRGraph>graph).c_graph, p, q)
+        else:
+            self.c_walker.InitDistributionsFromGraph((<Graph>graph).c_graph, p, q)
 
-    def walk(self, size_t num_walks, size_t walk_length, size_t num_threads):
-        return self.c_walker.Walk(num_walks, walk_length, num_threads)
+cdef class AliasWalker(ParallelWalker):
+    cdef CAliasWalker c_walker
+
+    def __cinit__(self):
+        self.c_walker = CAliasWalker()
+        self.walker = &self.c_walker
+
+    def init_distributions_from_graph(self, graph, bint weighted):
+        if isinstance(graph, CSRGraph):
+            self.c_walker.InitDistributionsFromGraph((<CSRGraph>graph).c_graph, weighted)
+        else:
+            self.c_walker.InitDistributionsFromGraph((<Graph>graph).c_graph, weighted)
+
+    def set_edge_weights(self, weights, size_t num_threads):
+        '''
+        Reweight the transitions in place, weights aligned with the directed
+        edge order of the CSRGraph given at init, rebuilding only the
+        sampling tables
+        '''
+        cdef const double[::1] buffer = np.ascontiguousarray(weights, dtype=np.float64)
+        if buffer.shape[0] == 0:
+            self.c_walker.SetEdgeWeights(NULL, 0, num_threads)
+            return
+        with nogil:
+            self.c_walker.SetEdgeWeights(&buffer[0], buffer.shape[0], num_threads)
+
+cdef class BiasedAliasWalker(ParallelWalker):
+    cdef CBiasedAliasWalker c_walker
+
+    def __cinit__(self):
+        self.c_walker = CBiasedAliasWalker()
+        self.walker = &self.c_walker
+
+    def init_distributions_from_graph(self, graph, double p, double q, max_precompute_degree=None):
+        cdef size_t max_degree = <size_t>-1 if max_precompute_degree is None else max_precompute_degree
+        if isinstance(graph, CSRGraph):
+            self.c_walker.InitDistributionsFromGraph((<CSRGraph>graph).c_graph, p, q, max_degree)
+        else:
+            self.c_walker.InitDistributionsFromGraph((<Graph>graph).c_graph, p, q, max_degree)
+
+def window_sampling(sequences, size_t window_size, double down_sampling, bool shuffle):
+    nodes, offsets = flatten_sequences(sequences)
+    cdef SequenceView view = make_sequence_view(nodes, offsets)
+    cdef NodeList pairs
+    with nogil:
+        pairs = WindowSampling(view, window_size, down_sampling, shuffle)
+    return pairs_to_array(pairs)
+
+def skip_sampling(sequences, size_t distance, double down_sampling, bool shuffle):
+    nodes, offsets = flatten_sequences(sequences)
+    cdef SequenceView view = make_sequence_view(nodes, offsets)
+    cdef NodeList pairs
+    with nogil:
+        pairs = SkipSampling(view, distance, down_sampling, shuffle)
+    return pairs_to_array(pairs)
+
+cdef class WindowBatches:
+    '''
+    Iterator over (at most batch_size, 2) int32 arrays of the pairs window_sampling
+    would return, generated block_size pairs at a time
+    keep_probs: per node probability of surviving down-sampling, None keeps every node
+    '''
+    cdef CWindowIterator * c_iterator
+    cdef object nodes, offsets
+    cdef size_t batch_size
+
+    def __cinit__(self, sequences, size_t window_size, keep_probs, bool shuffle, size_t batch_size, size_t block_size=1<<20):
+        self.nodes, self.offsets = flatten_sequences(sequences)
+        self.batch_size = batch_size
+        cdef const double[::1] probs
+        cdef const double * probs_ptr = NULL
+        cdef size_t num_nodes = 0
+        if keep_probs is not None:
+            probs = np.ascontiguousarray(keep_probs, dtype=np.float64)
+            num_nodes = probs.shape[0]
+            if num_nodes > 0:
+                probs_ptr = &probs[0]
+        self.c_iterator = new CWindowIterator(make_sequence_view(self.nodes, self.offsets), window_size, probs_ptr, num_nodes, shuffle, block_size)
+
+    def __dealloc__(self):
+        del self.c_iterator
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        batch = np.empty((self.batch_size, 2), dtype=np.int32)
+        cdef Node[:, ::1] buffer = batch
+        cdef size_t num_pairs = 0
+        if self.batch_size > 0:
+            with nogil:
+                num_pairs = self.c_iterator.Next(&buffer[0, 0], self.batch_size)
+        if num_pairs == 0:
+            raise StopIteration
+        return batch[:num_pairs]
+
+    def fill(self, out):
+        '''
+        Write the next at most len(out) pairs into the (n, 2) int32 array out
+        RETURN number of pairs written, 0 once exhausted
+        '''
+        cdef Node[:, ::1] buffer = out
+        if buffer.shape[1] != 2:
+            raise ValueError('out must have two columns')
+        cdef size_t num_pairs = 0
+        if buffer.shape[0] > 0:
+            with nogil:
+                num_pairs = self.c_iterator.Next(&buffer[0, 0], buffer.shape[0])
+        return num_pairs
+
+    @property
+    def sequences_done(self):
+        return self.c_iterator.sequences_done()
+
+    @property
+    def num_sequences(self):
+        return self.c_iterator.num_sequences()
+
+cdef class NegativeSampler:
+    '''
+    Draws nodes with probability proportional to weights in O(1) per sample
+    '''
+    cdef CNegativeSampler * c_sampler
+    cdef readonly size_t num_nodes
+
+    def __cinit__(self, weights):
+        cdef const double[::1] w = np.ascontiguousarray(weights, dtype=np.float64)
+        if w.shape[0] == 0:
+            raise ValueError('weights must not be empty')
+        self.num_nodes = w.shape[0]
+        self.c_sampler = new CNegativeSampler(&w[0], w.shape[0])
+
+    def __dealloc__(self):
+        del self.c_sampler
+
+    def sample(self, size_t size, out=None):
+        '''
+        RETURN size samples as int32, written into out when given
+        '''
+        if out is None:
+            out = np.empty(size, dtype=np.int32)
+        cdef Node[::1] buffer = out
+        if <size_t>buffer.shape[0] < size:
+            raise ValueError('out is smaller than size')
+        if size > 0:
+            with nogil:
+                self.c_sampler.Sample(&buffer[0], size)
+        return out
+
+def train_skipgram(sequences, embeddings, contexts, NegativeSampler negatives, size_t negative, size_t window_size, keep_probs,
+        double start_learning_rate, double end_learning_rate, size_t num_threads):
+    '''
+    Trains skip-gram with negative sampling over the pairs window_sampling would
+    produce, updating the float32 (number of nodes, dimension) embeddings and
+    contexts in place with num_threads threads and the GIL released
+    the learning rate decays linearly from start_learning_rate to end_learning_rate
+    keep_probs: per node probability of surviving down-sampling, None keeps every node
+    '''
+    nodes, offsets = flatten_sequences(sequences)
+    cdef float[:, ::1] emb = embeddings
+    cdef float[:, ::1] ctx = contexts
+    if emb.shape[0] != ctx.shape[0] or emb.shape[1] != ctx.shape[1]:
+        raise ValueError('embeddings and contexts differ in shape')
+    if negatives.num_nodes > <size_t>emb.shape[0] or (nodes.shape[0] > 0 and nodes.max() >= emb.shape[0]):
+        raise ValueError('node out of range of the embeddings')
+    cdef const double[::1] probs
+    cdef const double * probs_ptr = NULL
+    cdef size_t num_nodes = 0
+    if keep_probs is not None:
+        probs = np.ascontiguousarray(keep_probs, dtype=np.float64)
+        num_nodes = probs.shape[0]
+        if num_nodes > 0:
+            probs_ptr = &probs[0]
+    cdef SequenceView view = make_sequence_view(nodes, offsets)
+    if emb.shape[0] == 0 or view.num_sequences == 0:
+        return
+    with nogil:
+        TrainSkipGram(view, &emb[0, 0], &ctx[0, 0], emb.shape[1], negatives.c_sampler[0], negative, window_size, probs_ptr, num_nodes,
+            start_learning_rate, end_learning_rate, num_threads)
+
+def aco_walk(graph, size_t num_walks, size_t max_step, size_t walk_length, size_t num_iterations, double alpha, double evaporate, size_t num_threads):
+    '''
+    RETURN (src, dst, pheromone) arrays over the edges of graph, src < dst
+    '''
+    if not isinstance(graph, CSRGraph):
+        graph = (<Graph>graph).freeze()
+    cdef CSRGraph source = graph
+    cdef CSRGraph g = CSRGraph()
+    with nogil:
+        g.c_graph = ACOWalk(source.c_graph, num_walks, max_step, walk_length, num_iterations, alpha, evaporate, num_threads)
+    return g.edge_arrays()
+
+def collapse_edges_and_stars(graph, size_t num_nodes, uint64_t seed):
+    '''
+    One HARP matching pass (edge then star collapsing) over a CSRGraph or Graph
+    RETURN int32 super node id of nodes 0..num_nodes-1
+    '''
+    if not isinstance(graph, CSRGraph):
+        graph = (<Graph>graph).freeze()
+    assignment = np.empty(num_nodes, dtype=np.int32)
+    cdef Node[::1] buffer = assignment
+    if num_nodes == 0:
+        return assignment
+    with nogil:
+        CollapseEdgesAndStars((<CSRGraph>graph).c_graph, num_nodes, seed, &buffer[0])
+    return assignment
 
-def window_sampling(list sequences, size_t window_size, double down_sampling, bool shuffle):
-    return WindowSampling(sequences, window_size, down_sampling, shuffle)
+def find_root(Node[::1] parent, Node u):
+    if u < 0 or u >= parent.shape[0]:
+        raise IndexError('node out of range')
+    return FindRoot(&parent[0], u)
 
-def skip_sampling(list sequences, size_t distance, double down_sampling, bool shuffle):
-    return SkipSampling(sequences, distance, down_sampling, shuffle)
+def union_edges(Node[::1] parent, uint8_t[::1] rank, u, v):
+    '''
+    Union by rank of every edge (u[i], v[i]) into the int32 parent and uint8
+    rank arrays of a disjoint set, in place
+    RETURN number of merges, i.e. how many components disappeared
+    '''
+    u = np.ascontiguousarray(u, dtype=np.int32)
+    v = np.ascontiguousarray(v, dtype=np.int32)
+    if u.shape != v.shape or u.ndim != 1:
+        raise ValueError('u and v must be 1d arrays of the same length')
+    if parent.shape[0] != rank.shape[0]:
+        raise ValueError('parent and rank differ in length')
+    if u.shape[0] == 0:
+        return 0
+    for nodes in (u, v):
+        if nodes.min() < 0 or nodes.max() >= parent.shape[0]:
+            raise IndexError('node out of range')
+    cdef const Node[::1] us = u
+    cdef const Node[::1] vs = v
+    cdef size_t num_unions
+    with nogil:
+        num_unions = UnionEdges(&parent[0], &rank[0], &us[0], &vs[0], us.shape[0])
+    return num_unions
 
-def aco_walk(Graph graph, size_t num_walks, size_t max_step, size_t num_iterations, double alpha, double evaporate, size_t num_threads):
-    g = ACOWalk(graph.c_graph, num_walks, max_step, num_iterations, alpha, evaporate, num_threads)
-    edges = g.edges()
-    phe = [(u, v, g.weight(u, v)) for u, v in edges]
-    return phe
\ No newline at end of file
+def component_labels(Node[::1] parent):
+    '''
+    RETURN int32 component id of every node, numbered by smallest node
+    '''
+    labels = np.empty(parent.shape[0], dtype=np.int32)
+    cdef Node[::1] buffer = labels
+    if parent.shape[0] > 0:
+        with nogil:
+            ComponentLabels(&parent[0], parent.shape[0], &buffer[0])
+    return labels
@@ -3,6 +3,7 @@ from libcpp.vector cimport vector
 from libcpp.utility cimport pair
 from libcpp.unordered_set cimport unordered_set
 from libcpp.unordered_map cimport unordered_map
+from libc.stdint cimport int64_t, uint64_t, uint8_t
 
 cdef extern from "cpp/graph.hpp" namespace "network_embedding" nogil:
     ctypedef int Node
@@ -73,25 +74,86 @@ cdef extern from "cpp/graph.hpp" namespace "network_embedding" nogil:
         size_t number_of_nodes()
         size_t number_of_edges()
         size_t degree(const Node& u)
+        bint has_edge(const Node& u, const Node& v)
+
+    cdef cppclass CSRGraph:
+        CSRGraph() except +
+        CSRGraph(const Graph& graph) except +
+        CSRGraph(size_t num_nodes, const size_t * offsets, const Node * targets, const double * weights) except +
+        CSRGraph(const CSRGraph& graph, const vector[double]& weights) except +
+        CSRGraph & operator=(const CSRGraph & g)
+        const NodeList& nodes()
+        size_t edge_index(const Node& u, const Node& v)
+        bint has_edge(const Node& u, const Node& v)
+        double weight(const Node& u, const Node& v) except +
+        const vector[size_t]& offsets()
+        const NodeList& targets()
+        const vector[double]& edge_weights()
+        size_t number_of_nodes()
+        size_t number_of_edges()
+        size_t number_of_directed_edges()
+        size_t degree(const Node& u) except +
+        Graph ToGraph()
 
 cdef extern from "cpp/walker.hpp" namespace "network_embedding" nogil:
-    cdef cppclass Walker:
+    cdef cppclass ParallelWalker:
+        const NodeList& get_node_list()
+        NodeList SimulateWalk(const Node& start_node, size_t walk_length)
+        vector[NodeList] Walk(size_t num_walks, size_t walk_length, size_t num_threads)
+        void Walk(size_t num_walks, size_t walk_length, size_t num_threads, Node * walks)
+        void Walk(size_t num_walks, size_t walk_length, size_t num_threads, Node * walks, size_t first_node, size_t last_node)
+        void WalkFrom(const Node * start_nodes, size_t num_starts, size_t walk_length, size_t num_threads, Node * walks)
+        void CheckStartNodes(const Node * start_nodes, size_t num_starts) except +
+
+    cdef cppclass Walker(ParallelWalker):
         Walker() except +
         void set_node_list(const NodeList& nodes)
         void SetTransitionWeights(const Node& node, const NodeList& neighbors, const vector[double]& weights)
         void InitDistributionsFromGraph(const Graph& graph, bint weighted)
-        NodeList SimulateWalk(const Node& start_node, size_t walk_length)
-        vector[NodeList] Walk(size_t num_walks, size_t walk_length, size_t num_threads)
-    
-    cdef cppclass BiasedWalker:
+        void InitDistributionsFromGraph(const CSRGraph& graph, bint weighted)
+
+    cdef cppclass BiasedWalker(ParallelWalker):
         BiasedWalker() except +
         void InitDistributionsFromGraph(const Graph& graph, double p, double q)
-        NodeList SimulateWalk(const Node& start_node, size_t walk_length)
-        vector[NodeList] Walk(size_t num_walks, size_t walk_length, size_t num_threads)
+        void InitDistributionsFromGraph(const CSRGraph& graph, double p, double q)
+
+    cdef cppclass AliasWalker(ParallelWalker):
+        AliasWalker() except +
+        void InitDistributionsFromGraph(const Graph& graph, bint weighted)
+        void InitDistributionsFromGraph(const CSRGraph& graph, bint weighted)
+        void SetEdgeWeights(const double * weights, size_t num_edges, size_t num_threads) except +
+
+    cdef cppclass BiasedAliasWalker(ParallelWalker):
+        BiasedAliasWalker() except +
+        void InitDistributionsFromGraph(const Graph& graph, double p, double q, size_t max_precompute_degree)
+        void InitDistributionsFromGraph(const CSRGraph& graph, double p, double q, size_t max_precompute_degree)
 
 cdef extern from "cpp/sampling.hpp" namespace "network_embedding" nogil:
-    vector[NodeList] WindowSampling(const vector[NodeList] & sequences, size_t window_size, double down_sampling, bool shuffle);
-    vector[NodeList] SkipSampling(const vector[NodeList] & sequences, size_t distance, double down_sampling, bool shuffle);
+    cdef cppclass SequenceView:
+        const Node * nodes
+        const int64_t * offsets
+        size_t num_sequences
+
+    NodeList WindowSampling(const SequenceView & sequences, size_t window_size, double down_sampling, bool shuffle)
+    NodeList SkipSampling(const SequenceView & sequences, size_t distance, double down_sampling, bool shuffle)
+
+    cdef cppclass WindowIterator:
+        WindowIterator(const SequenceView & sequences, size_t window_size, const double * keep_probs, size_t num_nodes, bool shuffle, size_t block_size) except +
+        size_t Next(Node * pairs, size_t max_pairs)
+        size_t sequences_done()
+        size_t num_sequences()
+
+    cdef cppclass NegativeSampler:
+        NegativeSampler(const double * weights, size_t num_nodes) except +
+        void Sample(Node * nodes, size_t size)
 
 cdef extern from "cpp/aco.hpp" namespace "network_embedding" nogil:
-    Graph ACOWalk(const Graph & graph, size_t num_walks, size_t max_step, size_t num_iterations, double alpha, double evaporate, size_t num_threads)
\ No newline at end of file
+    Graph ACOWalk(const Graph & graph, size_t num_walks, size_t max_step, size_t walk_length, size_t num_iterations, double alpha, double evaporate, size_t num_threads)
+    CSRGraph ACOWalk(const CSRGraph & graph, size_t num_walks, size_t max_step, size_t walk_length, size_t num_iterations, double alpha, double evaporate, size_t num_threads)
+cdef extern from "cpp/coarsening.hpp" namespace "network_embedding" nogil:
+    size_t CollapseEdgesAndStars(const CSRGraph & graph, size_t num_nodes, uint64_t seed, Node * assignment) except +
+    Node FindRoot(Node * parent, Node u)
+    size_t UnionEdges(Node * parent, uint8_t * rank, const Node * u, const Node * v, size_t num_edges)
+    size_t ComponentLabels(Node * parent, size_t num_nodes, Node * labels)
+cdef extern from "cpp/skipgram.hpp" namespace "network_embedding" nogil:
+    void TrainSkipGram(const SequenceView & sequences, float * embeddings, float * contexts, size_t dimension, const NegativeSampler & negatives, size_t negative, size_t window_size, const double * keep_probs, size_t num_nodes, double start_learning_rate, double end_learning_rate, size_t num_threads)
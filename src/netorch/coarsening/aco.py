@@ -1,5 +1,7 @@
 #coding:utf-8
 
+import multiprocessing as mp
+
 import numpy as np
 import networkx as nx
 
@@ -8,11 +10,11 @@ from .base import BaseCoarsening
 from util.data_structure import DisjoinSet
 from util.stackoverflow import find_best_trade_off
 
-from necython import Graph as CGraph, aco_walk
+from necython import CSRGraph, aco_walk
 
 class ACOCoarsening(BaseCoarsening):
 
-    def __init__(self, graph, threshold=0.2, window_size=10, num_walks=10, walk_length=80, phe_power=1., evapo_rate=0., iterations=1):
+    def __init__(self, graph, threshold=0.2, window_size=10, num_walks=10, walk_length=80, phe_power=1., evapo_rate=0., iterations=1, num_threads=mp.cpu_count()):
         super().__init__(graph, threshold)
         self.window_size = window_size
         self.num_walks = num_walks
@@ -20,18 +22,18 @@ class ACOCoarsening(BaseCoarsening):
         self.phe_power = phe_power
         self.evapo_rate = evapo_rate
         self.iterations = iterations
+        self.num_threads = num_threads
 
-    def merge(self, graph):
-        m_graph = CGraph.from_nx_graph(graph)
+    def merge_adjacency(self, adjacency):
+        m_graph = CSRGraph.from_scipy(adjacency)
 
-        edge_and_weights = aco_walk(m_graph, self.num_walks, self.window_size, self.iterations, self.phe_power, self.evapo_rate, 20)
-        edge_and_weights.sort(key=lambda item: item[2], reverse=True)
+        src, dst, weights = aco_walk(m_graph, self.num_walks, self.window_size, self.walk_length, self.iterations, self.phe_power, self.evapo_rate, self.num_threads)
+        order = np.argsort(-weights, kind='stable')
 
-        weights = np.array([item[2] for item in edge_and_weights])
-        trade_off_index = find_best_trade_off(weights)
+        trade_off_index = find_best_trade_off(weights[order])
+        selected = order[:trade_off_index+1]
 
-        ds = DisjoinSet(graph.number_of_nodes())
-        for u, v, weight in edge_and_weights[:trade_off_index+1]:
-            ds.union(u, v)
+        ds = DisjoinSet(adjacency.shape[0])
+        ds.union_all(src[selected], dst[selected])
 
-        return ds.make_mapping()
\ No newline at end of file
+        return ds.make_mapping()
@@ -1,22 +1,65 @@
 #coding:utf-8
+from itertools import chain
+
 import numpy as np
 import networkx as nx
-import pprint
-from scipy.sparse import coo_matrix
+import scipy.sparse as sp
+
+
+def adjacency_matrix(graph):
+    '''
+    RETURN symmetric scipy csr adjacency of a networkx graph whose nodes are 0..n-1
+    '''
+    n, m = graph.number_of_nodes(), graph.number_of_edges()
+    edges = np.fromiter(chain.from_iterable(graph.edges(data='weight', default=1.)), dtype=np.float64, count=3*m).reshape(-1, 3)
+    u, v = edges[:,0].astype(np.int32), edges[:,1].astype(np.int32)
+    loops = u==v
+    matrix = sp.csr_matrix(
+        (np.r_[edges[:,2], edges[~loops,2]], (np.r_[u, v[~loops]], np.r_[v, u[~loops]])),
+        shape=(n, n),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+def assignment_matrix(assignment, num_super_nodes):
+    '''
+    RETURN (n, num_super_nodes) csr P with P[node, assignment[node]] = 1
+    '''
+    n = len(assignment)
+    return sp.csr_matrix(
+        (np.ones(n), assignment, np.arange(n+1)),
+        shape=(n, num_super_nodes),
+    )
+
+def to_nx_graph(adjacency):
+    graph = nx.Graph()
+    graph.add_nodes_from(range(adjacency.shape[0]))
+    upper = sp.triu(adjacency, format='coo')
+    graph.add_weighted_edges_from(zip(upper.row.tolist(), upper.col.tolist(), upper.data.tolist()))
+    return graph
 
 
 class BaseCoarsening(object):
+    '''
+    Level i of the hierarchy is the csr matrix adjacencies[i]; assignments[i]
+    is the int32 vector mapping nodes of level i to their super nodes at
+    level i+1, and sizes[i] counts the original nodes behind every node
+    '''
 
     def __init__(self, graph, threshold=0.2, weighted=True):
-        nx.set_node_attributes(graph, 1, 'size')
         self.original_graph = graph
-        self.graphs = [graph]
-        self.mappings = [{node:[node] for node in graph.nodes}]
+        self.adjacencies = [adjacency_matrix(graph)]
+        self.assignments = []
+        self.sizes = [np.ones(graph.number_of_nodes(), dtype=np.int64)]
         self.threshold = threshold
         self.weighted = weighted
+        self._graphs = {0:graph}
 
     def merge(self, graph):
         '''
+        Former hook, still honoured when merge_adjacency is not overridden:
+        graph is the networkx graph of the current level, with a 'size'
+        attribute on every node
         RETURN merge result list of list
         example [
             [node1, node2],
@@ -26,18 +69,91 @@ class BaseCoarsening(object):
         '''
         raise NotImplementedError
 
+    def merge_adjacency(self, adjacency):
+        '''
+        adjacency: csr matrix of the current level
+        RETURN assignment, int32 super node id of every node, ids 0..k-1
+        '''
+        level = self.num_levels-1
+        graph = self.graph(level)
+        nx.set_node_attributes(graph, dict(enumerate(self.sizes[level].tolist())), 'size')
+        merge_result = self.merge(graph)
+        if isinstance(merge_result, np.ndarray) and merge_result.ndim==1:
+            return merge_result
+        return self.merge_result_to_assignment(merge_result, adjacency.shape[0])
+
+    @property
+    def num_levels(self):
+        return len(self.adjacencies)
+
+    def number_of_nodes(self, level):
+        return self.adjacencies[level].shape[0]
+
+    def number_of_edges(self, level):
+        adjacency = self.adjacencies[level]
+        return int(adjacency.nnz+np.count_nonzero(adjacency.diagonal()))//2
+
+    def graph(self, level):
+        '''
+        RETURN networkx graph of a level, built on first use
+        '''
+        if level not in self._graphs:
+            self._graphs[level] = to_nx_graph(self.adjacencies[level])
+        return self._graphs[level]
+
+    @property
+    def graphs(self):
+        '''
+        Read-only list of the level graphs, kept for the former API
+        '''
+        return [self.graph(level) for level in range(self.num_levels)]
+
+    @property
+    def mappings(self):
+        '''
+        Former per-level mappings {super_node:[nodes of the level below]},
+        the first one mapping every original node to itself
+        '''
+        mappings = [{node:[node] for node in self.original_graph.nodes}]
+        for assignment in self.assignments:
+            mappings.append(self.merge_result_to_mapping(self.assignment_to_merge_result(assignment)))
+        return mappings
+
     def make_mappings_to_original_graph(self):
-        mappings_orig = [self.mappings[0]]
-        for mapping in self.mappings[1:]:
-            mappings_orig.append(self.extend_mapping(mappings_orig[-1], mapping))
+        '''
+        RETURN for every level the int32 vector mapping original nodes to
+        their super nodes at that level
+        '''
+        mappings_orig = [np.arange(self.number_of_nodes(0), dtype=np.int32)]
+        for assignment in self.assignments:
+            mappings_orig.append(assignment[mappings_orig[-1]])
         return mappings_orig
 
-    def reverse_mapping(self, mapping):
-        return {node:super_node for super_node, nodes in mapping.items() for node in nodes}
+    def merge_result_to_assignment(self, merge_result, num_nodes):
+        '''
+        merge_result: list of node groups, e.g. [[node1, node2], [node3], ...]
+        RETURN int32 assignment numbering the groups in order
+        '''
+        lengths = np.fromiter(map(len, merge_result), dtype=np.int64, count=len(merge_result))
+        nodes = np.fromiter((node for nodes in merge_result for node in nodes), dtype=np.int64, count=lengths.sum())
+        assignment = np.empty(num_nodes, dtype=np.int32)
+        assignment[nodes] = np.repeat(np.arange(len(merge_result), dtype=np.int32), lengths)
+        return assignment
+
+    def assignment_to_merge_result(self, assignment):
+        '''
+        RETURN list of node groups, one per super node, nodes in ascending order
+        '''
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.cumsum(np.bincount(assignment))[:-1]
+        return [nodes.tolist() for nodes in np.split(order, bounds)]
 
     def merge_result_to_mapping(self, merge_result):
         return dict(enumerate(merge_result))
 
+    def reverse_mapping(self, mapping):
+        return {node:super_node for super_node, nodes in mapping.items() for node in nodes}
+
     def extend_mapping(self, mapping_last, mapping_current):
         extended_mapping = {super_node:[] for super_node in mapping_current}
         for super_node, nodes in mapping_current.items():
@@ -45,48 +161,30 @@ class BaseCoarsening(object):
                 extended_mapping[super_node].extend(mapping_last[node])
         return extended_mapping
 
-
-    def gen_merged_graph(self, graph, merge_result):
-        rev_mapping = {node:super_node for super_node, nodes in enumerate(merge_result) for node in nodes}
-        num_new_nodes = len(merge_result)
-        rows, cols, vals = [], [], []
-        for u, v in graph.edges:
-            su = rev_mapping[u]
-            sv = rev_mapping[v]
-            if su==sv:
-                continue
-            w = graph[u][v]['weight']
-            rows.append(su)
-            cols.append(sv)
-            rows.append(sv)
-            cols.append(su)
-            vals.append(w)
-            vals.append(w)
-        new_graph = nx.from_scipy_sparse_matrix(
-            coo_matrix(
-                (vals, (rows, cols)),
-                shape=(num_new_nodes, num_new_nodes),
-            ).tocsr()
-        )
+    def gen_merged_graph(self, adjacency, assignment):
+        '''
+        RETURN csr adjacency P^T A P of the super nodes, self loops removed
+        '''
+        p = assignment_matrix(assignment, int(assignment.max())+1)
+        merged = (p.T.tocsr() @ adjacency @ p).tocsr()
+        merged.setdiag(0)
+        merged.eliminate_zeros()
         if not self.weighted:
-            nx.set_edge_attributes(new_graph, 1.0, 'weight')
-
-        for super_node, nodes in enumerate(merge_result):
-            sum_size = np.sum([graph.nodes[node]['size'] for node in nodes])
-            new_graph.nodes[super_node]['size'] = sum_size
-        
-        return new_graph
+            merged.data[:] = 1.
+        return merged
 
     def recursive_merge(self):
         edge_threshold = self.original_graph.number_of_edges()*self.threshold
         node_threshold = self.original_graph.number_of_nodes()*self.threshold
         while True:
-            cur_graph = self.graphs[-1]
-            merge_result = self.merge(cur_graph)
-            if len(merge_result)==cur_graph.number_of_nodes(): # no edge in the graph
+            adjacency = self.adjacencies[-1]
+            assignment = np.asarray(self.merge_adjacency(adjacency), dtype=np.int32)
+            num_super_nodes = int(assignment.max())+1 if len(assignment) else 0
+            if num_super_nodes==adjacency.shape[0]: # no edge in the graph
                 break
-            new_graph = self.gen_merged_graph(cur_graph, merge_result)
-            self.graphs.append(new_graph)
-            self.mappings.append(self.merge_result_to_mapping(merge_result))
-            if new_graph.number_of_nodes()<node_threshold or new_graph.number_of_edges()<edge_threshold:
+            self.adjacencies.append(self.gen_merged_graph(adjacency, assignment))
+            self.assignments.append(assignment)
+            self.sizes.append(np.bincount(assignment, weights=self.sizes[-1], minlength=num_super_nodes).astype(np.int64))
+            level = self.num_levels-1
+            if self.number_of_nodes(level)<node_threshold or self.number_of_edges(level)<edge_threshold:
                 break
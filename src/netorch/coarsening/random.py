@@ -1,44 +1,21 @@
 #coding:utf-8
-import random
-
-import networkx as nx
+import numpy as np
 
 from .base import BaseCoarsening
 
+from necython import CSRGraph, collapse_edges_and_stars
+
 class RandomCoarsening(BaseCoarsening):
+    '''
+    HARP coarsening: edge collapsing then star collapsing at every level,
+    done natively; seed makes the hierarchy reproducible
+    '''
 
-    def __init__(self, graph, threshold=0.2, weighted=False):
+    def __init__(self, graph, threshold=0.2, weighted=False, seed=None):
         super().__init__(graph, threshold, weighted)
+        self.rng = np.random.RandomState(seed)
 
-    def star_collapsing(self, graph, merge_result, merged_nodes):
-        nodes = list(graph.nodes)
-        random.shuffle(nodes)
-        for node in nodes:
-            star_neighbors = [neighbor for neighbor in graph.neighbors(node) if neighbor not in merged_nodes]
-            random.shuffle(star_neighbors)
-            cnt = len(star_neighbors)//2
-            merge = list(zip(star_neighbors[:cnt], star_neighbors[cnt:]))
-            for u, v in merge:
-                merged_nodes.add(u)
-                merged_nodes.add(v)
-            merge_result.extend(merge)
-
-    def edge_collapsing(self, graph, merge_result, merged_nodes):
-        edges = list(graph.edges)
-        random.shuffle(edges)
-        for u, v in edges:
-            if u in merged_nodes or v in merged_nodes:
-                continue
-            merged_nodes.add(u)
-            merged_nodes.add(v)
-            merge_result.append((u, v))
-
-    def merge(self, graph):
-        merged_nodes = set()
-        merge_result = []
-        self.edge_collapsing(graph, merge_result, merged_nodes)
-        self.star_collapsing(graph, merge_result, merged_nodes)
-        for node in graph.nodes:
-            if node not in merged_nodes:
-                merge_result.append((node,))
-        return merge_result
+    def merge_adjacency(self, adjacency):
+        m_graph = CSRGraph.from_scipy(adjacency)
+        seed = self.rng.randint(np.iinfo(np.int64).max, dtype=np.int64)
+        return collapse_edges_and_stars(m_graph, adjacency.shape[0], seed)
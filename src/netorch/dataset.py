@@ -2,31 +2,134 @@
 
 #coding:utf-8
 
+import os
+import numpy as np
 import networkx as nx
 
-def load_edgelist(file_name):
-    graph = nx.Graph()
-    edges = []
-    with open(file_name) as file:
-        for line in file:
-            if line.startswith('#'):
-                continue
-            l = line.strip().split()
-            if len(l)==2:
-                u, v = l
-                edges.append((u, v, 1))
-            else:
-                u, v, weight = l
-                edges.append((u, v, float(weight)))
+from util.embedding_io import (
+    embedding_matrix, save_embedding_npy, load_embedding_npy,
+    save_word2vec_binary, load_word2vec_binary,
+)
 
-    for u, v, weight in edges:
-        if not graph.has_edge(u, v):
-            graph.add_edge(u, v, weight=weight)
-        else:
-            graph[u][v]['weight'] += weight
+# bytes parsed at once when turning tokens into fixed width strings
+_CHUNK_SIZE = 1<<20
+
+def _tokens(buf, starts, ends):
+    '''
+    RETURN the tokens buf[starts[i]:ends[i]] as a fixed width bytes array
+    '''
+    width = max(int(np.max(ends-starts)), 1) if len(starts) else 1
+    tokens = np.empty(len(starts), dtype='S{}'.format(width))
+    view = tokens.view(np.uint8).reshape(len(starts), width)
+    columns = np.arange(width)
+    for first in range(0, len(starts), max(_CHUNK_SIZE//width, 1)):
+        last = min(first+max(_CHUNK_SIZE//width, 1), len(starts))
+        index = starts[first:last,None]+columns
+        inside = index<ends[first:last,None]
+        view[first:last] = np.where(inside, buf[np.minimum(index, len(buf)-1)], 0)
+    return tokens
+
+def parse_edgelist(file_name):
+    '''
+    Parse "u v [weight]" lines, skipping those starting with #, without a
+    python object per token
+    RETURN (nodes, src, dst, weight): node labels in order of first
+    appearance, int32 indices into them and float64 weights, with duplicate
+    and reversed edges merged by summing their weights
+    '''
+    buf = np.fromfile(file_name, dtype=np.uint8)
+    space = (buf==ord(' '))|(buf==ord('\t'))|(buf==ord('\n'))|(buf==ord('\r'))
+    starts = np.flatnonzero(~space & np.r_[True, space[:-1]])
+    ends = np.flatnonzero(~space & np.r_[space[1:], True])+1
 
+    newlines = np.flatnonzero(buf==ord('\n'))
+    line_starts = np.r_[0, newlines+1]
+    line_starts = line_starts[line_starts<len(buf)]
+    comments = np.searchsorted(newlines, line_starts[buf[line_starts]==ord('#')])
+    line = np.searchsorted(newlines, starts)
+    keep = ~np.isin(line, comments)
+    starts, ends, line = starts[keep], ends[keep], line[keep]
+    if not len(line): # empty or comments only
+        return np.empty(0, dtype='U1'), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+    first = np.flatnonzero(np.r_[True, line[1:]!=line[:-1]])
+    counts = np.diff(np.r_[first, len(line)])
+    if np.any((counts<2)|(counts>3)):
+        raise ValueError('{}: every edge line needs 2 or 3 fields'.format(file_name))
+
+    ends_uv = np.stack([ends[first], ends[first+1]], axis=1).reshape(-1)
+    starts_uv = np.stack([starts[first], starts[first+1]], axis=1).reshape(-1)
+    tokens = _tokens(buf, starts_uv, ends_uv)
+    if tokens.dtype.itemsize<=8:
+        # short labels sort much faster packed into integers
+        keys = tokens.astype('S8').view('>u8').astype(np.uint64)
+    else:
+        keys = tokens
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # assigning in reverse leaves the first position of every label
+    first_seen = np.empty(inverse.max()+1 if len(inverse) else 0, dtype=np.int64)
+    first_seen[inverse[::-1]] = np.arange(len(inverse)-1, -1, -1)
+    order = np.argsort(first_seen)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    ids = rank[inverse].reshape(-1, 2)
+    nodes = np.char.decode(tokens[first_seen[order]], 'utf-8')
+
+    weight = np.ones(len(first), dtype=np.float64)
+    weighted = np.flatnonzero(counts==3)
+    if len(weighted):
+        weight[weighted] = _tokens(buf, starts[first[weighted]+2], ends[first[weighted]+2]).astype(np.float64)
+
+    num_nodes = len(nodes)
+    keys = np.minimum(ids[:,0], ids[:,1])*num_nodes+np.maximum(ids[:,0], ids[:,1])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    weight = np.bincount(inverse.reshape(-1), weights=weight, minlength=len(keys))
+    src = (keys//max(num_nodes, 1)).astype(np.int32)
+    dst = (keys%max(num_nodes, 1)).astype(np.int32)
+    return nodes, src, dst, weight
+
+def edgelist_cache_files(file_name, cache_dir=None):
+    if cache_dir is not None:
+        file_name = os.path.join(cache_dir, os.path.basename(file_name))
+    return ['{}.{}.npy'.format(file_name, key) for key in ('nodes', 'src', 'dst', 'weight')]
+
+def load_edge_arrays(file_name, cache=True):
+    '''
+    parse_edgelist with the result cached as .npy files next to file_name,
+    or in the directory cache when it is a path, which later calls
+    memory-map as long as they are newer than file_name; a cache that
+    cannot be written is skipped
+    RETURN (nodes, src, dst, weight)
+    '''
+    if not cache:
+        return parse_edgelist(file_name)
+    files = edgelist_cache_files(file_name, None if cache is True else cache)
+    source_time = os.path.getmtime(file_name)
+    if all(os.path.exists(f) and os.path.getmtime(f)>=source_time for f in files):
+        return tuple(np.load(f, mmap_mode='r') for f in files)
+
+    arrays = parse_edgelist(file_name)
+    for f, array in zip(files, arrays):
+        tmp = '{}.{}.tmp.npy'.format(f[:-4], os.getpid())
+        try:
+            np.save(tmp, array)
+            os.replace(tmp, f)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            break
+    return arrays
+
+def edge_arrays_to_graph(nodes, src, dst, weight):
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes.tolist())
+    graph.add_weighted_edges_from(zip(nodes[src].tolist(), nodes[dst].tolist(), weight.tolist()))
     return graph
 
+def load_edgelist(file_name, cache=True):
+    return edge_arrays_to_graph(*load_edge_arrays(file_name, cache))
+
 def save_embedding(embeddings, file_name):
     with open(file_name, 'w') as file:
         for key, val in embeddings.items():
@@ -44,8 +147,8 @@ def load_labels(file_name):
             labels[node] = [int(label) for label in l[1:]]
     return labels
 
-def load_dataset(dataset, dataset_dir='datasets'):
-    graph = load_edgelist('{}/{}_edgelist.txt'.format(dataset_dir, dataset))
+def load_dataset(dataset, dataset_dir='datasets', cache=True):
+    graph = load_edgelist('{}/{}_edgelist.txt'.format(dataset_dir, dataset), cache)
     labels = load_labels('{}/{}_labels.txt'.format(dataset_dir, dataset))
     return graph, labels
 
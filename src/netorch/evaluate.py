@@ -1,6 +1,9 @@
 #coding:utf-8
 
+import multiprocessing as mp
 import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.metrics import f1_score, accuracy_score
 from sklearn.preprocessing import MultiLabelBinarizer
@@ -10,7 +13,7 @@ from sklearn.model_selection import train_test_split
 
 import tqdm
 
-from openne.classify import Classifier
+from openne.classify import Classifier, top_k_indicator
 
 def openne_transform_label(labels):
     X = []
@@ -67,4 +70,216 @@ def evaluate(embeddings, labels, clf_ratio=0.5, classifier=None, seed=233):
     return {
         'macro_f1': result['macro_f1'],
         'micro_f1': result['micro_f1'],
-    }
\ No newline at end of file
+    }
+
+def label_matrices(embeddings, labels):
+    '''
+    RETURN (X, Y): features of the labelled nodes as one matrix and their
+    labels as a sparse 0/1 matrix with a column per label
+    '''
+    nodes = list(labels.keys())
+    X = np.stack([np.asarray(embeddings[node]) for node in nodes])
+    rows = np.repeat(np.arange(len(nodes)), [len(labels[node]) for node in nodes])
+    values = np.fromiter((label for node in nodes for label in labels[node]), dtype=np.int64, count=len(rows))
+    classes, cols = np.unique(values, return_inverse=True)
+    Y = sp.csr_matrix((np.ones(len(rows)), (rows, cols.reshape(-1))), shape=(len(nodes), len(classes)))
+    Y.sum_duplicates()
+    Y.data[:] = 1
+    return X, Y
+
+# matrices shared with the evaluation workers, which inherit them on fork
+_split_data = None
+
+def _init_split_worker(X, Y, classifier):
+    global _split_data
+    _split_data = (X, Y, classifier)
+
+def _split_job(job):
+    ratio, seed = job
+    X, Y, classifier = _split_data
+    order = np.random.RandomState(seed).permutation(X.shape[0])
+    train, test = order[:int(ratio*len(order))], order[int(ratio*len(order)):]
+
+    model = OneVsRestClassifier(clone(classifier))
+    model.fit(X[train], Y[train])
+    Y_test = Y[test]
+    top_k = np.asarray(Y_test.sum(axis=1)).reshape(-1)
+    Y_pred = top_k_indicator(model.predict_proba(X[test]), top_k)
+    return ratio, f1_score(Y_test, Y_pred, average='macro'), f1_score(Y_test, Y_pred, average='micro')
+
+def evaluate_splits(embeddings, labels, ratios=(.1, .2, .3, .4, .5, .6, .7, .8, .9), seeds=range(10), classifier=None, processes=None):
+    '''
+    Node classification over every (ratio, seed) split, run on a process
+    pool; like openne, each test node gets as many labels as it truly has
+    RETURN {ratio: {'macro_f1', 'macro_f1_std', 'micro_f1', 'micro_f1_std'}}
+    with the mean and standard deviation over seeds
+    '''
+    if classifier is None:
+        classifier = LogisticRegression()
+    X, Y = label_matrices(embeddings, labels)
+    jobs = [(ratio, seed) for ratio in ratios for seed in seeds]
+
+    with mp.get_context('fork').Pool(processes, initializer=_init_split_worker, initargs=(X, Y, classifier)) as pool:
+        scores = pool.map(_split_job, jobs, chunksize=1)
+
+    result = {}
+    for ratio in ratios:
+        macro_f1 = [macro for r, macro, micro in scores if r==ratio]
+        micro_f1 = [micro for r, macro, micro in scores if r==ratio]
+        result[ratio] = {
+            'macro_f1': float(np.mean(macro_f1)),
+            'macro_f1_std': float(np.std(macro_f1)),
+            'micro_f1': float(np.mean(micro_f1)),
+            'micro_f1_std': float(np.std(micro_f1)),
+        }
+    return result
+
+def edge_index_array(graph):
+    '''
+    graph: networkx graph, scipy sparse symmetric adjacency or CSRGraph
+    RETURN (m, 2) int64 array of the edges of graph as indices into
+    list(graph.nodes), or into the rows of the matrix
+    '''
+    if sp.issparse(graph):
+        upper = sp.triu(graph, format='coo')
+        return np.stack([upper.row, upper.col], axis=1).astype(np.int64)
+    if hasattr(graph, 'edge_arrays'):
+        src, dst, weight = graph.edge_arrays()
+        return np.stack([src, dst], axis=1).astype(np.int64)
+    # networkx only hands out edges one by one, large graphs are faster to
+    # pass as a matrix or CSRGraph
+    index = {node:i for i, node in enumerate(graph.nodes)}
+    edges = np.fromiter((index[x] for edge in graph.edges() for x in edge), dtype=np.int64, count=2*graph.number_of_edges())
+    return edges.reshape(-1, 2)
+
+def pair_keys(pairs, num_nodes):
+    '''
+    RETURN one int64 key per unordered pair
+    '''
+    return np.minimum(pairs[:,0], pairs[:,1])*num_nodes+np.maximum(pairs[:,0], pairs[:,1])
+
+def sorted_unique(keys):
+    '''
+    RETURN the distinct keys in increasing order, by sorting, which is much
+    faster than np.unique on large int64 arrays
+    '''
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:]!=keys[:-1]]] if len(keys) else keys
+
+def sample_negative_edges(num_nodes, edges, size, seed=0):
+    '''
+    RETURN (size, 2) distinct node pairs, no self loop, that are not in edges,
+    drawn in vectorized rounds checked against the sorted edge keys
+    '''
+    rng = np.random.RandomState(seed)
+    known = sorted_unique(pair_keys(edges, num_nodes))
+    if size > num_nodes*(num_nodes-1)//2-len(known):
+        raise ValueError('not enough non-edges to sample {} of them'.format(size))
+    negatives = np.empty(0, dtype=np.int64)
+    while len(negatives) < size:
+        pairs = rng.randint(0, num_nodes, (2*(size-len(negatives))+16, 2))
+        pairs = pairs[pairs[:,0]!=pairs[:,1]]
+        keys = sorted_unique(np.concatenate([negatives, pair_keys(pairs, num_nodes)]))
+        if len(known):
+            found = np.minimum(np.searchsorted(known, keys), len(known)-1)
+            keys = keys[known[found]!=keys]
+        negatives = keys
+    negatives = negatives[rng.permutation(len(negatives))[:size]]
+    return np.stack([negatives//num_nodes, negatives%num_nodes], axis=1)
+
+def split_edges(graph, test_ratio=.1, seed=0):
+    '''
+    Hold out test_ratio of the edges of graph for link prediction
+    graph: networkx graph or scipy sparse symmetric adjacency
+    RETURN (train_graph, test_edges, test_negatives): train_graph is of the
+    type of graph and keeps every node in the same order, the pairs index
+    list(graph.nodes) or the rows of the matrix and the negatives are as
+    many non-edges of graph
+    '''
+    edges = edge_index_array(graph)
+    num_nodes = graph.shape[0] if sp.issparse(graph) else graph.number_of_nodes()
+    rng = np.random.RandomState(seed)
+    test = rng.permutation(len(edges))[:int(test_ratio*len(edges))]
+    test_edges = edges[test]
+    test_negatives = sample_negative_edges(num_nodes, edges, len(test_edges), seed)
+
+    if sp.issparse(graph):
+        upper = sp.triu(graph, format='coo')
+        keep = np.ones(len(edges), dtype=bool)
+        keep[test] = False
+        u, v, weight = upper.row[keep], upper.col[keep], upper.data[keep]
+        loops = u==v
+        train_graph = sp.csr_matrix(
+            (np.r_[weight, weight[~loops]], (np.r_[u, v[~loops]], np.r_[v, u[~loops]])),
+            shape=graph.shape,
+        )
+        return train_graph, test_edges, test_negatives
+
+    nodes = np.fromiter(graph.nodes, dtype=object, count=num_nodes)
+    train_graph = graph.copy()
+    train_graph.remove_edges_from(nodes[test_edges].tolist())
+    return train_graph, test_edges, test_negatives
+
+def edge_features(embeddings, pairs, operator, batch_size=1<<18):
+    '''
+    RETURN per pair score ('dot') or feature vector ('hadamard'),
+    computed batch_size pairs at a time
+    '''
+    embeddings = np.asarray(embeddings)
+    if operator=='dot':
+        result = np.empty(len(pairs), dtype=embeddings.dtype)
+    elif operator=='hadamard':
+        result = np.empty((len(pairs), embeddings.shape[1]), dtype=embeddings.dtype)
+    else:
+        raise ValueError('unknown edge operator {}'.format(operator))
+    for first in range(0, len(pairs), batch_size):
+        u = np.take(embeddings, pairs[first:first+batch_size,0], axis=0)
+        v = np.take(embeddings, pairs[first:first+batch_size,1], axis=0)
+        if operator=='dot':
+            np.einsum('ij,ij->i', u, v, out=result[first:first+batch_size])
+        else:
+            np.multiply(u, v, out=result[first:first+batch_size])
+    return result
+
+def link_prediction(embeddings, test_edges, test_negatives, operator='dot', train_edges=None, train_negatives=None, classifier=None):
+    '''
+    embeddings: matrix indexed like the pairs
+    operator: 'dot' scores pairs by their inner product, 'hadamard' trains
+    classifier on the element-wise products of train_edges (positive) and
+    train_negatives and scores with its decision function
+    RETURN {'auc', 'ap'}
+    '''
+    pairs = np.concatenate([test_edges, test_negatives])
+    truth = np.r_[np.ones(len(test_edges)), np.zeros(len(test_negatives))]
+    if operator=='hadamard':
+        if train_edges is None or train_negatives is None:
+            raise ValueError('hadamard scoring needs train_edges and train_negatives')
+        if classifier is None:
+            classifier = LogisticRegression()
+        classifier.fit(
+            edge_features(embeddings, np.concatenate([train_edges, train_negatives]), operator),
+            np.r_[np.ones(len(train_edges)), np.zeros(len(train_negatives))],
+        )
+        scores = classifier.decision_function(edge_features(embeddings, pairs, operator))
+    else:
+        scores = edge_features(embeddings, pairs, operator)
+    return ranking_metrics(truth, scores)
+
+def ranking_metrics(truth, scores):
+    '''
+    RETURN {'auc', 'ap'} of scores against 0/1 truth, as roc_auc_score and
+    average_precision_score compute them but from a single sort
+    '''
+    order = np.argsort(-scores)
+    scores, truth = scores[order], truth[order]
+    # last position of every distinct score, ties form one threshold
+    thresholds = np.r_[np.flatnonzero(np.diff(scores)), len(scores)-1]
+    tps = np.cumsum(truth)[thresholds]
+    fps = thresholds+1-tps
+    tpr = np.r_[0, tps]/tps[-1]
+    fpr = np.r_[0, fps]/fps[-1]
+    precision = tps/(thresholds+1)
+    return {
+        'auc': float(np.sum(np.diff(fpr)*(tpr[1:]+tpr[:-1])/2)),
+        'ap': float(np.sum(np.diff(tpr)*precision)),
+    }
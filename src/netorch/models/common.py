@@ -1,24 +1,89 @@
 #coding:utf-8
 from math import sqrt
+import multiprocessing as mp
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 
+PRECISIONS = {
+    'fp32': torch.float,
+    'bf16': torch.bfloat16,
+    'fp16': torch.float16,
+}
+
+# low mantissa bits of a float32 that the narrower format drops
+_DROPPED_BITS = {
+    torch.bfloat16: 16,
+    torch.float16: 13,
+}
+
+# drawing fresh random bits costs more than the rest of a reduced precision
+# step, so rounding noise comes from a fixed pool of random int32 read at a
+# random offset and xor-ed with a random mask
+_NOISE_POOL_SIZE = 1<<22
+_noise_pools = {}
+
+def rounding_noise(size, bits, device):
+    '''
+    RETURN size random int32 uniform in [0, 2**bits)
+    '''
+    device = torch.device(device)
+    if size>_NOISE_POOL_SIZE:
+        return torch.randint(0, 1<<bits, (size,), dtype=torch.int32, device=device)
+    if device not in _noise_pools:
+        _noise_pools[device] = torch.randint(-(1<<31), 1<<31, (2*_NOISE_POOL_SIZE,), dtype=torch.int32, device=device)
+    offset, mask = np.random.randint(_NOISE_POOL_SIZE), np.random.randint(1<<31)
+    noise = _noise_pools[device][offset:offset+size]
+    return torch.bitwise_and(torch.bitwise_xor(noise, mask), (1<<bits)-1)
+
+def stochastic_round(x, dtype):
+    '''
+    RETURN float32 x rounded to dtype, up or down at random with probability
+    proportional to the distance, so updates smaller than the rounding step
+    still count in expectation
+    '''
+    bits = _DROPPED_BITS[dtype]
+    i = x.contiguous().view(torch.int32)
+    i = i + rounding_noise(i.numel(), bits, i.device).view(i.shape)
+    i = torch.bitwise_and(i, -(1<<bits))
+    return i.view(torch.float).to(dtype)
+
+def export_table(table, precision):
+    '''
+    RETURN table as a numpy array in precision, bf16 as uint16 bit patterns
+    since numpy has no bfloat16
+    '''
+    table = table.detach().cpu()
+    if precision=='bf16':
+        return table.to(torch.bfloat16).view(torch.int16).numpy().view(np.uint16)
+    return table.to(PRECISIONS[precision]).numpy()
+
+def new_table(num_nodes, dimension, device, sparse, precision):
+    dtype = PRECISIONS[precision]
+    table = nn.Embedding(num_nodes, dimension, sparse=sparse, device=device, dtype=dtype)
+    table.weight.data.normal_(0.0, 1./sqrt(dimension))
+    # reduced precision tables are updated by ModelIterator.reduced_precision_step
+    table.weight.requires_grad_(dtype==torch.float)
+    return table
+
 class SkipGramNS(nn.Module):
-    def __init__(self, num_nodes, dimension, device='cuda'):
+    def __init__(self, num_nodes, dimension, device='cuda', sparse=False, precision='fp32'):
         super().__init__()
         self.num_nodes = num_nodes
         self.dimension = dimension
         self.device = device
+        self.sparse = sparse
+        self.precision = precision
 
-        self.embeddings = nn.Embedding(self.num_nodes, self.dimension).to(device=device)
-        self.embeddings.weight.data.normal_(0.0, 1./sqrt(dimension))
-        self.contexts = nn.Embedding(self.num_nodes, self.dimension).to(device=device)
-        self.contexts.weight.data.normal_(0.0, 1./sqrt(dimension))
+        self.embeddings = new_table(self.num_nodes, self.dimension, device, sparse, precision)
+        self.contexts = new_table(self.num_nodes, self.dimension, device, sparse, precision)
 
     def forward(self, u, v, sign):
-        emb_u = self.embeddings(u)
-        ctx_v = self.contexts(v)
+        return self.loss(self.embeddings(u), self.contexts(v), sign)
+
+    @staticmethod
+    def loss(emb_u, ctx_v, sign):
         prod = torch.sum(torch.mul(emb_u, ctx_v), dim=1)
         prod = torch.mul(sign, prod)
         loss = torch.sum(nn.functional.logsigmoid(prod))
@@ -26,21 +91,22 @@ class SkipGramNS(nn.Module):
         return loss
 
 class TripletEmbedding(nn.Module):
-    def __init__(self, num_nodes, dimension, device='cuda'):
+    def __init__(self, num_nodes, dimension, device='cuda', sparse=False, precision='fp32'):
         super().__init__()
         self.num_nodes = num_nodes
         self.dimension = dimension
         self.device = device
+        self.sparse = sparse
+        self.precision = precision
 
-        self.embeddings = nn.Embedding(self.num_nodes, self.dimension).to(device=device)
-        self.embeddings.weight.data.normal_(0.0, 1./sqrt(dimension))
-        self.contexts = nn.Embedding(self.num_nodes, self.dimension).to(device=device)
-        self.contexts.weight.data.normal_(0.0, 1./sqrt(dimension))
+        self.embeddings = new_table(self.num_nodes, self.dimension, device, sparse, precision)
+        self.contexts = new_table(self.num_nodes, self.dimension, device, sparse, precision)
 
     def forward(self, u, v, w):
-        emb_u = self.embeddings(u)
-        ctx_v = self.contexts(v)
-        ctx_w = self.contexts(w)
+        return self.loss(self.embeddings(u), self.contexts(v), self.contexts(w))
+
+    @staticmethod
+    def loss(emb_u, ctx_v, ctx_w):
         pos_prod = torch.sum(torch.mul(emb_u, ctx_v), dim=1)
         neg_prod = torch.sum(torch.mul(emb_u, ctx_w), dim=1)
         loss = torch.sum(nn.functional.logsigmoid(pos_prod-neg_prod))
@@ -57,48 +123,221 @@ class ModelIterator(object):
     def lr_decay(self):
         self.scheduler.step()
 
-    def get_embeddings(self):
-        return self.model.embeddings.weight.data.cpu().numpy()
+    def lr_reset(self):
+        '''
+        Back to the initial learning rate, e.g. before training on new data
+        '''
+        for group, learning_rate in zip(self.optimizer.param_groups, self.scheduler.base_lrs):
+            group['lr'] = learning_rate
+        self.scheduler.last_epoch = 0
+
+    def reduced_precision_step(self, loss, *lookups):
+        '''
+        SGD step for reduced precision tables: lookups are (table, ids) pairs
+        with a table at most once; the touched rows are gathered in fp32, fed
+        to loss, updated and written back with stochastic rounding
+        '''
+        learning_rate = self.optimizer.param_groups[0]['lr']
+        rows = []
+        for table, ids in lookups:
+            nodes, inverse = torch.unique(ids, return_inverse=True)
+            weight = table.weight.data.index_select(0, nodes).float().requires_grad_()
+            rows.append((table, nodes, weight, inverse))
+        loss(*(weight.index_select(0, inverse) for table, nodes, weight, inverse in rows)).backward()
+        with torch.no_grad():
+            for table, nodes, weight, inverse in rows:
+                table.weight.data.index_copy_(0, nodes, stochastic_round(weight.add_(weight.grad, alpha=-learning_rate), table.weight.dtype))
+        # nothing left for the optimizer, stepping it keeps the scheduler in order
+        self.optimizer.step()
+
+    def get_embeddings(self, precision='fp32'):
+        '''
+        precision: 'fp32', 'fp16' or 'bf16' (as uint16 bit patterns)
+        '''
+        if precision=='fp32' and self.model.precision=='fp32':
+            return self.model.embeddings.weight.data.cpu().numpy()
+        return export_table(self.model.embeddings.weight.data, precision)
     
     def set_embeddings(self, emb):
         self.model.embeddings.weight.data.copy_(torch.from_numpy(emb).to(device=self.model.device))
 
-    def get_contexts(self):
-        return self.model.contexts.weight.data.cpu().numpy()
+    def get_contexts(self, precision='fp32'):
+        if precision=='fp32' and self.model.precision=='fp32':
+            return self.model.contexts.weight.data.cpu().numpy()
+        return export_table(self.model.contexts.weight.data, precision)
 
     def set_contexts(self, ctx):
         self.model.contexts.weight.data.copy_(torch.from_numpy(ctx).to(device=self.model.device))
 
 class NodeEmbedding(ModelIterator):
 
-    def __init__(self, num_nodes, dimension, learning_rate, device='cuda'):
-        model = SkipGramNS(num_nodes, dimension, device=device)
+    def __init__(self, num_nodes, dimension, learning_rate, device='cuda', sparse=False, precision='fp32'):
+        '''
+        sparse: only the rows of the nodes in a batch get gradients and
+        updates, so a step costs O(batch*dimension) instead of O(num_nodes*dimension)
+        precision: storage of the tables, 'fp32', 'bf16' or 'fp16'; reduced
+        precision halves their memory, always updates sparsely, computes in
+        fp32 and rounds stochastically on write back
+        '''
+        model = SkipGramNS(num_nodes, dimension, device=device, sparse=sparse, precision=precision)
         optimizer = optim.SGD(model.parameters(), lr=learning_rate)
         scheduler = optim.lr_scheduler.StepLR(optimizer, 1, gamma=0.9)
         super().__init__(model, optimizer, scheduler)
     
     def feed(self, u, v, sign):
         self.optimizer.zero_grad()
-        tu = torch.tensor(u, device=self.model.device, dtype=torch.long)
-        tv = torch.tensor(v, device=self.model.device, dtype=torch.long)
-        tsign = torch.tensor(sign, device=self.model.device, dtype=torch.float)
+        tu = torch.as_tensor(u, device=self.model.device, dtype=torch.long)
+        tv = torch.as_tensor(v, device=self.model.device, dtype=torch.long)
+        tsign = torch.as_tensor(sign, device=self.model.device, dtype=torch.float)
+        if self.model.precision!='fp32':
+            self.reduced_precision_step(
+                lambda emb_u, ctx_v: self.model.loss(emb_u, ctx_v, tsign),
+                (self.model.embeddings, tu),
+                (self.model.contexts, tv),
+            )
+            return
         loss = self.model(tu, tv, tsign)
         loss.backward()
         self.optimizer.step()
 
 class TripletNodeEmbedding(ModelIterator):
 
-    def __init__(self, num_nodes, dimension, learning_rate, device='cuda'):
-        model = TripletEmbedding(num_nodes, dimension, device=device)
+    def __init__(self, num_nodes, dimension, learning_rate, device='cuda', sparse=False, precision='fp32'):
+        model = TripletEmbedding(num_nodes, dimension, device=device, sparse=sparse, precision=precision)
         optimizer = optim.SGD(model.parameters(), lr=learning_rate)
         scheduler = optim.lr_scheduler.StepLR(optimizer, 1, gamma=0.9)
         super().__init__(model, optimizer, scheduler)
 
     def feed(self, u, v, w):
         self.optimizer.zero_grad()
-        tu = torch.tensor(u, device=self.model.device, dtype=torch.long)
-        tv = torch.tensor(v, device=self.model.device, dtype=torch.long)
-        tw = torch.tensor(w, device=self.model.device, dtype=torch.long)
+        tu = torch.as_tensor(u, device=self.model.device, dtype=torch.long)
+        tv = torch.as_tensor(v, device=self.model.device, dtype=torch.long)
+        tw = torch.as_tensor(w, device=self.model.device, dtype=torch.long)
+        if self.model.precision!='fp32':
+            # v and w share the contexts table, so they are gathered together
+            self.reduced_precision_step(
+                lambda emb_u, ctx_vw: self.model.loss(emb_u, *ctx_vw.split(len(tv))),
+                (self.model.embeddings, tu),
+                (self.model.contexts, torch.cat([tv, tw])),
+            )
+            return
         loss = self.model(tu, tv, tw)
         loss.backward()
         self.optimizer.step()
+
+def _hogwild_worker(model, batches, learning_rate, seed):
+    torch.set_num_threads(1)
+    # forked workers inherit the random state of the parent, reseed so each
+    # draws its own rounding noise
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    while True:
+        samples = batches.get()
+        if samples is None:
+            batches.task_done()
+            break
+        for group in model.optimizer.param_groups:
+            group['lr'] = learning_rate.value
+        model.feed(*samples)
+        batches.task_done()
+
+class Hogwild(object):
+    '''
+    Wraps a CPU NodeEmbedding or TripletNodeEmbedding so that fed batches are
+    trained by num_workers processes updating the shared tables without locks.
+    Best used with sparse=True, so each worker only writes the rows it touches.
+    Worker i is seeded with seed+i, seed being drawn at start when None.
+    Workers are forked, which needs a platform with the fork start method
+    and CUDA left uninitialized in the parent; close() or a with block
+    shuts them down.
+    '''
+
+    def __init__(self, model, num_workers=mp.cpu_count(), max_pending=None, seed=None):
+        if torch.device(model.model.device).type!='cpu':
+            raise ValueError('Hogwild training requires a cpu model')
+        if 'fork' not in mp.get_all_start_methods():
+            raise RuntimeError('Hogwild workers are forked, this platform has no fork start method')
+        self.model = model
+        self.num_workers = num_workers
+        self.max_pending = max_pending or 2*num_workers
+        self.seed = seed
+        self.model.model.share_memory()
+        self.workers = None
+
+    def start(self):
+        if torch.cuda.is_initialized():
+            raise RuntimeError('Hogwild cannot fork its workers once CUDA is initialized')
+        ctx = mp.get_context('fork')
+        self.batches = ctx.JoinableQueue(maxsize=self.max_pending)
+        self.learning_rate = ctx.Value('d', self.model.optimizer.param_groups[0]['lr'], lock=False)
+        seed = np.random.randint(1<<31) if self.seed is None else self.seed
+        self.workers = [
+            ctx.Process(target=_hogwild_worker, args=(self.model, self.batches, self.learning_rate, (seed+i)%(1<<32)), daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def synchronize(self):
+        '''
+        Wait until every fed batch has been applied
+        '''
+        if self.workers is not None:
+            self.batches.join()
+
+    def close(self, terminate=False):
+        '''
+        Stop the workers once the fed batches are applied, or at once
+        dropping them when terminate is set
+        '''
+        if self.workers is None:
+            return
+        if terminate:
+            for worker in self.workers:
+                worker.terminate()
+        else:
+            for worker in self.workers:
+                self.batches.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(terminate=exc_type is not None)
+
+    def feed(self, *samples):
+        if self.workers is None:
+            self.start()
+        # samples may view buffers the sampler reuses, hand workers copies
+        self.batches.put(tuple(np.array(s) for s in samples))
+
+    def lr_decay(self):
+        self.synchronize()
+        self.model.lr_decay()
+        if self.workers is not None:
+            self.learning_rate.value = self.model.optimizer.param_groups[0]['lr']
+
+    def lr_reset(self):
+        self.synchronize()
+        self.model.lr_reset()
+        if self.workers is not None:
+            self.learning_rate.value = self.model.optimizer.param_groups[0]['lr']
+
+    def get_embeddings(self, precision='fp32'):
+        self.synchronize()
+        return self.model.get_embeddings(precision)
+
+    def set_embeddings(self, emb):
+        self.synchronize()
+        self.model.set_embeddings(emb)
+
+    def get_contexts(self, precision='fp32'):
+        self.synchronize()
+        return self.model.get_contexts(precision)
+
+    def set_contexts(self, ctx):
+        self.synchronize()
+        self.model.set_contexts(ctx)
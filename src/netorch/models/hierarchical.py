@@ -5,6 +5,15 @@ import networkx as nx
 from sklearn.preprocessing import scale
 from sklearn.decomposition import PCA
 
+def prolong(prev_model, new_model, assignment):
+    '''
+    Initialize new_model with the embeddings and contexts prev_model learned
+    for the coarser graph, every node taking those of its super node
+    assignment: int array, super node in prev_model of each node of new_model
+    '''
+    new_model.set_embeddings(prev_model.get_embeddings()[assignment])
+    new_model.set_contexts(prev_model.get_contexts()[assignment])
+
 class ConcatPCAModel(object):
 
     def __init__(self, graph, dimension, Model, Coarsening, num_scales=4):
@@ -22,38 +31,37 @@ class ConcatPCAModel(object):
         dimension = self.dimension
 
         coarsening = self.Coarsening(self.original_graph)
-        if len(coarsening.graphs)==1:
+        if coarsening.num_levels==1:
             coarsening.recursive_merge()
 
-        graphs = coarsening.graphs
         mappings = coarsening.make_mappings_to_original_graph()
 
         prev_nodes = None
         indices = []
-        for i, g in enumerate(graphs):
-            if prev_nodes is None or g.number_of_nodes()<prev_nodes*0.97:
+        for i in range(coarsening.num_levels):
+            num_nodes = coarsening.number_of_nodes(i)
+            if prev_nodes is None or num_nodes<prev_nodes*0.97:
                 indices.append(i)
-                prev_nodes = g.number_of_nodes()
+                prev_nodes = num_nodes
 
         num_scales = min(len(indices), self.num_scales)
         step = len(indices)/num_scales
         selected_indices = [int(np.ceil(i*step)) for i in range(num_scales)]
         selected_indices = [indices[i] for i in selected_indices]
 
-        train_graphs = [graphs[index] for index in selected_indices]
+        train_graphs = [coarsening.graph(index) for index in selected_indices]
         train_mappings = [mappings[index] for index in selected_indices]
 
         dimensions = [self.dimension for g in train_graphs]
-        
+        columns = np.r_[0, np.cumsum(dimensions)]
+        self.embeddings = np.empty((self.original_graph.number_of_nodes(), columns[-1]), dtype=np.float32)
+
         for i, (graph, mapping, dimension) in enumerate(zip(train_graphs, train_mappings, dimensions)):
             print('Training graph#{} #nodes={} #edges={}'.format(i, graph.number_of_nodes(), graph.number_of_edges()))
-            rev_mapping = coarsening.reverse_mapping(mapping)
             model = self.Model(graph, dimension)
             results = model.train().get_embeddings()
-            embeddings = np.ndarray(shape=(self.original_graph.number_of_nodes(), dimension))
-            for node, super_node in rev_mapping.items():
-                embeddings[node,:] = results[super_node,:]
-            self.embeddings = np.concatenate([self.embeddings, embeddings], axis=1)
+            # every original node takes the embedding of its super node
+            self.embeddings[:, columns[i]:columns[i+1]] = results[mapping]
 
         self.embeddings = self.dimension_reduction(self.embeddings, self.dimension)
         
@@ -64,7 +72,11 @@ class ConcatPCAModel(object):
 
 class RecursiveProlong(object):
 
-    def __init__(self, graph, dimension, Model, Coarsening, prolong_func):
+    def __init__(self, graph, dimension, Model, Coarsening, prolong_func=prolong):
+        '''
+        prolong_func(prev_model, model, assignment) initializes the model of
+        each finer graph from the coarser one, copying rows by default
+        '''
         self.original_graph = graph
         self.dimension = dimension
         self.Model = Model
@@ -73,13 +85,12 @@ class RecursiveProlong(object):
 
     def train(self):
         coarsening = self.Coarsening(self.original_graph)
-        if len(coarsening.graphs)==1:
+        if coarsening.num_levels==1:
             coarsening.recursive_merge()
 
         graphs = coarsening.graphs[::-1]
-        mappings = coarsening.mappings
-        mappings.append(None)
-        mappings = mappings[::-1]
+        # assignment from each graph's nodes to the previous (coarser) graph
+        mappings = [None]+coarsening.assignments[::-1]
 
         prev_model = None
         for i, (graph, mapping) in enumerate(zip(graphs, mappings)):
@@ -1,3 +1,5 @@
 #coding:utf-8
 
-from .walkbased import *
\ No newline at end of file
+from .walkbased import *
+from .incremental import IncrementalWalkEmbedding
+from .corpus import WalkCorpus, WalkCorpusCache
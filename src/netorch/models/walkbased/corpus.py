@@ -0,0 +1,121 @@
+#coding:utf-8
+import os
+import json
+import hashlib
+from itertools import chain
+
+import numpy as np
+
+from necython import CSRGraph, flatten_sequences
+
+MAGIC = b'NEWALKS1'
+HEADER_SIZE = 16
+
+def graph_digest(graph):
+    '''
+    graph: networkx graph or necython CSRGraph
+    RETURN hex digest of the node labels in order and the weighted edges,
+    independent of edge order and direction; a CSRGraph is hashed by its
+    offsets, targets and weights
+    '''
+    digest = hashlib.sha1()
+    if isinstance(graph, CSRGraph):
+        digest.update(b'csr')
+        for array in graph.csr_arrays():
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    nodes = np.asarray(list(graph.nodes))
+    digest.update(b'nx')
+    digest.update(np.int64(len(nodes)).tobytes())
+    digest.update(str(nodes.dtype).encode())
+    digest.update(repr(nodes.tolist()).encode() if nodes.dtype==object else nodes.tobytes())
+    m = graph.number_of_edges()
+    edges = np.fromiter(chain.from_iterable(graph.edges(data='weight', default=1.)), dtype=np.float64, count=3*m).reshape(-1, 3)
+    u, v = np.minimum(edges[:,0], edges[:,1]), np.maximum(edges[:,0], edges[:,1])
+    order = np.lexsort((v, u))
+    for column in (u, v, edges[:,2]):
+        digest.update(np.ascontiguousarray(column[order]).tobytes())
+    return digest.hexdigest()
+
+def walker_params(walker):
+    '''
+    RETURN the settings of a walker that shape its walks, thread count excluded
+    '''
+    params = {key:value for key, value in vars(walker).items() if key!='multi_process'}
+    params['class'] = type(walker).__name__
+    return params
+
+class WalkCorpus(object):
+    '''
+    Walks stored back to back in one file and read through mmap: a 16 byte
+    header (magic, number of walks), int64 offsets[num_walks+1], then the
+    int32 nodes, walk i being nodes[offsets[i]:offsets[i+1]]. Samplers and
+    NativeSkipGram take it wherever they take walks, without loading it.
+    '''
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header)!=HEADER_SIZE or header[:8]!=MAGIC:
+            raise ValueError('{} is not a walk corpus'.format(file_name))
+        num_walks = int(np.frombuffer(header, dtype=np.int64, offset=8)[0])
+        self.file_name = file_name
+        self.offsets = np.memmap(file_name, dtype=np.int64, mode='r', offset=HEADER_SIZE, shape=(num_walks+1,))
+        nodes_offset = HEADER_SIZE+self.offsets.nbytes
+        num_nodes = int(self.offsets[-1])
+        if num_nodes:
+            self.nodes = np.memmap(file_name, dtype=np.int32, mode='r', offset=nodes_offset, shape=(num_nodes,))
+        else:
+            self.nodes = np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def write(file_name, sequences):
+        '''
+        Store sequences (walk array or list of node lists) at file_name,
+        written to a temporary file first so readers never see a partial one
+        RETURN the WalkCorpus reading it
+        '''
+        nodes, offsets = flatten_sequences(sequences)
+        tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        with open(tmp_name, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.int64(len(offsets)-1).tobytes())
+            f.write(offsets.tobytes())
+            f.write(nodes.tobytes())
+        os.replace(tmp_name, file_name)
+        return WalkCorpus(file_name)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, i):
+        return self.nodes[self.offsets[i]:self.offsets[i+1]]
+
+class WalkCorpusCache(object):
+    '''
+    Directory of WalkCorpus files keyed by a hash of the graph and the
+    walker settings, so repeated runs on the same graph reuse their walks.
+    Native walkers are not seeded; seed only tells apart corpora meant to
+    be independent draws, WalkBasedEmbedding passing its own seed.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, graph, walker, seed=0):
+        params = json.dumps(dict(walker_params(walker), seed=seed), sort_keys=True, default=str)
+        return hashlib.sha1('{}:{}'.format(graph_digest(graph), params).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, '{}.walks'.format(key))
+
+    def walk(self, walker, graph, seed=0):
+        '''
+        RETURN the cached WalkCorpus of walker on graph, walking and storing it first if missing
+        '''
+        file_name = self.path(self.key(graph, walker, seed))
+        if os.path.exists(file_name):
+            return WalkCorpus(file_name)
+        return WalkCorpus.write(file_name, walker.walk(graph))
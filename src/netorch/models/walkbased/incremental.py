@@ -0,0 +1,161 @@
+#coding:utf-8
+import numpy as np
+import scipy.sparse as sp
+
+from necython import CSRGraph
+from netorch.coarsening.base import adjacency_matrix
+
+def edge_array(edges, columns):
+    '''
+    RETURN edges as a float64 (m, columns) array, weight 1 filled in when missing
+    '''
+    if edges is None or len(edges)==0:
+        return np.empty((0, columns))
+    edges = np.asarray(edges, dtype=np.float64)
+    if edges.shape[1] < columns:
+        edges = np.concatenate([edges, np.ones((len(edges), columns-edges.shape[1]))], axis=1)
+    return edges[:, :columns]
+
+def apply_edge_changes(adjacency, added, removed):
+    '''
+    added: (m, 3) array of (u, v, weight), setting the weight of existing edges
+    removed: (m, 2) array of (u, v), applied before added
+    RETURN (new symmetric csr adjacency, number of changed edges, int64
+    endpoints of the changed edges)
+    '''
+    n = adjacency.shape[0]
+
+    def keys(u, v):
+        u, v = u.astype(np.int64), v.astype(np.int64)
+        return np.minimum(u, v)*n+np.maximum(u, v)
+
+    upper = sp.triu(adjacency, format='coo')
+    old_keys = keys(upper.row, upper.col)
+    # the last insertion of a repeated edge wins
+    add_keys, last = np.unique(keys(added[:,0], added[:,1])[::-1], return_index=True)
+    add_weights = added[::-1, 2][last]
+    remove_keys = np.unique(keys(removed[:,0], removed[:,1]))
+
+    changed = np.union1d(add_keys, remove_keys[np.isin(remove_keys, old_keys)])
+    keep = ~np.isin(old_keys, changed)
+    new_keys = np.r_[old_keys[keep], add_keys]
+    weights = np.r_[upper.data[keep], add_weights]
+    rows, cols = new_keys//n, new_keys%n
+    loops = rows==cols
+    new_adjacency = sp.csr_matrix(
+        (np.r_[weights, weights[~loops]], (np.r_[rows, cols[~loops]], np.r_[cols, rows[~loops]])),
+        shape=(n, n),
+    )
+    return new_adjacency, len(changed), np.unique(np.r_[changed//n, changed%n])
+
+class IncrementalWalkEmbedding(object):
+    '''
+    Keeps the walk corpus of a WalkBasedEmbedding so that batches of edge
+    insertions and deletions only regenerate the walks touching a changed
+    node, then continue training from the current embedding and context
+    tables on those walks. Once the edges changed since the last full build
+    exceed drift_threshold of the graph, every walk is regenerated instead.
+    The node set is fixed by the model tables, new edges must join existing
+    nodes; the embedding is trained in memory, without chunk_size.
+    '''
+
+    def __init__(self, embedding, drift_threshold=.1):
+        self.embedding = embedding
+        self.drift_threshold = drift_threshold
+        self.adjacency = adjacency_matrix(embedding.graph)
+        self.walks = None
+
+    def make_walker(self):
+        return self.embedding.walker.make_walker(CSRGraph.from_scipy(self.adjacency))
+
+    def fit(self, sequences):
+        '''
+        Train on sequences for the embedding's iterations, the learning rate
+        decaying from its initial value again
+        '''
+        embedding = self.embedding
+        embedding.sampler.init_negative_probs(self.walks)
+        embedding.model.lr_reset()
+        for it in range(embedding.iterations):
+            embedding.feed(sequences, len(sequences)/len(self.walks))
+            embedding.model.lr_decay()
+
+    def train(self):
+        '''
+        Full build: walks from every node and training on all of them
+        '''
+        walker = self.embedding.walker
+        self.walks = self.make_walker().walk(walker.num_walks, walker.walk_length, walker.multi_process)
+        self.num_edges = self.adjacency.nnz//2
+        self.drift = 0
+        self.fit(self.walks)
+        return self
+
+    def update(self, added=None, removed=None):
+        '''
+        added: (u, v) or (u, v, weight) edges to insert or reweight
+        removed: (u, v) edges to delete
+        RETURN number of walks regenerated in whole or in part
+        '''
+        if self.walks is None:
+            raise RuntimeError('train() before update()')
+        added, removed = edge_array(added, 3), edge_array(removed, 2)
+        num_nodes = self.adjacency.shape[0]
+        for edges in (added, removed):
+            if len(edges) and (edges[:,:2].min() < 0 or edges[:,:2].max() >= num_nodes):
+                raise ValueError('edges must join existing nodes 0..{}'.format(num_nodes-1))
+
+        self.adjacency, num_changed, affected = apply_edge_changes(self.adjacency, added, removed)
+        graph = self.embedding.graph
+        for u, v in removed.astype(np.int64).tolist():
+            if graph.has_edge(u, v):
+                graph.remove_edge(u, v)
+        for u, v, weight in added.tolist():
+            graph.add_edge(int(u), int(v), weight=weight)
+
+        self.drift += num_changed
+        if self.drift > self.drift_threshold*max(self.num_edges, 1):
+            self.train()
+            return len(self.walks)
+        if len(affected)==0:
+            return 0
+
+        walker = self.embedding.walker
+        window_size = self.embedding.sampler.window_size
+        degrees = np.diff(self.adjacency.indptr)
+        touched = np.zeros(num_nodes, dtype=bool)
+        touched[affected] = True
+        rows = np.flatnonzero(touched[self.walks].any(axis=1))
+        # a walk stays valid up to its first changed node and is walked
+        # anew from there; walks stuck on a node without edges restart
+        first = touched[self.walks[rows]].argmax(axis=1)
+        first[degrees[self.walks[rows, first]]==0] = 0
+        pivots = self.walks[rows, first]
+        dropped = rows[degrees[pivots]==0]
+        rows, first, pivots = rows[degrees[pivots]>0], first[degrees[pivots]>0], pivots[degrees[pivots]>0]
+
+        suffixes = self.make_walker().walk_from(pivots, walker.walk_length, walker.multi_process)
+        width = self.walks.shape[1]
+        positions = np.arange(width)
+        tail = positions >= first[:, None]
+        stale = self.walks[rows]
+        stale[tail] = np.take_along_axis(suffixes, np.maximum(positions-first[:, None], 0), axis=1)[tail]
+        self.walks[rows] = stale
+
+        # nodes that gained their first edges get walks of their own
+        walked = np.bincount(self.walks[:, 0], minlength=num_nodes) > 0
+        new_starts = affected[~walked[affected] & (degrees[affected] > 0)]
+        new_walks = self.make_walker().walk_from(np.repeat(new_starts, walker.num_walks), walker.walk_length, walker.multi_process)
+        self.walks = np.concatenate([np.delete(self.walks, dropped, axis=0), new_walks])
+
+        # train on the rewritten parts with the windows reaching into them
+        sequences = [walk[start:] for walk, start in zip(stale, np.maximum(first-window_size, 0))]
+        sequences.extend(new_walks)
+        self.fit(sequences)
+        return len(rows)+len(new_walks)
+
+    def get_embeddings(self):
+        return self.embedding.get_embeddings()
+
+    def get_contexts(self):
+        return self.embedding.get_contexts()
@@ -0,0 +1,66 @@
+#coding:utf-8
+import numpy as np
+
+from necython import train_skipgram
+from .walker import CPU_COUNT
+
+class NativeSkipGram(object):
+    '''
+    Skip-gram with negative sampling trained by the necython kernel straight
+    from walk buffers, multi-threaded and without the GIL. Drop-in
+    replacement for NodeEmbedding in WalkBasedEmbedding: instead of feed it
+    takes whole walks through feed_walks, with window, negative ratio,
+    negative distribution and down-sampling taken from a NegativeSampling.
+    The learning rate applies per pair, word2vec's 0.025 is a good start,
+    and decays linearly to min_learning_rate over iterations.
+    '''
+
+    def __init__(self, num_nodes, dimension, learning_rate, iterations, min_learning_rate=None, num_threads=CPU_COUNT):
+        self.num_nodes = num_nodes
+        self.dimension = dimension
+        self.learning_rate = learning_rate
+        self.min_learning_rate = learning_rate*1e-4 if min_learning_rate is None else min_learning_rate
+        self.iterations = iterations
+        self.num_threads = num_threads
+
+        self.embeddings = ((np.random.rand(num_nodes, dimension)-.5)/dimension).astype(np.float32)
+        self.contexts = np.zeros((num_nodes, dimension), dtype=np.float32)
+        self.epoch = 0
+        self.progress = 0.
+
+    def learning_rate_at(self, progress):
+        rate = self.learning_rate*(1.-progress/self.iterations)
+        return max(rate, self.min_learning_rate)
+
+    def feed_walks(self, sequences, sampler, fraction=1.):
+        '''
+        fraction: share of one iteration's walks in sequences, which sets how
+        far the learning rate decays while training on them
+        '''
+        if sampler.counts is None:
+            sampler.init_negative_probs(sequences)
+        start, end = self.progress, self.progress+fraction
+        train_skipgram(sequences, self.embeddings, self.contexts,
+            sampler.negative_sampler, sampler.neg_ratio, sampler.window_size, sampler.keep_probs,
+            self.learning_rate_at(start), self.learning_rate_at(end), self.num_threads)
+        self.progress = end
+
+    def lr_decay(self):
+        self.epoch += 1
+        self.progress = float(self.epoch)
+
+    def lr_reset(self):
+        self.epoch = 0
+        self.progress = 0.
+
+    def get_embeddings(self):
+        return self.embeddings
+
+    def set_embeddings(self, emb):
+        self.embeddings[:] = emb
+
+    def get_contexts(self):
+        return self.contexts
+
+    def set_contexts(self, ctx):
+        self.contexts[:] = ctx
@@ -1,113 +1,179 @@
 #coding:utf-8
-from collections import defaultdict, Counter
+import threading
+import queue
 import numpy as np
+import torch
 from tqdm import tqdm
 
-from necython import window_sampling, skip_sampling
+from necython import window_sampling, skip_sampling, flatten_sequences, WindowBatches, NegativeSampler
 
-class NegativeSampling(object):
+def node_counts(sequences):
+    nodes, _ = flatten_sequences(sequences)
+    return np.bincount(nodes)
 
-    def __init__(self, window_size, batch_size, neg_ratio=5, neg_power=.75, down_sampling=-1):
-        self.window_size = window_size
-        self.batch_size = batch_size
-        self.neg_ratio = neg_ratio
-        self.neg_power = neg_power
-        self.down_sampling = down_sampling
-
-        self.samples = None
-
-    def init_negative_probs(self, sequences):
-        counter = Counter()
-        for seq in sequences:
-            counter.update(seq)
-        weights = [counter[i] for i in range(len(counter))]
-        weights = np.power(weights, self.neg_power)
-        self.neg_probs = weights/np.sum(weights)
-
-    def init_samples(self, sequences, shuffle=False):
-        self.init_negative_probs(sequences)
-        samples = window_sampling(sequences, self.window_size, self.down_sampling, shuffle)
-        samples = np.array(samples)
-        return samples
+def keep_probabilities(counts, threshold):
+    '''
+    RETURN word2vec down-sampling probability of keeping each node
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    ratio = threshold*np.sum(counts)/np.maximum(counts, 1e-12)
+    return np.sqrt(ratio)+ratio
 
-    def sample(self, sequences):
-        if self.samples is None:
-            self.samples = self.init_samples(sequences)
-        samples = self.samples
-        total_cnt = len(samples)
-        pos_cnt = self.batch_size//(self.neg_ratio+1)
-        neg_cnt = pos_cnt*self.neg_ratio
-        neg_samples = np.random.choice(len(self.neg_probs), size=total_cnt*self.neg_ratio, p=self.neg_probs)
+class BaseSampling(object):
 
-        bar = tqdm(total=total_cnt*(self.neg_ratio+1))
-        bar.set_description('  Training')
-        
-        start_idx = 0
-        end_idx = min(start_idx+pos_cnt, total_cnt)
-        while start_idx<end_idx:
-            pos_cnt_2 = end_idx-start_idx
-            neg_cnt_2 = pos_cnt_2*self.neg_ratio
-
-            samp = np.ndarray((pos_cnt_2+neg_cnt_2, 3), dtype=np.int32)
-            samp[:pos_cnt_2,:2] = samples[start_idx:end_idx,:]
-            samp[:pos_cnt_2,2] = 1
-            samp[pos_cnt_2:,0] = np.repeat(samp[:pos_cnt_2,0], self.neg_ratio)
-            samp[pos_cnt_2:,1] = neg_samples[start_idx*self.neg_ratio:end_idx*self.neg_ratio]
-            samp[pos_cnt_2:,2] = -1
-            yield samp[:,0], samp[:,1], samp[:,2]
-
-            bar.update(pos_cnt_2*(self.neg_ratio+1))
-
-            start_idx = end_idx
-            end_idx = min(start_idx+pos_cnt, total_cnt)
-
-        bar.close()
-
-class TripletSampling(object):
-    def __init__(self, window_size, batch_size, neg_power=.75, down_sampling=-1):
+    def __init__(self, window_size, batch_size, neg_power, down_sampling, shuffle, prefetch):
         self.window_size = window_size
         self.batch_size = batch_size
         self.neg_power = neg_power
         self.down_sampling = down_sampling
+        self.shuffle = shuffle
+        self.prefetch = prefetch
 
-        self.samples = None
+        self.counts = None
 
     def init_negative_probs(self, sequences):
-        counter = Counter()
-        for seq in sequences:
-            counter.update(seq)
-        weights = [counter[i] for i in range(len(counter))]
-        weights = np.power(weights, self.neg_power)
-        self.neg_probs = weights/np.sum(weights)
-
-    def init_samples(self, sequences, shuffle=False):
-        self.init_negative_probs(sequences)
-        samples = window_sampling(sequences, self.window_size, self.down_sampling, shuffle)
-        samples = np.array(samples)
-        return samples
+        self.init_negative_probs_from_counts(node_counts(sequences))
+
+    def init_negative_probs_from_counts(self, counts):
+        '''
+        counts are the node frequencies shared by the negative distribution
+        and down-sampling
+        '''
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.negative_sampler = NegativeSampler(np.power(self.counts, self.neg_power))
+        if self.down_sampling>0:
+            self.keep_probs = keep_probabilities(self.counts, self.down_sampling)
+        else:
+            self.keep_probs = None
+
+    def negative_samples(self, size):
+        return self.negative_sampler.sample(size)
+
+    def positive_batches(self, sequences, batch_size):
+        if self.counts is None:
+            self.init_negative_probs(sequences)
+        return WindowBatches(sequences, self.window_size, self.keep_probs, self.shuffle, batch_size)
+
+    def new_buffers(self):
+        '''
+        RETURN one preallocated slot of the batch ring, its tensors first
+        '''
+        raise NotImplementedError
+
+    def fill_buffers(self, batches, buffers):
+        '''
+        Write the next batch drawn from batches into buffers
+        RETURN number of samples written, 0 once exhausted
+        '''
+        raise NotImplementedError
 
     def sample(self, sequences):
-        if self.samples is None:
-            self.samples = self.init_samples(sequences)
-        samples = self.samples
-        total = len(samples)
-        neg_samples = np.random.choice(len(self.neg_probs), size=total, p=self.neg_probs)
-
-        bar = tqdm(total=total)
+        '''
+        Yield batches of tensors viewing a ring of prefetch+1 preallocated slots
+        (pinned when cuda is available) that a background thread fills while
+        the caller trains on earlier ones. A batch is only valid until the next
+        one is requested.
+        '''
+        batches = self.positive_batches(sequences, self.batch_size)
+        ring = [self.new_buffers() for i in range(self.prefetch+1)]
+        free = queue.Queue()
+        for slot in range(len(ring)):
+            free.put(slot)
+        full = queue.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                while not stopped.is_set():
+                    try:
+                        slot = free.get(timeout=.1)
+                    except queue.Empty:
+                        continue
+                    size = self.fill_buffers(batches, ring[slot])
+                    if size==0:
+                        break
+                    full.put((slot, size, batches.sequences_done))
+                full.put(None)
+            except Exception as e:
+                full.put(e)
+
+        bar = tqdm(total=batches.num_sequences)
         bar.set_description('  Training')
-        
-        start_idx = 0
-        end_idx = min(start_idx+self.batch_size, total)
-        while start_idx<end_idx:
-            samp = np.ndarray((end_idx-start_idx, 3), dtype=np.int32)
-            samp[:,:2] = samples[start_idx:end_idx,:]
-            samp[:,2] = neg_samples[start_idx:end_idx]
-            yield samp[:,0], samp[:,1], samp[:,2]
 
-            bar.update(end_idx-start_idx)
-
-            start_idx = end_idx
-            end_idx = min(start_idx+self.batch_size, total)
-
-        bar.close()
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = full.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                slot, size, sequences_done = item
+                yield tuple(tensor[:size] for tensor in ring[slot][0])
+                free.put(slot)
+                bar.update(sequences_done-bar.n)
+        finally:
+            stopped.set()
+            producer.join()
+            bar.close()
+
+def new_tensor(size, dtype):
+    return torch.empty(size, dtype=dtype, pin_memory=torch.cuda.is_available())
+
+class NegativeSampling(BaseSampling):
+
+    def __init__(self, window_size, batch_size, neg_ratio=5, neg_power=.75, down_sampling=-1, shuffle=False, prefetch=2):
+        super().__init__(window_size, batch_size, neg_power, down_sampling, shuffle, prefetch)
+        self.neg_ratio = neg_ratio
 
+    def new_buffers(self):
+        # batches are (u, v, sign) long, long and float tensors: the positive
+        # pairs followed by neg_ratio negatives for each of them in turn
+        pos_cnt = max(self.batch_size//(self.neg_ratio+1), 1)
+        size = pos_cnt*(self.neg_ratio+1)
+        tensors = (new_tensor(size, torch.long), new_tensor(size, torch.long), new_tensor(size, torch.float))
+        pairs = np.empty((pos_cnt, 2), dtype=np.int32)
+        negatives = np.empty(pos_cnt*self.neg_ratio, dtype=np.int32)
+        return tensors, pairs, negatives
+
+    def fill_buffers(self, batches, buffers):
+        tensors, pairs, negatives = buffers
+        u, v, sign = (tensor.numpy() for tensor in tensors)
+        pos_cnt = batches.fill(pairs)
+        if pos_cnt==0:
+            return 0
+        neg_cnt = pos_cnt*self.neg_ratio
+        size = pos_cnt+neg_cnt
+
+        u[:pos_cnt] = pairs[:pos_cnt,0]
+        v[:pos_cnt] = pairs[:pos_cnt,1]
+        sign[:pos_cnt] = 1
+        u[pos_cnt:size].reshape(pos_cnt, self.neg_ratio)[:] = pairs[:pos_cnt,:1]
+        v[pos_cnt:size] = self.negative_sampler.sample(neg_cnt, out=negatives)[:neg_cnt]
+        sign[pos_cnt:size] = -1
+        return size
+
+class TripletSampling(BaseSampling):
+    def __init__(self, window_size, batch_size, neg_power=.75, down_sampling=-1, shuffle=False, prefetch=2):
+        super().__init__(window_size, batch_size, neg_power, down_sampling, shuffle, prefetch)
+
+    def new_buffers(self):
+        # batches are (u, v, w) long tensors, w a negative for each pair (u, v)
+        size = max(self.batch_size, 1)
+        tensors = (new_tensor(size, torch.long), new_tensor(size, torch.long), new_tensor(size, torch.long))
+        pairs = np.empty((size, 2), dtype=np.int32)
+        negatives = np.empty(size, dtype=np.int32)
+        return tensors, pairs, negatives
+
+    def fill_buffers(self, batches, buffers):
+        tensors, pairs, negatives = buffers
+        u, v, w = (tensor.numpy() for tensor in tensors)
+        size = batches.fill(pairs)
+        if size==0:
+            return 0
+
+        u[:size] = pairs[:size,0]
+        v[:size] = pairs[:size,1]
+        w[:size] = self.negative_sampler.sample(size, out=negatives)[:size]
+        return size
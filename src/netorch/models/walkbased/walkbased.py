@@ -6,13 +6,26 @@ import networkx as nx
 from sklearn.preprocessing import normalize
 
 from netorch.lookup import GraphLookup
-from netorch.models.common import NodeEmbedding
-from .sampling import NegativeSampling
+from netorch.models.common import NodeEmbedding, TripletNodeEmbedding, Hogwild
+from .sampling import NegativeSampling, TripletSampling
 from .walker import Walker, BiasedWalker
+from .native import NativeSkipGram
 
 class WalkBasedEmbedding(object):
 
-    def __init__(self, graph, dimension, iterations, walker, sampler, model):
+    def __init__(self, graph, dimension, iterations, walker, sampler, model, chunk_size=None, max_chunks=2, corpus_cache=None, seed=0):
+        '''
+        chunk_size: if set, walks are streamed chunk_size start nodes at a time
+        and generated in the background while earlier chunks are trained on,
+        with at most max_chunks chunks waiting; every iteration walks anew
+        corpus_cache: WalkCorpusCache reusing the walks of earlier runs on
+        the same graph and walker settings, trained on straight from disk;
+        streamed walks are never stored, so it excludes chunk_size
+        seed: corpus_cache key of the walks, runs with different seeds
+        walking their own corpora
+        '''
+        if chunk_size is not None and corpus_cache is not None:
+            raise ValueError('chunk_size streams fresh walks, it cannot be combined with corpus_cache')
         self.graph = graph
         self.dimension = dimension
         self.iterations = iterations
@@ -21,16 +34,69 @@ class WalkBasedEmbedding(object):
         self.sampler = sampler
         self.model = model
 
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.corpus_cache = corpus_cache
+        self.seed = seed
+
     def train(self):
-        sequences = self.walker.walk(self.graph)
+        '''
+        Hogwild workers of the model are shut down when training ends,
+        dropping their pending batches if it fails
+        '''
+        try:
+            if self.chunk_size is not None:
+                self.train_streaming()
+            else:
+                self.train_walks()
+        except BaseException:
+            self.close(terminate=True)
+            raise
+        self.close()
+        return self
+
+    def train_walks(self):
+        if self.corpus_cache is not None:
+            sequences = self.corpus_cache.walk(self.walker, self.graph, self.seed)
+        else:
+            sequences = self.walker.walk(self.graph)
 
         for it in range(self.iterations):
-            for samples in self.sampler.sample(sequences):
-                self.model.feed(*samples)
+            self.feed(sequences)
             self.model.lr_decay()
         
         return self
+
+    def train_streaming(self):
+        # chunks only cover part of the corpus, so negatives follow the
+        # expected visit frequencies instead of the observed ones
+        self.sampler.init_negative_probs_from_counts(self.walker.visit_counts(self.graph))
+
+        walks_per_pass = self.walker.num_walks*self.graph.number_of_nodes()
+        prev_it = 0
+        for it, sequences in self.walker.stream(self.graph, self.chunk_size, self.max_chunks, passes=self.iterations):
+            if it!=prev_it:
+                self.model.lr_decay()
+                prev_it = it
+            self.feed(sequences, len(sequences)/walks_per_pass)
+        self.model.lr_decay()
+
+        return self
+
+    def feed(self, sequences, fraction=1.):
+        '''
+        fraction: share of one iteration's walks in sequences
+        '''
+        if hasattr(self.model, 'feed_walks'):
+            self.model.feed_walks(sequences, self.sampler, fraction)
+            return
+        for samples in self.sampler.sample(sequences):
+            self.model.feed(*samples)
         
+    def close(self, terminate=False):
+        if hasattr(self.model, 'close'):
+            self.model.close(terminate)
+
     def set_embeddings(self, embeddings):
         self.model.set_embeddings(embeddings)
 
@@ -43,6 +109,37 @@ class WalkBasedEmbedding(object):
     def get_contexts(self):
         return self.model.get_contexts()
 
+# the torch models keep their rate, decayed by 0.9 every iteration; the
+# native trainer decays linearly to zero like word2vec and starts from its 0.025
+DEFAULT_LEARNING_RATES = {
+    'torch': 0.001,
+    'native': 0.025,
+}
+
+def hogwild_model(model, hogwild):
+    '''
+    hogwild: number of Hogwild worker processes training model, 0 to train in process
+    '''
+    return Hogwild(model, num_workers=hogwild) if hogwild else model
+
+def skipgram_model(num_nodes, dimension, learning_rate, iterations, sparse, precision, backend, device='cuda', hogwild=0):
+    '''
+    backend: 'torch' for NodeEmbedding, 'native' for NativeSkipGram
+    learning_rate: None for the backend default in DEFAULT_LEARNING_RATES
+    device, hogwild: torch backend only, hogwild workers needing device='cpu'
+    '''
+    if learning_rate is None:
+        learning_rate = DEFAULT_LEARNING_RATES.get(backend)
+    if backend=='torch':
+        return hogwild_model(NodeEmbedding(num_nodes, dimension, learning_rate, device=device, sparse=sparse, precision=precision), hogwild)
+    if backend=='native':
+        if precision!='fp32':
+            raise ValueError('the native backend trains fp32 tables')
+        if hogwild:
+            raise ValueError('the native backend runs its own threads, hogwild is for the torch backend')
+        return NativeSkipGram(num_nodes, dimension, learning_rate, iterations)
+    raise ValueError('unknown backend {}'.format(backend))
+
 def DeepWalk(graph, *,
         dimension = 128,
         num_walks = 10,
@@ -50,16 +147,27 @@ def DeepWalk(graph, *,
         window_size = 10,
         iterations = 3,
         neg_ratio = 5,
-        learning_rate = 0.001,
+        learning_rate = None,
         batch_size = 10000,
         down_sample_threshold = 1e-3,
-        weighted_walk=False):
+        weighted_walk=False,
+        chunk_size=None,
+        corpus_cache=None,
+        seed=0,
+        sparse=False,
+        precision='fp32',
+        backend='torch',
+        device='cuda',
+        hogwild=0):
     return WalkBasedEmbedding(graph,
         dimension,
         iterations,
         walker = Walker(num_walks, walk_length, weighted=weighted_walk),
         sampler = NegativeSampling(window_size, batch_size, neg_ratio=neg_ratio, down_sampling=down_sample_threshold),
-        model = NodeEmbedding(graph.number_of_nodes(), dimension, learning_rate),
+        model = skipgram_model(graph.number_of_nodes(), dimension, learning_rate, iterations, sparse, precision, backend, device, hogwild),
+        chunk_size = chunk_size,
+        corpus_cache = corpus_cache,
+        seed = seed,
     )
 
 def Node2Vec(graph, *, p, q,
@@ -69,15 +177,26 @@ def Node2Vec(graph, *, p, q,
         window_size = 10,
         iterations = 3,
         neg_ratio = 5,
-        learning_rate = 0.001,
+        learning_rate = None,
         batch_size = 10000,
-        down_sample_threshold = 1e-3):
+        down_sample_threshold = 1e-3,
+        chunk_size = None,
+        corpus_cache = None,
+        seed = 0,
+        sparse = False,
+        precision = 'fp32',
+        backend = 'torch',
+        device = 'cuda',
+        hogwild = 0):
     return WalkBasedEmbedding(graph,
         dimension,
         iterations,
         walker = BiasedWalker(num_walks, walk_length, p=p, q=q),
         sampler = NegativeSampling(window_size, batch_size, neg_ratio=neg_ratio, down_sampling=down_sample_threshold),
-        model = NodeEmbedding(graph.number_of_nodes(), dimension, learning_rate),
+        model = skipgram_model(graph.number_of_nodes(), dimension, learning_rate, iterations, sparse, precision, backend, device, hogwild),
+        chunk_size = chunk_size,
+        corpus_cache = corpus_cache,
+        seed = seed,
     )
 
 def Triplet(graph,*,
@@ -88,12 +207,20 @@ def Triplet(graph,*,
         iterations = 3,
         learning_rate = 0.001,
         batch_size = 10000,
-        down_sample_threshold = 1e-3):
+        down_sample_threshold = 1e-3,
+        corpus_cache = None,
+        seed = 0,
+        sparse = False,
+        precision = 'fp32',
+        device = 'cuda',
+        hogwild = 0):
     return WalkBasedEmbedding(graph,
         dimension,
         iterations,
         walker = Walker(num_walks, walk_length),
         sampler = TripletSampling(window_size, batch_size, down_sampling=down_sample_threshold),
-        model = TripletNodeEmbedding(graph.number_of_nodes(), dimension, learning_rate),
+        model = hogwild_model(TripletNodeEmbedding(graph.number_of_nodes(), dimension, learning_rate, device=device, sparse=sparse, precision=precision), hogwild),
+        corpus_cache = corpus_cache,
+        seed = seed,
     )
 
@@ -1,39 +1,150 @@
 #coding:utf-8
 import multiprocessing as mp
+import threading
+import queue
 import numpy as np
 import networkx as nx
 
-from necython import Graph as CGraph, Walker as CWalker, BiasedWalker as CBiasedWalker
+from necython import CSRGraph, Walker as CWalker, BiasedWalker as CBiasedWalker
+from necython import AliasWalker as CAliasWalker, BiasedAliasWalker as CBiasedAliasWalker
 
 CPU_COUNT = mp.cpu_count()
 
-class Walker(object):
+class BaseWalker(object):
 
-    def __init__(self, num_walks=10, walk_length=80, weighted=False, multi_process=CPU_COUNT):
+    def __init__(self, num_walks, walk_length, multi_process):
         self.num_walks = num_walks
         self.walk_length = walk_length
-        self.weighted = weighted
         self.multi_process = multi_process
 
+    def make_walker(self, graph):
+        '''
+        graph: networkx graph or necython CSRGraph
+        RETURN a necython walker initialized on graph
+        '''
+        raise NotImplementedError
+
+    def visit_counts(self, graph):
+        '''
+        RETURN expected relative number of visits of each node, i.e. its degree
+        '''
+        counts = np.zeros(graph.number_of_nodes())
+        for node, degree in graph.degree():
+            counts[node] = degree
+        return counts
+
     def walk(self, graph):
-        g = CGraph.from_nx_graph(graph)
-        w = CWalker()
-        w.init_distributions_from_graph(g, self.weighted)
+        w = self.make_walker(graph)
         sequences = w.walk(self.num_walks, self.walk_length, self.multi_process)
         return sequences
 
-class BiasedWalker(object):
+    def stream(self, graph, chunk_size, max_chunks=2, passes=1):
+        '''
+        Yield (pass_index, walks) for chunk_size start nodes at a time, going
+        over all nodes passes times. Later chunks are walked by native threads
+        in the background while the caller consumes earlier ones; at most
+        max_chunks finished chunks are kept waiting.
+        '''
+        w = self.make_walker(graph)
+        num_nodes = w.number_of_start_nodes()
+        chunks = queue.Queue(maxsize=max_chunks)
+        stopped = threading.Event()
 
-    def __init__(self, num_walks=10, walk_length=80, p=1., q=1., multi_process=CPU_COUNT):
-        self.num_walks = num_walks
-        self.walk_length = walk_length
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    chunks.put(item, timeout=.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def produce():
+            try:
+                for it in range(passes):
+                    for first_node in range(0, num_nodes, chunk_size):
+                        if stopped.is_set():
+                            return
+                        put((it, w.walk_nodes(self.num_walks, self.walk_length, self.multi_process, first_node, first_node+chunk_size)))
+                put(None)
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            producer.join()
+
+class Walker(BaseWalker):
+
+    def __init__(self, num_walks=10, walk_length=80, weighted=False, multi_process=CPU_COUNT, sampling='alias'):
+        '''
+        sampling: 'alias' draws each step from flat alias tables in O(1),
+        'discrete' uses one std::discrete_distribution per node
+        '''
+        if sampling not in ('alias', 'discrete'):
+            raise ValueError('unknown sampling method {}'.format(sampling))
+        super().__init__(num_walks, walk_length, multi_process)
+        self.weighted = weighted
+        self.sampling = sampling
+
+    def make_walker(self, graph):
+        g = graph if isinstance(graph, CSRGraph) else CSRGraph.from_nx_graph(graph)
+        w = CAliasWalker() if self.sampling=='alias' else CWalker()
+        w.init_distributions_from_graph(g, self.weighted)
+        return w
+
+    def visit_counts(self, graph):
+        if not self.weighted:
+            return super().visit_counts(graph)
+        counts = np.zeros(graph.number_of_nodes())
+        for node, degree in graph.degree(weight='weight'):
+            counts[node] = degree
+        return counts
+
+class BiasedWalker(BaseWalker):
+
+    STRATEGIES = ('precompute', 'hybrid', 'rejection')
+
+    def __init__(self, num_walks=10, walk_length=80, p=1., q=1., multi_process=CPU_COUNT, sampling='alias', strategy='precompute', max_precompute_degree=64):
+        '''
+        strategy trades memory for speed with alias sampling:
+        'precompute' builds a table for every directed edge, O(sum of deg^2) memory
+        'rejection' evaluates the p/q bias on the fly, O(E) memory
+        'hybrid' precomputes edges whose target has at most max_precompute_degree neighbors
+        '''
+        if sampling not in ('alias', 'discrete'):
+            raise ValueError('unknown sampling method {}'.format(sampling))
+        if strategy not in self.STRATEGIES:
+            raise ValueError('unknown strategy {}'.format(strategy))
+        if sampling=='discrete' and strategy!='precompute':
+            raise ValueError('strategy {} requires alias sampling'.format(strategy))
+        super().__init__(num_walks, walk_length, multi_process)
         self.p = p
         self.q = q
-        self.multi_process = multi_process
+        self.sampling = sampling
+        self.strategy = strategy
+        self.max_precompute_degree = max_precompute_degree
 
-    def walk(self, graph):
-        g = CGraph.from_nx_graph(graph)
-        w = CBiasedWalker()
-        w.init_distributions_from_graph(g, self.p, self.q)
-        sequences = w.walk(self.num_walks, self.walk_length, self.multi_process)
-        return sequences
+    def make_walker(self, graph):
+        g = graph if isinstance(graph, CSRGraph) else CSRGraph.from_nx_graph(graph)
+        if self.sampling=='alias':
+            w = CBiasedAliasWalker()
+            max_degree = {
+                'precompute': None,
+                'hybrid': self.max_precompute_degree,
+                'rejection': 0,
+            }[self.strategy]
+            w.init_distributions_from_graph(g, self.p, self.q, max_degree)
+        else:
+            w = CBiasedWalker()
+            w.init_distributions_from_graph(g, self.p, self.q)
+        return w
@@ -0,0 +1,205 @@
+#coding:utf-8
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+METRICS = ('cosine', 'dot')
+
+def normalize_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x/np.maximum(norms, 1e-12)
+
+def prepare(x, metric):
+    '''
+    RETURN x as float32, rows normalized for cosine
+    '''
+    if metric not in METRICS:
+        raise ValueError('unknown metric {}'.format(metric))
+    x = np.asarray(x, dtype=np.float32)
+    return normalize_rows(x) if metric=='cosine' else x
+
+def merge_top_k(best_index, best_score, index, score, k):
+    '''
+    RETURN the k highest of both (index, score) candidate sets, row by row, unordered
+    '''
+    index = np.concatenate([best_index, index], axis=1)
+    score = np.concatenate([best_score, score], axis=1)
+    if score.shape[1] > k:
+        top = np.argpartition(-score, k-1, axis=1)[:, :k]
+        index = np.take_along_axis(index, top, axis=1)
+        score = np.take_along_axis(score, top, axis=1)
+    return index, score
+
+def sort_top_k(index, score):
+    order = np.argsort(-score, axis=1, kind='stable')
+    return np.take_along_axis(index, order, axis=1), np.take_along_axis(score, order, axis=1)
+
+def search_block(queries, base, k, first_row=None, bias=None, column_block=16384):
+    '''
+    Exact top k of queries @ base.T (+ bias per base row) one column block at
+    a time; with first_row, query i is base row first_row+i and skips itself
+    RETURN unsorted (index, score), index -1 where base has too few rows
+    '''
+    best_index = np.empty((len(queries), 0), dtype=np.int64)
+    best_score = np.empty((len(queries), 0), dtype=np.float32)
+    for first in range(0, len(base), column_block):
+        score = queries @ base[first:first+column_block].T
+        if bias is not None:
+            score += bias[first:first+column_block]
+        if first_row is not None:
+            rows = np.arange(len(queries))
+            cols = first_row+rows-first
+            inside = (cols>=0)&(cols<score.shape[1])
+            score[rows[inside], cols[inside]] = -np.inf
+        index = np.broadcast_to(np.arange(first, first+score.shape[1]), score.shape)
+        best_index, best_score = merge_top_k(best_index, best_score, index, score, k)
+    if best_score.shape[1] < k:
+        pad = k-best_score.shape[1]
+        best_index = np.pad(best_index, ((0, 0), (0, pad)), constant_values=-1)
+        best_score = np.pad(best_score, ((0, 0), (0, pad)), constant_values=-np.inf)
+    if first_row is not None:
+        best_index[np.isneginf(best_score)] = -1
+    return best_index, best_score
+
+def blocked_search(queries, base, k, exclude_self=False, bias=None, block_size=1024, column_block=16384, num_threads=mp.cpu_count()):
+    '''
+    search_block over row blocks of queries run on num_threads threads,
+    memory bounded by block_size*column_block scores per thread
+    RETURN (index, score) sorted by decreasing score
+    '''
+    index = np.empty((len(queries), k), dtype=np.int64)
+    score = np.empty((len(queries), k), dtype=np.float32)
+
+    def run(first):
+        last = first+block_size
+        index[first:last], score[first:last] = sort_top_k(*search_block(
+            queries[first:last], base, k,
+            first_row=first if exclude_self else None,
+            bias=bias,
+            column_block=column_block,
+        ))
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        list(executor.map(run, range(0, len(queries), block_size)))
+    return index, score
+
+def top_k(queries, base, k, metric='cosine', exclude_self=False, block_size=1024, num_threads=mp.cpu_count()):
+    '''
+    Exact k most similar base rows for every query row, never holding more
+    than a block of the query-base score matrix per thread
+    exclude_self: queries are base itself and a row is not its own neighbor
+    RETURN (index, score) (num_queries, k) arrays by decreasing score,
+    index -1 past the number of candidates
+    '''
+    base = prepare(base, metric)
+    queries = base if exclude_self else prepare(queries, metric)
+    return blocked_search(queries, base, k, exclude_self, block_size=block_size, num_threads=num_threads)
+
+class IVFIndex(object):
+    '''
+    Approximate search over an inverted file: base rows are clustered by
+    k-means and a query only scans the num_probes lists whose centroids are
+    most similar to it
+    '''
+
+    def __init__(self, metric='cosine', num_lists=None, num_probes=8, iterations=10, seed=0, num_threads=mp.cpu_count()):
+        if metric not in METRICS:
+            raise ValueError('unknown metric {}'.format(metric))
+        self.metric = metric
+        self.num_lists = num_lists
+        self.num_probes = num_probes
+        self.iterations = iterations
+        self.seed = seed
+        self.num_threads = num_threads
+
+    def assign(self, data, centroids):
+        # nearest centroid, by angle for cosine and by euclidean distance for dot
+        bias = None if self.metric=='cosine' else -.5*np.sum(centroids**2, axis=1)
+        index, _ = blocked_search(data, centroids, 1, bias=bias, num_threads=self.num_threads)
+        return index[:,0]
+
+    def kmeans(self, data, num_lists, rng):
+        centroids = data[rng.choice(len(data), num_lists, replace=False)].copy()
+        for it in range(self.iterations):
+            assignment = self.assign(data, centroids)
+            members = sp.csr_matrix((np.ones(len(data), dtype=np.float32), (assignment, np.arange(len(data)))), shape=(num_lists, len(data)))
+            counts = np.bincount(assignment, minlength=num_lists)
+            sums = members @ data
+            empty = counts==0
+            centroids[~empty] = sums[~empty]/counts[~empty,None]
+            centroids[empty] = data[rng.choice(len(data), np.sum(empty), replace=False)]
+            if self.metric=='cosine':
+                centroids = normalize_rows(centroids)
+        return centroids
+
+    def fit(self, base, max_train_per_list=256):
+        self.base = prepare(base, self.metric)
+        num_lists = self.num_lists or max(int(4*np.sqrt(len(self.base))), 1)
+        num_lists = min(num_lists, len(self.base))
+        rng = np.random.RandomState(self.seed)
+        train = self.base
+        if len(train) > max_train_per_list*num_lists:
+            train = train[rng.choice(len(train), max_train_per_list*num_lists, replace=False)]
+        self.centroids = self.kmeans(train, num_lists, rng)
+
+        assignment = self.assign(self.base, self.centroids)
+        self.order = np.argsort(assignment, kind='stable')
+        self.offsets = np.r_[0, np.cumsum(np.bincount(assignment, minlength=num_lists))]
+        return self
+
+    def search(self, queries, k, exclude_self=False):
+        '''
+        exclude_self: queries are the fitted base itself and skip themselves
+        RETURN (index, score) like top_k
+        '''
+        queries = self.base if exclude_self else prepare(queries, self.metric)
+        num_probes = min(self.num_probes, len(self.centroids))
+        probes, _ = blocked_search(queries, self.centroids, num_probes, num_threads=self.num_threads)
+
+        best_index = np.full((len(queries), k), -1, dtype=np.int64)
+        best_score = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        # visit lists one by one with every query that probes them
+        probe_order = np.argsort(probes.reshape(-1), kind='stable')
+        probe_lists = probes.reshape(-1)[probe_order]
+        bounds = np.r_[0, np.flatnonzero(np.diff(probe_lists))+1, len(probe_lists)]
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            lst = probe_lists[first]
+            members = self.order[self.offsets[lst]:self.offsets[lst+1]]
+            if len(members)==0:
+                continue
+            rows = probe_order[first:last]//num_probes
+            score = queries[rows] @ self.base[members].T
+            if exclude_self:
+                score[members[None,:]==rows[:,None]] = -np.inf
+            index = np.broadcast_to(members, score.shape)
+            best_index[rows], best_score[rows] = merge_top_k(best_index[rows], best_score[rows], index, score, k)
+        best_index[np.isneginf(best_score)] = -1
+        return sort_top_k(best_index, best_score)
+
+def knn_graph(embeddings, k, metric='cosine', index=None, symmetric=True, num_threads=mp.cpu_count()):
+    '''
+    Sparse kNN graph linking every row of embeddings to its k most similar
+    other rows, weighted by similarity; index: a fitted IVFIndex over
+    embeddings for approximate neighbors, exact search otherwise
+    RETURN scipy csr matrix, made symmetric by keeping the larger weight of
+    each pair, or its only weight when linked one way
+    '''
+    if index is None:
+        neighbors, score = top_k(embeddings, embeddings, k, metric, exclude_self=True, num_threads=num_threads)
+    else:
+        neighbors, score = index.search(None, k, exclude_self=True)
+    n = len(neighbors)
+    keep = neighbors.reshape(-1)>=0
+    u, v = np.repeat(np.arange(n), k)[keep], neighbors.reshape(-1)[keep]
+    weight = score.reshape(-1)[keep]
+    if symmetric:
+        # union of both directions: a pair found from one end only keeps its
+        # weight even when negative, one found from both keeps the larger
+        u, v, weight = np.r_[u, v], np.r_[v, u], np.r_[weight, weight]
+        order = np.lexsort((-weight, v, u))
+        u, v, weight = u[order], v[order], weight[order]
+        first = np.r_[True, (u[1:]!=u[:-1])|(v[1:]!=v[:-1])]
+        u, v, weight = u[first], v[first], weight[first]
+    return sp.csr_matrix((weight, (u, v)), shape=(n, n))
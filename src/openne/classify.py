@@ -5,18 +5,31 @@ from sklearn.metrics import f1_score, accuracy_score
 from sklearn.preprocessing import MultiLabelBinarizer
 from time import time
 
+from util.embedding_io import load_embedding_npy, load_word2vec_binary
+
+
+def top_k_indicator(scores, top_k_list):
+    """
+    0/1 matrix marking the top_k_list[i] highest scores of row i
+    """
+    scores = numpy.asarray(scores)
+    k = numpy.asarray(top_k_list, dtype=numpy.int64)
+    result = numpy.zeros(scores.shape)
+    k_max = min(int(k.max()), scores.shape[1]) if len(k) else 0
+    if k_max == 0:
+        return result
+    top = numpy.argpartition(-scores, k_max-1, axis=1)[:, :k_max]
+    order = numpy.argsort(-numpy.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    top = numpy.take_along_axis(top, order, axis=1)
+    rows, ranks = numpy.nonzero(numpy.arange(k_max) < k[:, None])
+    result[rows, top[rows, ranks]] = 1
+    return result
+
 
 class TopKRanker(OneVsRestClassifier):
     def predict(self, X, top_k_list):
         probs = numpy.asarray(super(TopKRanker, self).predict_proba(X))
-        all_labels = []
-        for i, k in enumerate(top_k_list):
-            probs_ = probs[i, :]
-            labels = self.classes_[probs_.argsort()[-k:]].tolist()
-            probs_[:] = 0
-            probs_[labels] = 1
-            all_labels.append(probs_)
-        return numpy.asarray(all_labels)
+        return top_k_indicator(probs, top_k_list)
 
 
 class Classifier(object):
@@ -73,6 +86,13 @@ class Classifier(object):
 
 
 def load_embeddings(filename):
+    # binary formats map the labels to rows of the loaded matrix
+    if filename.endswith('.npy'):
+        labels, matrix = load_embedding_npy(filename)
+        return dict(zip(labels.tolist(), matrix))
+    if filename.endswith('.bin'):
+        labels, matrix = load_word2vec_binary(filename, mmap_rows=True)
+        return dict(zip(labels.tolist(), matrix))
     fin = open(filename, 'r')
     node_num, size = [int(x) for x in fin.readline().strip().split()]
     vectors = {} 
@@ -11,8 +11,11 @@ setup(
         sources=[
             'necython/extension.pyx',
             'necython/cpp/aco.cpp',
+            'necython/cpp/alias.cpp',
+            'necython/cpp/coarsening.cpp',
             'necython/cpp/common.cpp',
             'necython/cpp/sampling.cpp',
+            'necython/cpp/skipgram.cpp',
             'necython/cpp/walker.cpp',
         ],
         extra_compile_args = ['-std=c++11'],
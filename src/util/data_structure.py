@@ -1,50 +1,41 @@
 #coding:utf-8
-from collections import defaultdict
 import heapq
 from pprint import pprint
 
+import numpy as np
+
+from necython import union_edges, find_root, component_labels
+
 class DisjoinSet(object):
+    '''
+    Union-find with union by rank and iterative path compression, parents
+    and ranks kept in numpy arrays and updated natively
+    '''
 
     def __init__(self, size):
         self.size = size
         self.num_components = size
-        self.arr = list(range(size))
-    
+        self.arr = np.arange(size, dtype=np.int32)
+        self.rank = np.zeros(size, dtype=np.uint8)
+
     def union(self, u, v):
-        u_root = self.find(u)
-        v_root = self.find(v)
-        if u_root!=v_root:
-            self.arr[u_root] = v_root
-            self.num_components -= 1
+        self.union_all([u], [v])
+
+    def union_all(self, u, v):
+        '''
+        union of every pair (u[i], v[i]) in one call
+        '''
+        self.num_components -= union_edges(self.arr, self.rank, u, v)
 
     def find(self, u):
-        if self.arr[u]==u:
-            return u
-        u_root = self.find(self.arr[u])
-        self.arr[u] = u_root
-        return u_root
-
-    # def make_clusters(self):
-    #     arr = list(map(self.find, self.arr))
-    #     clusters = []
-    #     added = set()
-    #     for index in arr:
-    #         if index in added:
-    #             continue
-    #         added.add(index)
-    #         clusters.append(index)
-    #     cluster_index = {cluster:index for index, cluster in enumerate(clusters)}
-    #     self.node_to_cluster = {node:cluster_index[cluster] for node, cluster in enumerate(arr)}
-    #     self.cluster_to_nodes = {cluster_index[cluster]:[] for cluster in clusters}
-    #     for node, cluster in enumerate(arr):
-    #         self.cluster_to_nodes[cluster_index[cluster]].append(node)
+        return find_root(self.arr, u)
 
     def make_mapping(self):
-        arr = list(map(self.find, self.arr))
-        mapping = defaultdict(list)
-        for node, cluster in enumerate(arr):
-            mapping[cluster].append(node)
-        return list(mapping.values())
+        '''
+        RETURN int32 component label of every node, numbered in order of
+        the smallest node of each component
+        '''
+        return component_labels(self.arr)
 
 class HuffmanTreeNode(object):
 
@@ -0,0 +1,91 @@
+#coding:utf-8
+'''
+Binary embedding formats, shared by netorch and openne
+'''
+import mmap
+import numpy as np
+
+def embedding_matrix(embeddings, labels=None):
+    '''
+    embeddings: {label: vector} dict, or a 2d array whose row i belongs to
+    labels[i] (default i)
+    RETURN (labels, matrix)
+    '''
+    if isinstance(embeddings, dict):
+        return list(embeddings.keys()), np.stack(list(embeddings.values()))
+    if labels is None:
+        labels = range(len(embeddings))
+    return list(labels), np.asarray(embeddings)
+
+def embedding_files(file_name):
+    '''
+    RETURN (matrix, label index) file names of a .npy embedding
+    '''
+    base = file_name[:-4] if file_name.endswith('.npy') else file_name
+    return base+'.npy', base+'.labels.npy'
+
+def save_embedding_npy(embeddings, file_name, labels=None):
+    '''
+    Save the matrix as raw .npy in its own dtype, with the labels of its
+    rows in a .labels.npy index next to it
+    '''
+    labels, matrix = embedding_matrix(embeddings, labels)
+    matrix_file, labels_file = embedding_files(file_name)
+    np.save(matrix_file, matrix)
+    np.save(labels_file, np.asarray([str(label) for label in labels]))
+
+def load_embedding_npy(file_name):
+    '''
+    RETURN (labels, matrix), both read-only np.memmap sharing the page cache
+    '''
+    matrix_file, labels_file = embedding_files(file_name)
+    return np.load(labels_file, mmap_mode='r'), np.load(matrix_file, mmap_mode='r')
+
+def save_word2vec_binary(embeddings, file_name, labels=None):
+    '''
+    Save in the binary format of the original word2vec tool, float32
+    '''
+    labels, matrix = embedding_matrix(embeddings, labels)
+    matrix = np.ascontiguousarray(matrix, dtype='<f4')
+    with open(file_name, 'wb') as file:
+        file.write('{} {}\n'.format(*matrix.shape).encode('utf-8'))
+        for label, row in zip(labels, matrix):
+            file.write(str(label).encode('utf-8')+b' '+row.tobytes()+b'\n')
+
+def load_word2vec_binary(file_name, mmap_rows=False):
+    '''
+    mmap_rows: return the rows as a read-only view of a memory map of the file,
+    possible when every label has the same byte length so that the rows
+    are evenly spaced; otherwise, and by default, the float32 rows are
+    copied out of the map without parsing any number
+    RETURN (labels, matrix) of a word2vec binary file
+    '''
+    with open(file_name, 'rb') as file:
+        num_nodes, dimension = map(int, file.readline().split())
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        pos = file.tell()
+    labels = []
+    offsets = np.empty(num_nodes, dtype=np.int64)
+    row_size = 4*dimension
+    with data:
+        # labels are found one by one, the rows may hold any byte
+        for i in range(num_nodes):
+            while data[pos] in b'\n ':
+                pos += 1
+            end = data.find(b' ', pos)
+            labels.append(data[pos:end].decode('utf-8'))
+            offsets[i] = end+1
+            pos = end+1+row_size
+
+        strides = np.diff(offsets)
+        if not mmap_rows or np.any(strides!=strides[:1]):
+            matrix = np.empty((num_nodes, dimension), dtype=np.float32)
+            for i in range(num_nodes):
+                matrix[i] = np.frombuffer(data, dtype='<f4', count=dimension, offset=offsets[i])
+            return np.asarray(labels), matrix
+
+    stride = int(strides[0]) if len(strides) else row_size
+    rows = np.memmap(file_name, dtype=np.uint8, mode='r')
+    matrix = np.ndarray((num_nodes, dimension), dtype='<f4', buffer=rows,
+        offset=int(offsets[0]) if num_nodes else 0, strides=(stride, 4))
+    return np.asarray(labels), matrix
@@ -5,17 +5,16 @@ def find_best_trade_off(arr):
     '''
     FOR DETAILS PLEASE REFER TO
     https://stackoverflow.com/questions/2018178/finding-the-best-trade-off-point-on-a-curve
+    RETURN index of the point of (i, arr[i]) farthest from the line through
+    the first and last points
     '''
+    arr = np.asarray(arr, dtype=np.float64)
     nPoints = len(arr)
-    allCoord = np.vstack((range(nPoints), arr)).T
-    np.array([range(nPoints), arr])
-    firstPoint = allCoord[0]
-    lineVec = allCoord[-1] - allCoord[0]
+    if nPoints < 3:
+        return 0
+    lineVec = np.array([nPoints-1, arr[-1]-arr[0]])
     lineVecNorm = lineVec / np.sqrt(np.sum(lineVec**2))
-    vecFromFirst = allCoord - firstPoint
-    scalarProduct = np.sum(vecFromFirst * np.matlib.repmat(lineVecNorm, nPoints, 1), axis=1)
-    vecFromFirstParallel = np.outer(scalarProduct, lineVecNorm)
-    vecToLine = vecFromFirst - vecFromFirstParallel
-    distToLine = np.sqrt(np.sum(vecToLine ** 2, axis=1))
+    # distance to the line is the cross product with its unit direction
+    distToLine = np.abs(np.arange(nPoints)*lineVecNorm[1] - (arr-arr[0])*lineVecNorm[0])
     idxOfBestPoint = np.argmax(distToLine)
-    return idxOfBestPoint
\ No newline at end of file
+    return idxOfBestPoint